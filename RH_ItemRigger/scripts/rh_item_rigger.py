@@ -8,6 +8,8 @@ License: GNU General Public License v3.0
 
 import os
 import re
+import collections
+import time
 import traceback
 
 import maya
@@ -63,6 +65,19 @@ MAYA2017 = 201900
 # SET YOUR PROJECT ART PATH HERE
 PROJECT_ART_PATH = 'D:/Project/Art/'
 
+# Maximum number of mayapy processes used for background attachment exports
+EXPORT_WORKER_COUNT = 4
+
+# Milliseconds to wait for an export worker process to start
+EXPORT_WORKER_START_TIMEOUT = 30000
+
+# Minimum seconds between export output refreshes
+EXPORT_LOG_FRAME_BUDGET = 1.0 / 15.0
+
+# Create new items by importing the cached rig template instead of building the rig node by node,
+# the first item built without a template blocks while mayapy writes the template
+USE_RIG_TEMPLATE = False
+
 
 '''
 VERSION 0.5
@@ -154,6 +169,170 @@ class ClickableLabel(QAbstractButton):
 		self.clicked.emit(self.objectName())
 	
 
+class ExportLog(object):
+	"""
+	Append only export log, entries are rendered incrementally into the export output.
+	UI refreshes are throttled to a frame budget so long exports do not re-layout the output every step.
+	Events are only pumped while maya is busy exporting, never while the log is fed from qt slots,
+	(the export workers), where pumping would re-enter the slots.
+	"""
+
+	LEVEL_COLORS = {'success':(120, 200, 120), 'warning':(230, 180, 80), 'error':(235, 95, 95)}
+
+	def __init__(self, output=None, progress=None, frame_budget=EXPORT_LOG_FRAME_BUDGET):
+		self.output = output
+		self.progress = progress
+		self.frame_budget = frame_budget
+		self.entries = []
+		self.num_rendered = 0
+		self.progress_value = 0
+		self.last_refresh = 0.0
+		self.pump_events = True
+
+	def add(self, message, level='info', item=None, duration=None):
+		entry = {'level':level, 'item':item, 'message':message, 'duration':duration, 'time':time.time()}
+		self.entries.append(entry)
+		self.refresh()
+		return entry
+
+	def add_result(self, message, start_entry, level='success'):
+		return self.add(message, level=level, item=start_entry['item'], duration=time.time() - start_entry['time'])
+
+	def set_progress(self, value):
+		self.progress_value = value
+		self.refresh()
+
+	def format_entry(self, entry):
+		if entry['duration'] is None:
+			return entry['message']
+		return '  {0} ({1:.2f}s)'.format(entry['message'], entry['duration'])
+
+	def get_entries(self, levels=None, item=None):
+		return [entry for entry in self.entries if (levels is None or entry['level'] in levels) and (item is None or entry['item'] == item)]
+
+	def get_text(self, levels=None):
+		return '\n'.join([self.format_entry(entry) for entry in self.get_entries(levels=levels)])
+
+	def clear(self):
+		self.entries = []
+		self.num_rendered = 0
+		self.progress_value = 0
+		self.last_refresh = 0.0
+		if self.output:
+			self.output.clear()
+
+	def refresh(self, force=False):
+		now = time.time()
+		if not force and now - self.last_refresh < self.frame_budget:
+			return False
+		self.last_refresh = now
+
+		# only the new entries are inserted, the existing text is not laid out again
+		if self.output and self.num_rendered < len(self.entries):
+			cursor = QTextCursor(self.output.document())
+			cursor.movePosition(QTextCursor.End)
+			for entry in self.entries[self.num_rendered:]:
+				text_format = QTextCharFormat()
+				color = self.LEVEL_COLORS.get(entry['level'])
+				if color:
+					text_format.setForeground(QColor(*color))
+				cursor.insertText(self.format_entry(entry) + '\n', text_format)
+			self.num_rendered = len(self.entries)
+			scroll_bar = self.output.verticalScrollBar()
+			scroll_bar.setValue(scroll_bar.maximum())
+
+		if self.progress:
+			self.progress.setValue(self.progress_value)
+
+		# let the ui paint while maya is busy exporting, user input waits until the export is done
+		if self.pump_events:
+			QCoreApplication.processEvents(QEventLoop.ExcludeUserInputEvents)
+		return True
+
+
+class BoneItemDelegate(QStyledItemDelegate):
+	"""
+	Edit a table cell with a combo box of bone names, the editor only exists while the cell is edited
+	"""
+
+	def __init__(self, bone_names, parent=None):
+		super(BoneItemDelegate, self).__init__(parent)
+		self.bone_names = bone_names
+
+	def createEditor(self, parent, option, index):
+		editor = QComboBox(parent)
+		editor.addItems(self.bone_names)
+		return editor
+
+	def setEditorData(self, editor, index):
+		editor.setCurrentIndex(max(editor.findText(index.data()), 0))
+
+	def setModelData(self, editor, model, index):
+		model.setData(index, editor.currentText())
+
+
+class AutoAssignDialog(QDialog):
+	"""
+	Table of proposed bones for unassigned meshes.
+	Any bone can be changed and rows can be unchecked before everything is assigned at once.
+	"""
+
+	def __init__(self, proposals, bones, parent=None):
+		super(AutoAssignDialog, self).__init__(parent)
+		self.setWindowTitle('Item Rigger: Auto Assign Meshes')
+		self.bones = dict([(bone.split('|')[-1], bone) for bone in bones])
+		bone_names = sorted(self.bones.keys(), key=rh_maya.get_index_name_key)
+
+		self.table = QTableWidget(len(proposals), 4)
+		self.table.setHorizontalHeaderLabels(['Mesh', 'Bone', 'Distance', 'Hint'])
+		self.table.setAlternatingRowColors(True)
+		self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+		self.table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked)
+		self.table.setItemDelegateForColumn(1, BoneItemDelegate(bone_names, self.table))
+
+		self.table.setUpdatesEnabled(False)
+		for row, proposal in enumerate(proposals):
+			mesh_item = QTableWidgetItem(proposal['mesh'].split('|')[-1])
+			mesh_item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable)
+			mesh_item.setCheckState(Qt.Checked if proposal['bone'] else Qt.Unchecked)
+			mesh_item.setData(Qt.UserRole, proposal['mesh'])
+			mesh_item.setToolTip(proposal['mesh'])
+			self.table.setItem(row, 0, mesh_item)
+
+			bone_name = proposal['bone'].split('|')[-1] if proposal['bone'] else ''
+			self.table.setItem(row, 1, QTableWidgetItem(bone_name))
+
+			for column, text in [(2, '{0:.2f}'.format(proposal['distance'])), (3, proposal['hint'])]:
+				item = QTableWidgetItem(text)
+				item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
+				self.table.setItem(row, column, item)
+		self.table.resizeColumnsToContents()
+		self.table.setUpdatesEnabled(True)
+
+		buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+		buttons.button(QDialogButtonBox.Ok).setText('Assign')
+		buttons.accepted.connect(self.accept)
+		buttons.rejected.connect(self.reject)
+
+		layout = QVBoxLayout()
+		layout.addWidget(QLabel('Double click a bone to change it, uncheck meshes to leave them unassigned.'))
+		layout.addWidget(self.table)
+		layout.addWidget(buttons)
+		self.setLayout(layout)
+		self.resize(520, 480)
+
+	def get_assignments(self):
+		assignments = collections.OrderedDict()
+		for row in xrange(self.table.rowCount()):
+			mesh_item = self.table.item(row, 0)
+			if not mesh_item.checkState() == Qt.Checked:
+				continue
+			bone = self.bones.get(self.table.item(row, 1).text())
+			if bone:
+				assignments[mesh_item.data(Qt.UserRole)] = bone
+		return assignments
+
+
 class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 	toolName = WINDOW_TITLE
 
@@ -465,14 +644,24 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.item_node = None
 		self.item_base_mesh = None
 		self.item_mesh_group = None
+		self.item_mesh_shape_count = None
+		self.item_mesh_shape_node = None
 		self.item_material_groups = None
+		self.item_material_group_lookup = {}
+		self.material_index_allocator = None
 		self.item_materials = None
+		self.item_material_signatures = {}
+		self.item_material_lookup = {}
 		self.item_type = 'Weapon'		
 		self.item_type_attr = 'rh_item'
 		self.unassigned_group = None
 		self.item_material_group_meshes = []
 		self.item_meshes = []
+		self.edit_session_history = None
 		self.item_bones = []
+		self.item_bone_table = None
+		self.item_bone_set = set()
+		self.bone_index_allocator = None
 		self.item_controls = []
 		self.all_item_nodes = []
 		self.unassigned_objects = []
@@ -508,8 +697,8 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		# store ui name lists
 		self.add_bone_combo_names = []
 		self.parent_ctrl_add_control_names = []
-		self.item_base_ctrls = ['weapon_root_anim', 'weapon_root_pivot_offset_anim', 'weapon_root_pivot_anim']
-		self.vehicle_base_ctrls = ['main_anim', 'ground_anim', 'frame_anim','anim_root_pivot_offset_anim','anim_root_pivot_anim']
+		self.item_base_ctrls = rh_maya.get_item_rig_spec('Weapon')['base_controls']
+		self.vehicle_base_ctrls = rh_maya.get_item_rig_spec('Vehicle')['base_controls']
 
 		# color picked combo boxes
 		self.parent_ctrl_picked = False
@@ -520,6 +709,12 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		self.can_export = True
 		self.export_error_message = ''
+		self.export_findings = []
+		self.lint_cache = {}
+
+		# background attachment export workers
+		self.export_workers = {}
+		self.export_worker_state = {}
 
 
 	def resizeEvent( self, event):
@@ -637,9 +832,13 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.export_pushButton.pressed.connect(lambda:self.on_pressed_export_item())		
 		self.export_pushButton.setToolTip('Export the item')	
 
+		self.export_background_checkBox = QCheckBox('Export Attachments in Background')
+		self.export_background_checkBox.setToolTip('Export attachments with background mayapy workers from a snapshot of the scene.\nMaya stays interactive while the attachments export.')
+
 		# Buttons
 		buttons_box = QGridLayout()
 		buttons_box.addWidget(self.export_pushButton, 0, 0)		
+		buttons_box.addWidget(self.export_background_checkBox, 1, 0)
 
 		# vbox		
 		left_v_box = QVBoxLayout()
@@ -672,6 +871,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.export_output.setGeometry(200,300,250,300)	
 		output_box = QGridLayout()
 		output_box.addWidget(self.export_output, 0, 0)	
+		self.export_log_model = ExportLog(self.export_output, self.export_progress)
 
 		# setup the hbox layout
 		self.export_vbox = QVBoxLayout()
@@ -994,7 +1194,8 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.add_ctrl_combo.setStyleSheet('''QComboBox {color: black; background-color: grey }''')	
 		
 		# populate the item bones comboBox
-		controls = ['circleX','square','cube','sphere','arrow','cross','orient']				
+		controls = ['circleX','square','cube','sphere','arrow','cross','orient']
+		controls += [name for name in rh_maya.get_control_shape_names() if not name in controls]
 		string_list = QStringListModel()
 		string_list.setStringList(controls)
 		self.add_ctrl_combo.setModel(string_list)			
@@ -1134,7 +1335,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		# ListView
 		self.listView = QListWidget()
-		self.listView.SingleSelection
+		self.listView.setSelectionMode(QAbstractItemView.ExtendedSelection)
 		self.listView.setEditTriggers(QAbstractItemView.NoEditTriggers)
 		#sizePolicy = QSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum)
 		#sizePolicy.setHorizontalStretch(0)
@@ -1169,12 +1370,33 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.delete_mesh_pushButton.setObjectName("pb_del_unassigned")
 		self.delete_mesh_pushButton.pressed.connect(lambda:self.on_pressed_del_unassigned())		
 
+		self.assign_bone_pushButton = QPushButton('Assign To Bone')
+		self.assign_bone_pushButton.setFixedSize( 100, 25 )		
+		self.assign_bone_pushButton.setObjectName("pb_assign_unassigned")
+		self.assign_bone_pushButton.setToolTip('Add the selected meshes to the item, skinned to the current Add Bone')
+		self.assign_bone_pushButton.pressed.connect(lambda:self.on_pressed_assign_unassigned(new_bones=False))
+
+		self.assign_new_bones_pushButton = QPushButton('Assign New Bones')
+		self.assign_new_bones_pushButton.setFixedSize( 100, 25 )		
+		self.assign_new_bones_pushButton.setObjectName("pb_assign_unassigned_bones")
+		self.assign_new_bones_pushButton.setToolTip('Add the selected meshes to the item, each with a new bone and control under the current Parent Control')
+		self.assign_new_bones_pushButton.pressed.connect(lambda:self.on_pressed_assign_unassigned(new_bones=True))
+
+		self.auto_assign_pushButton = QPushButton('Auto Assign')
+		self.auto_assign_pushButton.setFixedSize( 100, 25 )		
+		self.auto_assign_pushButton.setObjectName("pb_auto_assign_unassigned")
+		self.auto_assign_pushButton.setToolTip('Propose the nearest item bone for the selected, or all, unassigned meshes')
+		self.auto_assign_pushButton.pressed.connect(lambda:self.on_pressed_auto_assign_unassigned())
+
 		# Buttons
 		self.unassigned_buttons_box = QGridLayout()
 		#self.unassigned_buttons_box.setSpacing(1)
 		self.unassigned_buttons_box.setHorizontalSpacing(20)		
 		self.unassigned_buttons_box.addWidget(self.select_mesh_pushButton, 0, 0)
 		self.unassigned_buttons_box.addWidget(self.delete_mesh_pushButton, 0, 1)				
+		self.unassigned_buttons_box.addWidget(self.assign_bone_pushButton, 1, 0)
+		self.unassigned_buttons_box.addWidget(self.assign_new_bones_pushButton, 1, 1)
+		self.unassigned_buttons_box.addWidget(self.auto_assign_pushButton, 2, 0)
 
 		# Vertical Layout
 		self.unassigned_vbox = QVBoxLayout()
@@ -1927,70 +2149,25 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 10/30/2014 9:33:46 AM
 		"""
 
-		error_msg = ''
-		
-		# make sure there are no namespaces in the scene
-		namespaces = rh_maya.get_scene_namespaces()
-		if namespaces:
-			error_string = ' \n'.join(namespaces)
-			error_string += '\n'
-			error_msg += 'NAMESPACES:\nThere are namespaces found in your scene.\nYou must get rid of all namespaces before continuing.\n {0}\n'.format(error_string)			
-			maya.mel.eval('NamespaceEditor;')
-			
-		# make sure there are no duplicate node names in the scene
-		dupe_names, error = self.check_duplicate_names()
-		if dupe_names:
-			error_msg += error		
+		context = {'item_type':self.item_type,
+		           'project_art_path':PROJECT_ART_PATH,
+		           'validate_meshes':self.validate_item_meshes,
+		           'item_meshes':[str(mesh) for mesh in self.item_meshes or []]}
+		findings = rh_maya.run_lint_rules(context=context, cache=self.lint_cache)
+		self.export_findings = findings
 
-		# make sure there are no unassigned objects
-		#if self.unassigned_objects:
-			#error_msg += 'UNASSIGNED OBJECTS:\nThere are unassigned objects in the scene.\nPlease clear these out before exporting.' + '\n'
-			
-		if self.item_type == 'Weapon':
-			item_path = os.path.join(PROJECT_ART_PATH, 'Weapons').lower().replace('\\','/')
-		else:
-			item_path = os.path.join(PROJECT_ART_PATH, 'Vehicles').lower().replace('\\','/')
-
-		# make sure the file is saved in the depot
-		filename = cmds.file(q=True, sceneName=True)
-		filename_error = False
-		if not filename:
-			error_msg += '\nFILENAME:\nThis file has not been saved in the depot project art path.\nPlease save file under {0}\n'.format(item_path)
-			filename_error = True
-		else:
-			if not '/rig/' in filename.lower():
-				print filename
-				error_msg += 'The item rig file must be saved in a rig subfolder.\nPlease save file under {0}\n'.format(item_path + '/itemName/rig/itemName_rig.ma')				
+		# open the editors that help fix the errors
+		errors = rh_maya.get_lint_errors(findings)
+		for editor in set([finding['editor'] for finding in errors if finding['editor']]):
+			maya.mel.eval('{0};'.format(editor))
 
-		if not filename_error:			
-			if not filename.lower().startswith(item_path):
-				error_msg += 'This file is not saved in the depot project art path.\nPlease save file under {0}\n'.format(item_path)
+		self.duplicate_names = []
+		for finding in findings:
+			if finding['rule'] == 'duplicate_names':
+				self.duplicate_names.extend(finding['nodes'])
 
-		# make sure there is a item node and a base mesh
-		if not self.item_node:
-			error_msg += '\nNO ITEM:\nThere is not yet a rigged item to export.\n'
-		else:
-			if not self.item_base_mesh:
-				error_msg += '\nNO ITEM:\nThere is not yet a rigged item base mesh to export.\n'
-
-		# make sure all textures are valid
-		textures_are_valid = True
-		#textures_are_valid, error_string = validate_scene_textures()
-		if not textures_are_valid:
-			error_msg += '\nBAD TEXTURES:\nThere are textures not mapped relative to the K:\ drive.\nPlease fix or delete the texture references:\n{0}\n'.format(error_string)
-			maya.mel.eval('FilePathEditor;')
-
-		# make sure meshes are valid
-		valid, mesh_errors = self.validate_item_meshes()
-		if not valid:
-			error_msg += mesh_errors + '\n'
-
-		if error_msg:
-			self.export_error_message = error_msg
-			self.can_export = False
-		else:
-			self.export_error_message = ''
-			self.can_export = True
+		self.export_error_message = rh_maya.format_lint_findings(findings)
+		self.can_export = not errors
 			
 			
 	def do_add_mesh_attributes(self, mesh, bone=None, control=None, material_group=None, is_attachment=False, is_static=False):
@@ -2135,7 +2312,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.tw_meshes.blockSignals(False)
 			
 
-	def do_export_attachments(self, step_value, progress_value, export_log, export_text, exported_files):
+	def do_export_attachments(self, step_value, progress_value, export_log, exported_files, manifest=None):
 		"""
 		Handle exporting attachments
 		
@@ -2152,87 +2329,45 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 11/9/2014 10:18:08 AM
 		"""
 		
-		# update material names for export
-		temp_group = pymel.PyNode('TEMP_Attachments')
-	
-		# export each attachment separately
+		# export each attachment separately, the rig hierarchy is left untouched
 		export_log += '\nExporting Attachments: \n'
+		skin_map = rh_maya.get_skin_influence_map(meshes=self.item_attachments)
 		for mesh in self.item_attachments:
 			
 			do_export = True
-			
-			# create a custom group for the mesh
-			pymel.select(cl=True)
-			mesh_group = pymel.group(n='TEMP')	
-			pymel.parent(mesh_group, self.item_node)
-			pymel.parent(mesh, mesh_group)
 			item_export_file = os.path.join(self.get_item_export_path(), self.item_name + "_" + mesh.nodeName()) + '.fbx'
 	
 			# update progress bar
 			progress_value += step_value
-			self.export_progress.setValue(progress_value)
-			export_text += 'Exporting Attachment:  {0}\n'.format(mesh.nodeName())
-			self.export_output.setText(export_text)					
-			export_text += ' ...'
-			self.export_output.setText(export_text)
+			self.export_log_model.set_progress(progress_value)
+			start_entry = self.export_log_model.add('Exporting Attachment:  {0}'.format(mesh.nodeName()), item=mesh.nodeName())
 			
 			# handle static mesh			
 			is_static_mesh = self.get_attribute_value(mesh, 'rh_static_mesh')
 			if is_static_mesh == None:
 				is_static_mesh = False
-			export_mesh = None
-			export_group = None
+			bone = None
 			if is_static_mesh:
-				export_mesh = pymel.duplicate(mesh)[0]
-				pymel.lockNode(export_mesh, lock=False)
-				rh_maya.lock_channels(export_mesh, lock=False)
-				bone = self.get_attribute_value(mesh, 'rh_bone')
-				if not bone:					
-					influences = rh_maya.get_skincluster_influences(mesh)
-					if influences:
-						if len(influences) > 1:
-							print 'WARNING: There is more than one bone with influence for this attachment.\n{0}'.format(mesh.nodeName())
-						bone = influences[0]
+				bone = self.get_attachment_bone(mesh, skin_map=skin_map)
 
 				# Fail if we didnt find an attachment bone				
 				if not bone:
-					export_text += 'FAILED to find a primary bone influence for this attachment!\n'
-					self.export_output.setText(export_text)
-					export_log += ' FAILED Exporting: {0}'.format(export_text)
+					error = 'FAILED to find a primary bone influence for this attachment!'
+					self.export_log_model.add_result(error, start_entry, level='error')
+					export_log += ' FAILED Exporting: {0}\n {1}\n'.format(mesh.nodeName(), error)
 					do_export = False
-				else:
-					pymel.select(cl=True)
-					
-					# create and snap a new group to the bone
-					export_group = pymel.group(empty=True, n='MESH_' + mesh.nodeName())
-					const = pymel.parentConstraint(bone, export_group, mo=False)
-					pymel.delete(const)										
-					pymel.parent(export_mesh, export_group)
-					
-					# move the group to the origin
-					export_group.setAttr('translateX', 0.0)
-					export_group.setAttr('translateY', 0.0)
-					export_group.setAttr('translateZ', 0.0)
-					
-					# reset transform on the export mesh
-					pymel.select(export_group, r=True)
-					cmds.makeIdentity( apply=True, translate=True, rotate=True, scale=True, n=False )
-					pymel.select(export_mesh)
-					pymel.mel.eval("ResetTransformations;")
 			
 			if do_export:				
 				if item_export_file:	
 					did_export = False
 					try:
-						if export_mesh:
-							did_export, did_export_string = rh_maya.export_weapon_part(export_mesh, export_group, weapon_export_file=item_export_file, is_static_mesh=is_static_mesh)
+						did_export, did_export_string = rh_maya.export_attachment(mesh, item_export_file, bone=bone, is_static_mesh=is_static_mesh, manifest=manifest, skin_map=skin_map)
+						if did_export:
+							self.export_log_model.add_result('Export Successful', start_entry)
 						else:
-							did_export, did_export_string = rh_maya.export_weapon_part(mesh, mesh_group, weapon_export_file=item_export_file, is_static_mesh=is_static_mesh)
-						export_text += ' Export Successful\n'
-						self.export_output.setText(export_text)							
+							self.export_log_model.add_result('Export Failed\n{0}'.format(did_export_string.strip()), start_entry, level='error')
 					except:
-						export_text += ' Export Failed\n'
-						self.export_output.setText(export_text)								
+						self.export_log_model.add_result('Export Failed', start_entry, level='error')
 						tb = traceback.format_exc()
 						export_log = 'Attachment Export Failed:\nCallstack from Main Export Crash:\nCopy this and send to your technical animator for debugging!\n\n{0}\n\nSee output for more details.'.format(tb)
 		
@@ -2245,17 +2380,263 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 				else:
 					error = 'Couldnt generate an export file for this attachment: {0}\n'.format(mesh.nodeName())
 					export_log += ' FAILED Exporting: {0}'.format(error)
-			
-			# clean up new export mesh and group
-			if export_group:
-				pymel.delete(export_group)	
 	
-			pymel.parent(mesh, temp_group)
-			pymel.delete(mesh_group)
-	
-		return export_log, export_text, exported_files	
+		return export_log, exported_files	
 	
 
+	def get_attachment_bone(self, mesh, skin_map=None):
+		"""
+		Get the primary bone of an attachment mesh
+
+		*Arguments:*
+			* ``mesh`` Attachment mesh
+
+		*Keyword Arguments:*
+			* ``skin_map`` Shared result of rh_maya.get_skin_influence_map
+
+		*Returns:*
+			* ``bone`` Bone PyNode or None
+		"""
+
+		bone = self.get_attribute_value(mesh, 'rh_bone')
+		if not bone:					
+			if skin_map is None or not mesh.longName() in skin_map:
+				skin_map = rh_maya.get_skin_influence_map(meshes=[mesh])
+			skin_info = skin_map.get(mesh.longName())
+			if skin_info and skin_info['influences']:
+				if len(skin_info['influences']) > 1:
+					print 'WARNING: There is more than one bone with influence for this attachment.\n{0}'.format(mesh.nodeName())
+				bone = pymel.PyNode(skin_info['influences'][0])
+		return bone
+
+
+	def do_export_attachments_background(self, step_value, progress_value, export_log, manifest=None):
+		"""
+		Export the attachments with background mayapy workers.
+		The scene is written to a snapshot once and the attachments are split across the workers,
+		results stream back into the export progress and output as each attachment finishes.
+
+		*Arguments:*
+			* ``step_value``     Progress per attachment
+			* ``progress_value`` Current progress
+			* ``export_log``     Current export log
+
+		*Keyword Arguments:*
+			* ``manifest`` Export manifest the worker results are added to
+
+		*Returns:*
+			* ``Bool`` True if the workers were started and will finish the export
+		"""
+
+		mayapy = rh_maya.get_mayapy_path()
+		if not mayapy:
+			cmds.warning('mayapy was not found, exporting the attachments in the current session.')
+			return False
+
+		export_log += '\nExporting Attachments: \n'
+		jobs = []
+		skin_map = rh_maya.get_skin_influence_map(meshes=self.item_attachments)
+		for mesh in self.item_attachments:
+			item_export_file = os.path.join(self.get_item_export_path(), self.item_name + "_" + mesh.nodeName()) + '.fbx'
+			is_static_mesh = self.get_attribute_value(mesh, 'rh_static_mesh')
+			if is_static_mesh == None:
+				is_static_mesh = False
+			bone = None
+			if is_static_mesh:
+				bone = self.get_attachment_bone(mesh, skin_map=skin_map)
+				if not bone:
+					progress_value += step_value
+					self.export_log_model.add('Exporting Attachment:  {0}'.format(mesh.nodeName()), item=mesh.nodeName())
+					self.export_log_model.add('FAILED to find a primary bone influence for this attachment!', level='error', item=mesh.nodeName(), duration=0.0)
+					export_log += 'FAILED Exporting: {0}\n'.format(item_export_file)
+					continue
+				bone = bone.longName()
+			jobs.append({'mesh':mesh.longName(), 'file':item_export_file, 'bone':bone, 'static':bool(is_static_mesh)})
+
+		self.export_log_model.add('Saving Scene Snapshot...')
+		self.export_log_model.set_progress(progress_value)
+		if not jobs:
+			self.finish_export_item(True, export_log, manifest=manifest)
+			return True
+		snapshot_file = rh_maya.save_export_snapshot()
+		job_files = rh_maya.write_attachment_worker_jobs(snapshot_file, jobs, worker_count=EXPORT_WORKER_COUNT)
+
+		self.export_worker_state = {'step':step_value, 'progress':progress_value, 'log':export_log, 'snapshot':snapshot_file, 'manifest':manifest, 'start_time':time.time()}
+		self.export_workers = {}
+		for index, job_file in enumerate(job_files):
+			process = QProcess(self)
+			process.readyReadStandardOutput.connect(partial(self.on_export_worker_output, job_file))
+			process.finished.connect(partial(self.on_export_worker_finished, job_file))
+			# a process that fails to start only emits the error signal, (errorOccurred in newer Qt)
+			error_signal = getattr(process, 'errorOccurred', None) or process.error
+			error_signal.connect(partial(self.on_export_worker_error, job_file))
+			self.export_workers[job_file] = {'process':process, 'buffer':'', 'reading':False, 'error':None, 'pending':[job['mesh'] for job in jobs[index::len(job_files)]]}
+			process.start(mayapy, rh_maya.get_attachment_worker_args(job_file))
+			if not process.waitForStarted(EXPORT_WORKER_START_TIMEOUT):
+				self.on_export_worker_error(job_file, QProcess.FailedToStart)
+
+		self.export_log_model.add('Exporting {0} Attachments with {1} Workers...'.format(len(jobs), len(job_files)))
+		self.export_log_model.refresh(force=True)
+
+		# the log is fed from the worker slots from here on, qt paints between the slots
+		self.export_log_model.pump_events = False
+		self.export_pushButton.setDisabled(True)
+		return True
+
+
+	def on_export_worker_output(self, job_file):
+		"""
+		Read attachment results streamed from an export worker
+
+		*Arguments:*
+			* ``job_file`` Job file of the worker
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		worker = self.export_workers.get(job_file)
+		if not worker or worker['reading']:
+			return
+
+		# results can arrive split across reads, keep the partial line for the next read
+		worker['reading'] = True
+		try:
+			lines = (worker['buffer'] + worker['process'].readAllStandardOutput().data()).split('\n')
+			worker['buffer'] = lines.pop()
+			for line in lines:
+				result = rh_maya.parse_attachment_worker_output(line)
+				if result:
+					self.do_export_worker_result(worker, result)
+		finally:
+			worker['reading'] = False
+
+
+	def do_export_worker_result(self, worker, result):
+		"""
+		Add an attachment result from an export worker to the export progress and log
+
+		*Arguments:*
+			* ``worker`` Worker dict
+			* ``result`` Result dict from the worker
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		state = self.export_worker_state
+		if not state or not result['mesh'] in worker['pending']:
+			return
+		worker['pending'].remove(result['mesh'])
+
+		# workers report when an attachment is done, time it from the start of the worker export
+		mesh_name = result['mesh'].split('|')[-1]
+		duration = time.time() - state['start_time']
+		state['progress'] += state['step']
+		self.export_log_model.add('Exporting Attachment:  {0}'.format(mesh_name), item=mesh_name)
+		if result['success']:
+			self.export_log_model.add('Export Successful', level='success', item=mesh_name, duration=duration)
+			state['log'] += '{0}\n'.format(result['file'])
+			if state['manifest'] is not None and result.get('manifest'):
+				state['manifest']['files'].append(result['manifest'])
+		else:
+			self.export_log_model.add('Export Failed\n{0}'.format(result['message'].strip()), level='error', item=mesh_name, duration=duration)
+			state['log'] += 'FAILED Exporting: {0}\n'.format(result['file'])
+
+		self.export_log_model.set_progress(state['progress'])
+
+
+	def on_export_worker_error(self, job_file, error=None):
+		"""
+		Handle an export worker process error, a worker that failed to start is finished here
+		since it never emits finished
+
+		*Arguments:*
+			* ``job_file`` Job file of the worker
+
+		*Keyword Arguments:*
+			* ``error`` QProcess.ProcessError
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		worker = self.export_workers.get(job_file)
+		if not worker:
+			return
+
+		worker['error'] = 'The export worker failed: {0}'.format(worker['process'].errorString())
+		if error == QProcess.FailedToStart:
+			self.on_export_worker_finished(job_file)
+
+
+	def on_export_worker_finished(self, job_file, *args):
+		"""
+		Handle an export worker exiting, finish the export once every worker is done
+
+		*Arguments:*
+			* ``job_file`` Job file of the worker
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		worker = self.export_workers.get(job_file)
+		if not worker:
+			return
+
+		# the worker output is still being read, handle the exit once that is done
+		if worker['reading']:
+			QTimer.singleShot(0, partial(self.on_export_worker_finished, job_file))
+			return
+
+		# read anything left and fail the attachments the worker never reported
+		self.on_export_worker_output(job_file)
+		message = worker['error'] or 'The export worker exited before exporting this attachment.'
+		for mesh in list(worker['pending']):
+			self.do_export_worker_result(worker, {'mesh':mesh, 'file':mesh.split('|')[-1], 'success':False, 'message':message})
+		worker['process'].deleteLater()
+		del self.export_workers[job_file]
+
+		# finishing shows a modal dialog, leave the worker slot first
+		if not self.export_workers:
+			QTimer.singleShot(0, self.finish_export_workers)
+
+
+	def finish_export_workers(self):
+		"""
+		Finish the export once every export worker is done
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		state = self.export_worker_state
+		if not state or self.export_workers:
+			return
+
+		self.export_worker_state = {}
+		self.export_log_model.pump_events = True
+		rh_maya.remove_export_snapshot(state['snapshot'])
+		self.finish_export_item(True, state['log'], manifest=state['manifest'])
+
+
+	@rh_maya.undo_step('Item Rigger: Export Item')
 	def on_pressed_export_item(self):
 		"""
 		Export the item
@@ -2276,34 +2657,26 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		pymel.select(cl=True)
 		exported_files = []
 		export_string = ''
+		manifest = rh_maya.new_export_manifest(item_name=self.item_name, item_type=self.item_type)
 
 		# Show the progress bar
 		self.export_progress.setValue(0)
 		self.export_progress.setVisible(True)
 		self.export_output.setVisible(True)
 		self.export_groupbox.setMinimumSize(QSize(323, 300))
+		self.export_pushButton.setDisabled(True)
 		
-		export_text = 'Preparing Item Export...\n\n'
-		self.export_output.setText(export_text)		
+		self.export_log_model.clear()
+		self.export_log_model.add('Preparing Item Export...\n')
+		self.export_log_model.refresh(force=True)
 		
-		temp_group = None
 		export_attachments = False
 		if self.item_attachments:	
 			
 			# ask the user to export attachments
-			pymel.select(cl=True)
-			temp_group = pymel.group(n='TEMP_Attachments')
-			pymel.lockNode(self.item_node, lock=False)
-			pymel.parent(temp_group, self.item_node)
-			
-			# move the attachments to separate groups
 			attachment_string = ''
 			for mesh in self.item_attachments:
-				pymel.lockNode(mesh, lock=False)
-				pymel.parent(mesh, temp_group)
 				attachment_string += '  {0}\n'.format(mesh.nodeName())
-				
-			cmds.refresh()		
 			
 			query_txt = 'Would you like to also export each of the attachments?\n\nAttachments:\n{0}\n'.format(attachment_string)
 			result = cmds.confirmDialog( title='Item Rigger: Export Attachments', message=query_txt, button=[ 'Yes', 'No' ], defaultButton='No', cancelButton='No',dismissString='No' )
@@ -2316,64 +2689,74 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		progress_value = 0
 		step_value = (100/ (len(self.item_attachments) + 2) )
 
-		export_text += 'Exporting Item: {0}\n'.format(self.item_name)
-		self.export_output.setText(export_text)
-		export_text += ' ...'
-		self.export_output.setText(export_text)
+		start_entry = self.export_log_model.add('Exporting Item: {0}'.format(self.item_name), item=self.item_name)
+		self.export_log_model.refresh(force=True)
 		did_export = False
 		try:
-			did_export, export_log = rh_maya.export_weapon_prep(quiet=True, item_type=self.item_type)
+			did_export, export_log = rh_maya.export_weapon_prep(quiet=True, item_type=self.item_type, exclude=self.item_attachments, manifest=manifest)
 			if did_export:
-				export_text += ' Export Successful\n'
-				self.export_output.setText(export_text)
+				self.export_log_model.add_result('Export Successful', start_entry)
 		except:
-			export_text += ' Export Failed\n'
-			self.export_output.setText(export_text)
+			self.export_log_model.add_result('Export Failed', start_entry, level='error')
 			tb = traceback.format_exc()			
 			export_log = 'Item Export Failed:\nCallstack from Main Export Crash:\nCopy this and send to your technical animator for debugging!\n\n{0}\n\nSee output for more details.'.format(tb)
 		
 		progress_value += step_value
-		self.export_progress.setValue(progress_value)	
+		self.export_log_model.set_progress(progress_value)
 		
 		# export the item parts
 		if did_export:
 			if export_attachments:				
-				export_log, export_text, exported_files = self.do_export_attachments(step_value, progress_value, export_log, export_text, exported_files)
+				if self.export_background_checkBox.isChecked():
+					# the workers finish the export when they are done
+					if self.do_export_attachments_background(step_value, progress_value, export_log, manifest=manifest):
+						return
+				export_log, exported_files = self.do_export_attachments(step_value, progress_value, export_log, exported_files, manifest=manifest)
 			
 		pymel.refresh(force=True)
-		
-		# move the attachment back to their original groups
-		export_text += '\nCleaning Up...\n'
-		self.export_output.setText(export_text)
-		if self.item_attachments:
-			for mesh in self.item_attachments:				
-				parent = self.get_attribute_value(mesh, 'rh_mat_group')
-				if not parent:
-					parent = self.get_material_group(index=0)
-				pymel.parent(mesh, parent)
-				pymel.lockNode(mesh, lock=True)
-				
-			# delete the temp group
-			pymel.delete(temp_group)
+		self.finish_export_item(did_export, export_log, manifest=manifest)
+
+
+	def finish_export_item(self, did_export, export_log, manifest=None):
+		"""
+		Report the export results, write the export manifest and restore the export ui
+
+		*Arguments:*
+			* ``did_export`` If the item exported
+			* ``export_log`` Log text to show the user
+
+		*Keyword Arguments:*
+			* ``manifest`` Export manifest to write next to the exported files
+
+		*Returns:*
+			* ``None`` 
+		"""
 
-			# lock everything
-			pymel.lockNode(self.item_node, lock=True)		
-		
 		progress_value = 100
-		self.export_progress.setValue(progress_value)
+		self.export_log_model.set_progress(progress_value)
+		self.export_log_model.refresh(force=True)
 		pymel.select(cl=True)
+
+		# the manifest waits on the fbx post process, write it in the background
+		if manifest:
+			undo_stats = rh_maya.get_open_undo_chunk_stats()
+			if undo_stats:
+				manifest['undo'] = undo_stats
+			rh_maya.write_export_manifest_async(manifest)
+
 		if not did_export:	
 			cmds.confirmDialog( t='Item Export: Failed' , m=export_log, b='OK' )
 		else:
 			cmds.confirmDialog( t='Item Export: Completed' , m=export_log, b='OK' )			
 
 		# restore buttons properly
-		self.export_output.setText('')
+		self.export_log_model.clear()
 		self.export_progress.setVisible(False)
 		self.export_output.setVisible(False)
 		self.export_groupbox.setMinimumSize(QSize(323, 100))
 		self.export_pushButton.showNormal()
 		self.export_pushButton.setDown(False)
+		self.export_pushButton.setDisabled(False)
 		
 
 	def on_pressed_cancel_rename(self):
@@ -2405,6 +2788,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.update_ui()		
 
 
+	@rh_maya.undo_step('Item Rigger: Edit Mode')
 	def on_pressed_edit_item(self):
 		"""
 		Handle going into edit mode
@@ -2924,7 +3308,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 						self.info_bone_pushButton.setStyleSheet('''QPushButton {color:black;background-color: green }''')
 
 						# populate the item bones comboBox
-						bones = [x.nodeName() for x in self.item_bones if not x.nodeName() == 'weapon_root']
+						bones = [entry['name'] for entry in self.get_item_bone_table().itervalues() if not entry['name'] == 'weapon_root']
 						self.add_bone_combo_names = bones
 						string_list = QStringListModel()
 						string_list.setStringList(bones)
@@ -3091,6 +3475,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		pymel.lockNode(obj, lock = True)
 
 
+	@rh_maya.undo_step('Item Rigger: Update Material Indices')
 	def update_material_group_indices(self):
 		"""
 		When material groups have been removed we need to update the indices of the 
@@ -3146,8 +3531,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 					pymel.lockNode(grp, lock=False)
 					grp.setAttr('rh_item_material_index', lock=False)
 					grp.setAttr('rh_item_material_index', missing_index)				
-					index_string = str( missing_index ).zfill( 2 )		
-					pymel.rename(grp, 'Mat_' + index_string)
+					pymel.rename(grp, rh_maya.get_index_name('Mat_', missing_index))
 					grp.setAttr('rh_item_material_index', lock=True)
 					pymel.lockNode(grp, lock=True)
 					checked_grps.append(grp)					
@@ -3164,12 +3548,10 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 					# update the dictionary
 					grp_indexs[missing_index] = grp
 
-		if self.last_material_index:
-			pymel.lockNode(self.item_node, lock=False)
-			self.item_node.setAttr('rh_material_index', lock=False)
-			self.item_node.setAttr('rh_material_index', self.last_material_index)
-			self.item_node.setAttr('rh_material_index', lock=True)
-			pymel.lockNode(self.item_node, lock=True)
+		# the indices are contiguous again, rebuild the allocator from them
+		self.material_index_allocator = rh_maya.create_index_allocator(used=grp_indexs.keys(), start=1)
+		if self.item_node:
+			rh_maya.save_index_counter(self.item_node, 'rh_material_index', self.material_index_allocator)
 
 
 	def get_material_groups(self):
@@ -3190,8 +3572,9 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		"""
 
 		material_groups = []
-		material_indexs = []
 		mat_grp_dict = {}
+		material_group_lookup = {}
+		allocator = rh_maya.create_index_allocator(start=1)
 		if self.item_mesh_group:
 			transform_groups = pymel.ls(self.item_mesh_group, dag=True, type='transform', sn=True)
 			mat_groups = [x for x in transform_groups if x.startswith('Mat_')]
@@ -3199,9 +3582,8 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 				material_index = self.get_attribute_value(mat_grp, 'rh_item_material_index')
 				if not material_index is None:
 					mat_grp_dict[material_index] = mat_grp					
-					if not material_index in material_indexs:
-						material_indexs.append(material_index)
-					else:
+					material_group_lookup[int(material_index)] = mat_grp
+					if not rh_maya.claim_index(allocator, material_index):
 						cmds.confirmDialog(t='Item Material Groups: Issue', m='There are multiple groups with the same material index. This is badd!!!')
 
 			# get the sorted material groups
@@ -3209,9 +3591,30 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 				material_groups.append(grp)
 
 		self.item_material_groups = material_groups
+		self.item_material_group_lookup = material_group_lookup
+		self.material_index_allocator = allocator
 		return material_groups
 
 
+	def get_material_index_allocator(self):
+		"""
+		Get the material index allocator, scanning the material groups if needed
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``allocator`` Allocator dict of the used material indices
+		"""
+
+		if self.material_index_allocator is None:
+			self.get_material_groups()
+		return self.material_index_allocator
+
+
 	def get_material_group(self, index=0):
 		"""
 		Get the material group by index or mesh
@@ -3232,14 +3635,9 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		if not self.item_material_groups:
 			self.get_material_groups()
 
-		if self.item_material_groups:		
-			for mat_grp in self.item_material_groups:
-				index_val = self.get_attribute_value(mat_grp, 'rh_item_material_index')
-				if not index_val is None:
-					if int(index_val) == index:
-						return mat_grp
-
-		return None
+		if index is None:
+			return None
+		return self.item_material_group_lookup.get(int(index))
 	
 	
 	def is_item_mesh(self, obj):
@@ -3363,10 +3761,27 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/11/2014 1:40:09 PM
 		"""
 
-		item_bone = None
 		item_prefix = '{0}_'.format(self.item_type.lower())
+		joint_name = item_prefix + bone_name
+		table = self.get_item_bone_table()
+		for attempt in xrange(2):
+			stale = False
+			for entry in table.itervalues():
+				if entry['name'] == joint_name:
+					if index is None or entry['index'] == index:
+						bone = entry['bone']
+						if bone.exists() and bone.nodeName() == joint_name:
+							return bone
+						stale = True
+
+			# the bone was renamed, deleted or added since the table was built
+			if attempt or not (stale or cmds.objExists('{0}.{1}'.format(joint_name, self.item_type_attr))):
+				break
+			table = self.build_item_bone_table()
+
+		# bones outside the item table
+		item_bone = None
 		try:
-			joint_name = item_prefix + bone_name
 			item_bone = pymel.PyNode(joint_name)
 		except:
 			pass
@@ -3446,12 +3861,14 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		# material_index, [material,material_group]
 		self.item_materials = item_materials
+		self.update_material_signatures()
 		return item_materials
 
 
-	def get_item_mesh_group(self):
+	def update_material_signatures(self):
 		"""
-		Get the Item Node mesh_grp
+		Key every material group by its material signature, and each material by the groups that hold it,
+		so the group for a new mesh is found with hash lookups
 
 		*Arguments:*
 			* ``None`` 
@@ -3461,60 +3878,130 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		*Returns:*
 			* ``None`` 
-
-		*Author:*
-		* randall.hess, randall.hess@gmail.com, 9/11/2014 1:39:55 PM
 		"""
 
-		mesh_grp = None
-		if self.item_node:
-			try:
-				mesh_grp = self.item_node.getAttr('rh_mesh_grp')
-			except:
-				cmds.warning('The item has no MESH_grp.')		
+		self.item_material_signatures = {}
+		self.item_material_lookup = {}
+		if not self.item_materials:
+			return
 
-		self.item_mesh_group = mesh_grp
-		return mesh_grp
+		for material_index in sorted(self.item_materials.keys()):
+			materials, material_group = self.item_materials[material_index]
+			self.add_material_signature(materials, material_group)
 
 
-	def get_item_controls(self):
+	def add_material_signature(self, materials, material_group):
 		"""
-		Get the animation controls under the item rig_grp
+		Add a material group to the material signature lookups
 
 		*Arguments:*
-			* ``None`` 
+			* ``materials``      Materials of the group
+			* ``material_group`` Mat_ group
 
 		*Keyword Arguments:*
 			* ``None`` 
 
 		*Returns:*
 			* ``None`` 
+		"""
 
-		*Author:*
-		* randall.hess, randall.hess@gmail.com, 9/16/2014 2:23:16 PM
-		"""		
-		item_controls = []
-		if self.item_node:
-			rig_grp = None
-			try:
-				rig_grp = self.item_node.getAttr('rh_rig_grp')
-			except:			
-				cmds.warning('The item has no rig_grp.')
-
-			if rig_grp:
-				controls = pymel.ls(rig_grp, dag=True, type='transform')
-				for ctrl in controls:
-					if rh_maya.get_mesh_shape(ctrl):						
-						if ctrl.hasAttr(self.item_type_attr):
-							item_controls.append(ctrl)							
-
-		self.item_controls = item_controls
-		return item_controls	
+		signature = rh_maya.get_material_signature(materials)
+		# the lowest material index wins, groups are added in index order
+		self.item_material_signatures.setdefault(signature, material_group)
+		for key in signature:
+			groups = self.item_material_lookup.setdefault(key, [])
+			if not material_group in groups:
+				groups.append(material_group)
 
 
-	def get_item_bones(self):
+	def find_material_signature_group(self, materials):
 		"""
-		Get the bones under the item root
+		Find the material group for a set of materials.
+		A group with the same signature is used first, otherwise the first group holding all of the materials.
+
+		*Arguments:*
+			* ``materials`` Materials of the mesh being added
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``material_group`` Mat_ group or None
+		"""
+
+		signature = rh_maya.get_material_signature(materials)
+		if not signature:
+			return None
+
+		material_group = self.item_material_signatures.get(signature)
+		if material_group is None:
+			groups = self.item_material_lookup.get(signature[0], [])
+			for key in signature[1:]:
+				key_groups = self.item_material_lookup.get(key, [])
+				groups = [group for group in groups if group in key_groups]
+			if groups:
+				material_group = groups[0]
+
+		return material_group
+
+
+	def get_material_signature_group(self, materials):
+		"""
+		Get the material group for a set of materials from the signature lookups,
+		the lookups are rebuilt if they are empty or hold a group that no longer exists
+
+		*Arguments:*
+			* ``materials`` Materials of the mesh being added
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``material_group`` Mat_ group or None
+		"""
+
+		if not self.item_material_signatures:
+			self.get_item_materials()
+
+		material_group = self.find_material_signature_group(materials)
+		if material_group is not None and not material_group.exists():
+			self.get_item_materials()
+			material_group = self.find_material_signature_group(materials)
+
+		return material_group
+
+
+	def get_item_mesh_group(self):
+		"""
+		Get the Item Node mesh_grp
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``None`` 
+
+		*Author:*
+		* randall.hess, randall.hess@gmail.com, 9/11/2014 1:39:55 PM
+		"""
+
+		mesh_grp = None
+		if self.item_node:
+			try:
+				mesh_grp = self.item_node.getAttr('rh_mesh_grp')
+			except:
+				cmds.warning('The item has no MESH_grp.')		
+
+		self.item_mesh_group = mesh_grp
+		return mesh_grp
+
+
+	def get_item_controls(self):
+		"""
+		Get the animation controls under the item rig_grp
 
 		*Arguments:*
 			* ``None`` 
@@ -3527,11 +4014,46 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		*Author:*
 		* randall.hess, randall.hess@gmail.com, 9/16/2014 2:23:16 PM
+		"""		
+		item_controls = []
+		if self.item_node:
+			rig_grp = None
+			try:
+				rig_grp = self.item_node.getAttr('rh_rig_grp')
+			except:			
+				cmds.warning('The item has no rig_grp.')
+
+			if rig_grp:
+				controls = pymel.ls(rig_grp, dag=True, type='transform')
+				for ctrl in controls:
+					if rh_maya.get_mesh_shape(ctrl):						
+						if ctrl.hasAttr(self.item_type_attr):
+							item_controls.append(ctrl)							
+
+		self.item_controls = item_controls
+		return item_controls	
+
+
+	def build_item_bone_table(self):
+		"""
+		Build the table of bones under the item root from one walk of the joint hierarchy.
+		Entries are keyed by bone long name and hold the bone, name, index,
+		parent, stored rh_parent and item bone children, (parents are long names),
+		so bone checks and lookups against the table need no scene queries.
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``table`` OrderedDict of bone long name to entry dict
 		"""
 
-		item_bones = []
+		table = collections.OrderedDict()
 		item_bone_names = []
-		item_bone_indices = []
+		allocator = rh_maya.create_index_allocator(start=0)
 		index_error_msg =''
 		name_error_msg = ''
 		if self.item_node:
@@ -3543,25 +4065,44 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 			ignore_bones = ['weapon_root','item_root','offset','root','ground']
 			if root_bone:
-				bones = pymel.ls(root_bone, dag=True, type='joint')
-				for bone in bones:
-					if not bone.nodeName() in ignore_bones:						
-						if bone.hasAttr(self.item_type_attr):
-							item_bones.append(bone)
-
-							# check for dupe indices
-							bone_index = self.get_attribute_value(bone, 'rh_item_bone_index')
-							if bone_index:
-								if bone_index in item_bone_indices:
-									index_error_msg += '  Bone: {0}  Index: {1}'.format(bone.longName(), bone_index)
-								else:
-									item_bone_indices.append(bone_index)
+				joints = cmds.ls(root_bone.longName(), dag=True, type='joint', long=True) or []
+				for joint in joints:
+					name = joint.split('|')[-1]
+					if name in ignore_bones:
+						continue
+					if not cmds.attributeQuery(self.item_type_attr, node=joint, exists=True):
+						continue
 
-							# check for dupe names
-							if bone.nodeName() in item_bone_names:
-								name_error_msg += '  Bone: {0}'.format(bone.longName())
-							else:
-								item_bone_names.append(bone.nodeName())
+					bone_index = None
+					if cmds.attributeQuery('rh_item_bone_index', node=joint, exists=True):
+						bone_index = cmds.getAttr(joint + '.rh_item_bone_index')
+					rh_parent = None
+					if cmds.attributeQuery('rh_parent', node=joint, exists=True):
+						connections = cmds.listConnections(joint + '.rh_parent', source=True, destination=False)
+						if connections:
+							rh_parent = cmds.ls(connections[0], long=True)[0]
+
+					# check for dupe indices
+					if not bone_index is None:
+						if not rh_maya.claim_index(allocator, bone_index):
+							index_error_msg += '  Bone: {0}  Index: {1}'.format(joint, bone_index)
+
+					# check for dupe names
+					if name in item_bone_names:
+						name_error_msg += '  Bone: {0}'.format(joint)
+					else:
+						item_bone_names.append(name)
+
+					table[joint] = {'bone':pymel.PyNode(joint),
+					                'name':name,
+					                'index':bone_index,
+					                'parent':joint.rsplit('|', 1)[0],
+					                'rh_parent':rh_parent,
+					                'children':[]}
+
+				for joint, entry in table.iteritems():
+					if entry['parent'] in table:
+						table[entry['parent']]['children'].append(joint)
 
 		show_error = False
 		error_msg = 'There were issues with the item bones!'
@@ -3575,8 +4116,91 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		if show_error:
 			cmds.confirmDialog(t='Item Rigger: Error', m=error_msg)
 
-		self.item_bones = item_bones
-		return item_bones
+		self.item_bone_table = table
+		self.item_bones = [entry['bone'] for entry in table.itervalues()]
+		self.item_bone_set = set(self.item_bones)
+		self.bone_index_allocator = allocator
+		return table
+
+
+	def get_bone_index_allocator(self):
+		"""
+		Get the bone index allocator, scanning the item bones if needed
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``allocator`` Allocator dict of the used bone indices
+		"""
+
+		if self.bone_index_allocator is None:
+			self.build_item_bone_table()
+		return self.bone_index_allocator
+
+
+	def get_item_bone_table(self):
+		"""
+		Get the cached item bone table, building it if needed
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``table`` OrderedDict of bone long name to entry dict
+		"""
+
+		if self.item_bone_table is None:
+			self.build_item_bone_table()
+		return self.item_bone_table
+
+
+	def get_item_bones(self, refresh=False):
+		"""
+		Get the bones under the item root
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``refresh`` Rebuild the item bone table
+
+		*Returns:*
+			* ``bones`` List of item bone PyNodes
+
+		*Author:*
+		* randall.hess, randall.hess@gmail.com, 9/16/2014 2:23:16 PM
+		"""
+
+		if refresh:
+			self.build_item_bone_table()
+		else:
+			self.get_item_bone_table()
+		return self.item_bones
+
+
+	def is_item_bone(self, node):
+		"""
+		Check if a node is one of the item bones
+
+		*Arguments:*
+			* ``node`` PyNode
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``bool`` 
+		"""
+
+		self.get_item_bone_table()
+		return node in self.item_bone_set
 
 
 	def get_mesh_material_group(self, mesh):
@@ -3783,33 +4407,15 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 10/11/2014 1:01:50 PM
 		"""
 
-		# bake skinned meshes
-		self.item_meshes = self.get_item_meshes()
-		if not self.item_meshes:			
-			return 
-		
-		for mesh in self.item_meshes.keys():
-			pymel.lockNode(mesh, lock=False)
-
-			# check for non-deformer history and delete
-			shape = rh_maya.get_mesh_shape(mesh)
-			has_polyblind_data = False
-			if shape:
-				nonDeformerHistoryNodes  = [n for n in shape.history(il=1, pdo = True) if not isinstance(n, pymel.nodetypes.GeometryFilter)]
-				if nonDeformerHistoryNodes :
-					nonDeformerHistoryNodes  = list(set(nonDeformerHistoryNodes))
-					bake_non_history = False
-					for node in nonDeformerHistoryNodes:					
-						if not type(node) == pymel.nodetypes.PolyBlindData:
-							print 'Shape has NonDeformerHistory: {0}'.format(node.nodeName())
-							bake_non_history = True
-							break
-
-					if bake_non_history:
-						print 'Baking NonDeformerHistory on Shape: {0}'.format(shape.nodeName())
-						cmds.bakePartialHistory(shape.longName(),prePostDeformers=True )
+		# the meshes were just gathered by _init_item_
+		if not self.item_meshes:
+			self.item_meshes = self.get_item_meshes()
+		if not self.item_meshes:
+			return
 
-			pymel.lockNode(mesh, lock=True)		
+		# only history added during this edit session is looked at
+		rh_maya.bake_non_deformer_history(self.item_meshes.keys(), known_history=self.edit_session_history)
+		self.edit_session_history = None
 
 
 	def on_toggle_edit_mode(self, edit=True, changed=False):
@@ -3844,6 +4450,10 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 				cmds.warning('No item node found in scene! Restart!')
 				return
 
+			# remember the mesh history so leaving edit mode only bakes what changed
+			if self.item_meshes:
+				self.edit_session_history = rh_maya.get_mesh_history(self.item_meshes.keys())
+
 			# toggle edit mode attribute
 			pymel.lockNode(self.item_node, lock=False)
 			self.item_node.setAttr('rh_item_edit', lock=False)
@@ -3962,7 +4572,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/12/2014 5:31:55 PM
 		"""
 
-		do_skin = rh_maya.skin_mesh(bones, mesh)
+		do_skin = rh_maya.skin_mesh(bones, mesh, keep_weights=True)
 		if do_skin:
 			return True		
 		return False
@@ -4033,6 +4643,13 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/13/2014 11:11:32 AM
 		"""
 
+		# the bone table is rebuilt below, or left empty when there is no item
+		self.item_bone_table = None
+		self.item_bones = []
+		self.item_bone_set = set()
+		self.bone_index_allocator = None
+		self.material_index_allocator = None
+
 		# get the item node
 		if pymel.objExists('Weapon'):
 			item_node = pymel.PyNode('Weapon')
@@ -4052,6 +4669,12 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		# get the item name
 		if not self.item_node:			
 			return
+
+		# the shape cleanup has not run on a new item or scene, even with the same shape count
+		shape_node = self.item_mesh_shape_node
+		if not shape_node or not shape_node.exists() or shape_node != self.item_node:
+			self.item_mesh_shape_count = None
+			self.item_mesh_shape_node = self.item_node
 			
 		# item node name
 		item_name = self.get_attribute_value(self.item_node, 'rh_item_name')
@@ -4083,7 +4706,10 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.get_item_attachments()
 
 		# get the item bones
-		self.get_item_bones()
+		self.get_item_bones(refresh=True)
+
+		# older rigs cap the bone and material indices, remove the limits
+		rh_maya.remove_index_limits([self.item_node] + self.item_bones + (self.item_material_groups or []))
 
 		# get the item controls
 		self.get_item_controls()
@@ -4132,20 +4758,18 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/18/2014 5:27:49 PM
 		"""
 
-		bones = self.get_item_bones()
-		for bone in bones:
-			parent_attr = self.get_attribute_value(bone, 'rh_parent')
-			if parent_attr:
-				current_parent = pymel.listRelatives(bone, p=True)
-				if current_parent:
-					current_parent = current_parent[0]
-					if not parent_attr == current_parent:
-						error_msg = 'This bone parent has been changed from when it was originally defined.\n\
-						This could have unexpected results!\n\n Bone: {0}\n Parent: {1}\n Original Parent: {2}'.format(bone.nodeName(), current_parent.nodeName(), parent_attr.nodeName())
-						print error_msg
-						cmds.warning(error_msg)
+		for entry in self.get_item_bone_table().itervalues():
+			parent_attr = entry['rh_parent']
+			current_parent = entry['parent']
+			if parent_attr and current_parent:
+				if not parent_attr == current_parent:
+					error_msg = 'This bone parent has been changed from when it was originally defined.\n\
+					This could have unexpected results!\n\n Bone: {0}\n Parent: {1}\n Original Parent: {2}'.format(entry['name'], current_parent.split('|')[-1], parent_attr.split('|')[-1])
+					print error_msg
+					cmds.warning(error_msg)
 
 
+	@rh_maya.undo_step('Item Rigger: Update Unassigned Objects')
 	def update_unassigned_objects(self):
 		"""
 		Look for rogue objects in the scene and move to unassigned
@@ -4318,31 +4942,20 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 10/16/2014 2:18:26 PM
 		"""
 
-		all_bad_shapes = {}
-		if not self.item_meshes:
-			self.get_item_meshes()
-			
-		if self.item_meshes:
-			for mesh in self.item_meshes:
-				shapes = mesh.getShapes()
-				intermediate_shape = None			
-				bad_shapes = []
-				for shape in shapes:
-					if pymel.hasAttr(shape, 'intermediateObject'):
-						if shape.getAttr('intermediateObject'):
-							connections = pymel.listConnections(shape)
-							if connections:							
-								pass
-							else:
-								bad_shapes.append(shape)					
-	
-				if bad_shapes:
-					all_bad_shapes[mesh] = bad_shapes
+		if not self.item_mesh_group:
+			return
+
+		# nothing to clean unless shapes were added or removed since the last run
+		shape_count = rh_maya.get_mesh_shape_count(self.item_mesh_group)
+		if shape_count == self.item_mesh_shape_count:
+			return
 
-		if all_bad_shapes:
-			for mesh, shapes in all_bad_shapes.iteritems():
-				print 'MESH Has Duplicate Shapes: {0}\n {1}'.format(mesh.nodeName(), shapes)				
-				pymel.delete(shapes)			
+		bad_shapes = rh_maya.get_orphan_intermediate_shapes(self.item_mesh_group)
+		if bad_shapes:
+			print 'MESH Has Duplicate Shapes:\n {0}'.format('\n '.join(bad_shapes))
+			cmds.lockNode(bad_shapes, lock=False)
+			cmds.delete(bad_shapes)
+		self.item_mesh_shape_count = shape_count - len(bad_shapes)
 
 
 	def validate_item_meshes(self):
@@ -4382,8 +4995,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		else:
 			return True, ''				
 
-		#vert_num = cmds.polyEvaluate(mesh, vertex=True)
-		#face_num = cmds.polyEvaluate(mesh, faces=True)
+		# vertex/triangle budgets and geometry are checked by the mesh_geometry lint rule
 
 		# make sure the meshes have only singular materials
 		# make sure the meshes are sorted into the correct material groups
@@ -4731,6 +5343,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		return False
 
 
+	@rh_maya.undo_step('Item Rigger: Remove Mesh')
 	def do_remove_mesh(self, mesh, mesh_bone=None, mesh_control=None, remove_rigging=True):
 		"""
 		Remove the mesh from the item
@@ -4750,15 +5363,15 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		original_selection = pymel.ls(sl=True)
 		pymel.select(mesh)
-		with pymel.UndoChunk():
+		with rh_maya.undo_chunk('Item Rigger: Remove Mesh'):
 
 			# unlock the node and move it
 			pymel.lockNode(mesh, lock=False)
 
-			# disable envelope on skinning
+			# cache the painted weights so they come back when the mesh is assigned again
 			skincluster = mesh.listHistory(type="skinCluster")
 			if skincluster:
-				pass
+				rh_maya.cache_skin_weights(mesh.longName())
 
 			if self.unassigned_group:
 				pymel.lockNode(self.unassigned_group, lock=False)
@@ -4788,15 +5401,11 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 							mesh_bone.setAttr(attr, lock=False)		
 							mesh_bone.deleteAttr(attr)
 
-					weap_index = self.get_attribute_value(self.item_node, 'rh_bone_index')
-					if weap_index:					
-						if bone_index == weap_index-1:
-							prev_index = bone_index
-							# if this was the last rigged bone decrement the item_bone_index						
-							pymel.lockNode(self.item_node, lock=False)
-							self.item_node.setAttr('rh_bone_index', lock = False)
-							self.item_node.setAttr('rh_bone_index', prev_index)
-							self.item_node.setAttr('rh_bone_index', lock = True)											
+					# give the bone index back so the next rigged mesh reuses it
+					if not bone_index is None:
+						allocator = self.get_bone_index_allocator()
+						rh_maya.free_index(allocator, bone_index)
+						rh_maya.save_index_counter(self.item_node, 'rh_bone_index', allocator)
 
 					# delete constrain objects before unparenting
 					connections = pymel.listConnections(mesh_bone)
@@ -4846,7 +5455,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.update_ui()		
 
 
-	def do_set_mesh(self):
+	def do_set_mesh(self, item_bone=None):
 		"""
 		Main Set Mesh Method
 
@@ -4854,7 +5463,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			* ``None`` 
 
 		*Keyword Arguments:*
-			* ``None`` 
+			* ``item_bone`` Existing item bone to skin to, instead of the Add Bone combo
 
 		*Returns:*
 			* ``None`` 
@@ -4872,11 +5481,10 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		item_prefix = '{0}_'.format(self.item_type.lower())
 
 		# need to make sure the new bone/control name doesnt already exists
-		# increment the bone index and update the item node attribute
+		# the bone will take the lowest free bone index whose bone and control names are not taken
 		if self.temp_bone:
-			item_bone_index = self.get_attribute_value(self.item_node, 'rh_bone_index')	
-			index_string = str( int(item_bone_index) ).zfill( 2 )
-			new_bone_name = item_prefix + index_string	
+			item_bone_index = rh_maya.get_free_named_index(self.get_bone_index_allocator(), item_prefix, suffixes=['_anim'], ignore=[self.temp_bone, self.temp_control])
+			new_bone_name = rh_maya.get_index_name(item_prefix, item_bone_index)
 			if pymel.objExists(new_bone_name):
 				obj = pymel.PyNode(new_bone_name)
 				if not obj == self.temp_bone:
@@ -4884,7 +5492,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 					return False
 
 			if self.temp_control:
-				new_control_name = item_prefix + index_string + '_anim'
+				new_control_name = new_bone_name + '_anim'
 				if pymel.objExists(new_control_name):
 					obj = pymel.PyNode(new_control_name)
 					if not obj == self.temp_control:
@@ -4893,45 +5501,13 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		pymel.lockNode(self.temp_mesh, lock=False)		
 
-		# get all the active item materials being used and make sure it isn't being used	
-		self.item_materials = self.get_item_materials()
+		# find the material group holding all of the mesh materials
 		new_material_group = True
-		mesh_material_group = None
-		for material_index, material_info in self.item_materials.iteritems():
-			group_materials, material_group = material_info
-			found_grp = False
-			
-			# need to do a len check and make sure all the materials on the new mesh exist in this group			
-			if len(self.temp_materials) > 1:				
-				for mat in group_materials:
-					checked_mats = []
-					failed_mats = []					
-					for t_mat in self.temp_materials:
-						if t_mat in group_materials:
-							checked_mats.append(t_mat)
-						else:
-							failed_mats.append(t_mat)							
-					if not failed_mats:
-						pymel.parent(self.temp_mesh, material_group)
-						mesh_material_group = material_group
-						new_material_group = False
-						found_grp = True
-						break						
-			
-			else:
-				temp_mat = self.temp_materials[0]
-				for mat in group_materials:
-					# if the mesh being added has an existing material grp, it needs to be parented under that group
-					if mat == temp_mat:
-						pymel.parent(self.temp_mesh, material_group)
-						mesh_material_group = material_group
-						new_material_group = False
-						found_grp = True
-						break
-				
-			# exit early
-			if found_grp:
-				break
+		mesh_material_group = self.get_material_signature_group(self.temp_materials)
+		if mesh_material_group:
+			# if the mesh being added has an existing material grp, it needs to be parented under that group
+			pymel.parent(self.temp_mesh, mesh_material_group)
+			new_material_group = False
 
 		# create a new material group
 		if new_material_group:
@@ -4947,8 +5523,11 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		rig_control = False
 		if not self.temp_bone:
 			# skin the mesh to the selected existing bone
-			bone_name = self.add_bone_combo.currentText()
-			bone = pymel.PyNode(bone_name)
+			if item_bone:
+				bone = pymel.PyNode(item_bone)
+			else:
+				bone_name = self.add_bone_combo.currentText()
+				bone = pymel.PyNode(bone_name)
 		else:
 			sel = pymel.ls(sl=True)
 			pymel.select(cl=True)
@@ -5002,7 +5581,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			set_default_parent = True
 			if bone_parent:
 				bone_parent = bone_parent[0]
-				if bone_parent in self.get_item_bones():
+				if self.is_item_bone(bone_parent):
 					set_default_parent = False
 				root_bone = self.get_attribute_value(self.item_node, 'rh_item_root')
 				if root_bone:
@@ -5010,33 +5589,25 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 						set_default_parent = False
 			
 			if set_default_parent:
-				if self.item_type == 'Weapon':
-					weapon_grip = pymel.PyNode('weapon_grip')
-					if weapon_grip:
-						pymel.parent(bone, weapon_grip)
-				else:
-					frame = pymel.PyNode('frame')
-					if frame:
-						pymel.parent(bone, frame)							
+				default_parent = rh_maya.get_item_rig_spec(self.item_type)['default_parent']
+				if pymel.objExists(default_parent):
+					pymel.parent(bone, pymel.PyNode(default_parent))
 
 			# add bone attributes
 			if not pymel.hasAttr(bone, self.item_type_attr):
 				pymel.addAttr(bone, ln=self.item_type_attr, at='bool', keyable=False, dv=1)			
 			if not pymel.hasAttr(bone, 'rh_item_bone_index'):
-				pymel.addAttr(bone, ln='rh_item_bone_index', niceName='BoneIndex', at = 'double', defaultValue = 0.0, minValue = 0.0, maxValue = 60.0, keyable = False, h = False)					
+				pymel.addAttr(bone, ln='rh_item_bone_index', niceName='BoneIndex', at = 'double', defaultValue = 0.0, minValue = 0.0, keyable = False, h = False)					
 			else:
 				bone.setAttr('rh_item_bone_index', lock=False)
 			if not pymel.hasAttr(bone, 'rh_parent'):
 				pymel.addAttr(bone, at='message', ln= 'rh_parent', niceName='Parent')			
 
-			# increment the bone index and update the item node attribute
-			item_bone_index = self.get_attribute_value(self.item_node, 'rh_bone_index')
-			index_string = str( int(item_bone_index) ).zfill( 2 )
-
-			new_index = int(item_bone_index) + 1				
-			self.item_node.setAttr('rh_bone_index', lock = False)
-			self.item_node.setAttr('rh_bone_index', new_index)
-			self.item_node.setAttr('rh_bone_index', lock = True)
+			# take the lowest free bone index with free names and update the item node attributes
+			allocator = self.get_bone_index_allocator()
+			item_bone_index = rh_maya.get_free_named_index(allocator, item_prefix, suffixes=['_anim'], ignore=[bone, self.temp_control])
+			rh_maya.claim_index(allocator, item_bone_index)
+			rh_maya.save_index_counter(self.item_node, 'rh_bone_index', allocator)
 
 			# set the bone to be the current item bone index
 			bone.setAttr('rh_item_bone_index', item_bone_index)
@@ -5048,7 +5619,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			self.last_bone_index_added = item_bone_index		
 
 			# rename the bone base on the item_bone_index
-			bone_name = item_prefix + index_string
+			bone_name = rh_maya.get_index_name(item_prefix, item_bone_index)
 			pymel.rename(bone, bone_name)	
 
 			sel = pymel.ls(sl=True)
@@ -5098,7 +5669,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		# skin and lock mesh
 		if not self.keep_skinning:
-			rh_maya.skin_mesh([bone], self.temp_mesh)
+			rh_maya.skin_mesh([bone], self.temp_mesh, keep_weights=True)
 
 		# add item attr
 		pymel.lockNode(self.temp_mesh, lock=False)
@@ -5160,6 +5731,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		return True
 
 
+	@rh_maya.undo_step('Item Rigger: Set Mesh')
 	def on_pressed_set_mesh(self):
 		"""
 		Add the item mesh
@@ -5180,8 +5752,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		"""	
 
 		selection = pymel.ls(sl=True)
-		with pymel.UndoChunk():
-			self.do_set_mesh()
+		self.do_set_mesh()
 
 		# update item variables		
 		self._init_item_()
@@ -5319,6 +5890,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			
 
 
+	@rh_maya.undo_step('Item Rigger: Set Mesh Static')
 	def on_pressed_set_mesh_static(self, is_static):
 		"""
 		Flag the mesh attachment as static or not
@@ -5367,6 +5939,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.update_ui_meshes()
 		
 
+	@rh_maya.undo_step('Item Rigger: Set Mesh Attachment')
 	def on_pressed_set_mesh_attachment(self):
 		"""
 		Flag the selected mesh as an attachment
@@ -5410,6 +5983,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.update_ui_meshes()
 		
 		
+	@rh_maya.undo_step('Item Rigger: Remove Mesh Attachment')
 	def on_pressed_remove_mesh_attachment(self):
 		"""
 		Unflag the mesh as an attachment
@@ -5464,6 +6038,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.update_ui_meshes()		
 		
 
+	@rh_maya.undo_step('Item Rigger: Remove Mesh')
 	def on_pressed_remove_mesh(self):
 		"""
 		Handle removing a mesh piece and any of its associated rigging if possible
@@ -5584,6 +6159,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		return True
 
 
+	@rh_maya.undo_step('Item Rigger: Remove Mesh')
 	def on_pressed_mesh_remove(self, base_mesh=False):
 		"""
 		Remove the selected mesh entry
@@ -5750,6 +6326,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		return False
 	
 
+	@rh_maya.undo_step('Item Rigger: Set Parent Control')
 	def on_pressed_parent_ctrl_picked(self):
 		"""
 		Update parent bone selected in the scene
@@ -5771,6 +6348,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		self.update_parent_control_combo(None)
 		
 
+	@rh_maya.undo_step('Item Rigger: Set Control')
 	def on_pressed_ctrl_picked(self):
 		"""
 		Update the bone picked
@@ -5830,6 +6408,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		return True	
 
 
+	@rh_maya.undo_step('Item Rigger: Remove Control')
 	def on_pressed_ctrl_remove(self):
 		"""
 		Update the bone picked
@@ -5853,6 +6432,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		return True	
 
+	@rh_maya.undo_step('Item Rigger: Set Bone')
 	def on_pressed_bone_picked(self):
 		"""
 		Update the bone picked
@@ -5882,7 +6462,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		# make sure the joint isnt already under the hierarchy
 		bone = selection[0]
 		bone_parent = pymel.listRelatives(bone, p=True)
-		if bone in self.get_item_bones():
+		if self.is_item_bone(bone):
 			index = 0			
 			for name in self.add_bone_combo_names:
 				if bone.nodeName() == name:
@@ -5913,13 +6493,14 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		# tell the user to parent their bone properly
 		if bone_parent:
 			bone_parent = bone_parent[0]
-			if not bone_parent in self.get_item_bones():				
+			if not self.is_item_bone(bone_parent):				
 				add_bone_msg = 'PARENT THE SELECTED BONE NOW!!\n\nYou have selected a new bone to add to the Item.\nIf you want the bone to be a child of a specific bone, you must parent it appropriately in the item_root hierarchy.\n\nThe bone will otherwise default to becoming a child of the weapon_grip bone.'
 				cmds.confirmDialog(title='Item Rigger: Add Bone', m=add_bone_msg)
 
 		return True		
 
 
+	@rh_maya.undo_step('Item Rigger: Remove Bone')
 	def on_pressed_bone_remove(self):
 		"""
 		Update the bone picked
@@ -5964,19 +6545,294 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/18/2014 8:58:20 PM
 		"""
 
-		if self.listView.selectedItems():
-			sel_item = self.listView.selectedItems()[0].text()
-			if not pymel.objExists(sel_item):
-				return				
-			node_longname = self.unassigned_names[self.listView.currentRow()]			
-			node = pymel.PyNode(node_longname)		
-			if node:
-				self.unassigned_node = node
-				pymel.select(self.unassigned_node)
+		nodes = self.get_selected_unassigned_nodes()
+		if nodes:
+			self.unassigned_node = nodes[0]
+			pymel.select(nodes)
 		else:
 			self.unassigned_node = None
 
 
+	def get_selected_unassigned_nodes(self):
+		"""
+		Get the nodes of the selected unassigned list entries
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``nodes`` List of PyNodes in list order
+		"""
+
+		nodes = []
+		if not self.unassigned_names:
+			return nodes
+
+		rows = sorted([self.listView.row(item) for item in self.listView.selectedItems()])
+		for row in rows:
+			try:
+				node_longname = self.unassigned_names[row]
+			except IndexError:
+				continue
+			if cmds.objExists(node_longname):
+				nodes.append(pymel.PyNode(node_longname))
+		return nodes
+
+
+	def create_unassigned_bone(self, mesh):
+		"""
+		Create a new bone and control at the center of a mesh for batch assigning
+
+		*Arguments:*
+			* ``mesh`` PyNode mesh
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``bone``    New joint
+			* ``control`` New control curve
+		"""
+
+		bbox = cmds.exactWorldBoundingBox(mesh.longName())
+		center = [(bbox[index] + bbox[index + 3]) * 0.5 for index in range(3)]
+
+		pymel.select(cl=True)
+		bone = pymel.joint(p=center)
+		bone.setAttr('radius', 4.0)
+
+		control = pymel.PyNode(rh_maya.create_temp_curve(mesh.nodeName()))
+		cmds.xform(control.longName(), ws=True, t=center)
+		pymel.select(cl=True)
+		return bone, control
+
+
+	def do_assign_unassigned_meshes(self, meshes, new_bones=False, mesh_bones=None):
+		"""
+		Add many unassigned meshes to the item in one pass.
+		Each mesh runs through do_set_mesh, without any dialogs or ui refresh between meshes.
+
+		Meshes already skinned only to item bones keep their skinning,
+		meshes skinned to other joints are skipped.
+
+		*Arguments:*
+			* ``meshes`` PyNode meshes to add
+
+		*Keyword Arguments:*
+			* ``new_bones``  Create a new bone and control for each mesh, otherwise skin to the current Add Bone
+			* ``mesh_bones`` Dict of mesh long name to the existing item bone to skin it to
+
+		*Returns:*
+			* ``assigned`` Meshes that were added
+			* ``skipped``  Dictionary of meshes that were not added with the reason
+		"""
+
+		assigned = []
+		skipped = collections.OrderedDict()
+		item_bones = self.get_item_bones()
+
+		for node in meshes:
+			is_valid, mesh, mesh_materials, error_msg = self.validate_mesh(mesh=node)
+			if not is_valid:
+				skipped[node] = error_msg
+				continue
+
+			self.keep_skinning = False
+			if mesh.listHistory(type='skinCluster'):
+				influences = rh_maya.get_skincluster_influences(mesh)
+				if [x for x in influences if not x in item_bones]:
+					skipped[mesh] = 'Skinned to joints that are not item bones'
+					continue
+				self.keep_skinning = True
+			else:
+				pymel.lockNode(mesh, lock=False)
+				self.check_transforms(mesh)
+
+			self.temp_bone = None
+			self.temp_control = None
+			if new_bones:
+				self.temp_bone, self.temp_control = self.create_unassigned_bone(mesh)
+
+			item_bone = None
+			if mesh_bones:
+				item_bone = mesh_bones.get(mesh.longName())
+
+			self.temp_mesh = mesh
+			self.temp_materials = mesh_materials
+			if self.do_set_mesh(item_bone=item_bone):
+				assigned.append(mesh)
+			else:
+				skipped[mesh] = 'Failed to set the mesh'
+
+		# leave the ui as it was
+		self.keep_skinning = False
+		self.temp_mesh = None
+		self.temp_materials = None
+		self.temp_bone = None
+		self.temp_control = None
+
+		return assigned, skipped
+
+
+	@rh_maya.undo_step('Item Rigger: Assign Unassigned')
+	def on_pressed_assign_unassigned(self, new_bones=False):
+		"""
+		Add all of the selected unassigned meshes to the item in a single undo chunk, then refresh the ui once
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``new_bones`` Create a new bone and control for each mesh, otherwise skin to the current Add Bone
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		self.assign_bone_pushButton.setDown(False)
+		self.assign_new_bones_pushButton.setDown(False)
+
+		if not self.item_base_mesh:
+			cmds.warning('You must have a Base Mesh assigned to the item first!')
+			return False
+
+		meshes = self.get_selected_unassigned_nodes()
+		if not meshes:
+			cmds.warning('Select meshes in the Unassigned Meshes list to assign.')
+			return False
+
+		if new_bones:
+			if not cmds.objExists(self.parent_ctrl_combo.currentText()):
+				cmds.warning('Pick a valid Parent Control for the new controls.')
+				return False
+		elif not cmds.objExists(self.add_bone_combo.currentText()):
+			cmds.warning('Pick a valid bone to assign the meshes to.')
+			return False
+
+		return self.run_assign_unassigned(meshes, new_bones=new_bones)
+
+
+	def run_assign_unassigned(self, meshes, new_bones=False, mesh_bones=None):
+		"""
+		Assign unassigned meshes in a single undo chunk, refresh the ui once and report the result
+
+		*Arguments:*
+			* ``meshes`` PyNode meshes to add
+
+		*Keyword Arguments:*
+			* ``new_bones``  Create a new bone and control for each mesh
+			* ``mesh_bones`` Dict of mesh long name to the existing item bone to skin it to
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		selection = pymel.ls(sl=True)
+		pymel.waitCursor(state=True)
+		try:
+			with rh_maya.undo_chunk('Item Rigger: Assign Unassigned'):
+				assigned, skipped = self.do_assign_unassigned_meshes(meshes, new_bones=new_bones, mesh_bones=mesh_bones)
+		finally:
+			pymel.waitCursor(state=False)
+
+		# update item variables and refresh the ui once
+		self._init_item_()
+		self.update_ui()
+
+		try:
+			pymel.select(selection)
+		except:
+			pass
+
+		message = 'Assigned {0} of {1} meshes.'.format(len(assigned), len(meshes))
+		if skipped:
+			message += '\n\nSkipped:\n'
+			for mesh, reason in skipped.iteritems():
+				message += ' {0}: {1}\n'.format(mesh.nodeName(), reason.strip().split('\n')[-1])
+		cmds.confirmDialog(title='Item Rigger: Assign Meshes', m=message)
+		return True
+
+
+	def get_bone_mesh_hints(self):
+		"""
+		Get the names of the item meshes skinned to each bone, used as name hints when proposing bones
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``bone_hints`` Dict of bone long name to mesh names
+		"""
+
+		bone_hints = {}
+		skin_map = rh_maya.get_skin_influence_map(meshes=self.item_meshes.keys())
+		for mesh, skin_info in skin_map.iteritems():
+			if not skin_info:
+				continue
+			for influence in skin_info['influences']:
+				bone_hints.setdefault(influence, []).append(mesh)
+		return bone_hints
+
+
+	@rh_maya.undo_step('Item Rigger: Auto Assign Unassigned')
+	def on_pressed_auto_assign_unassigned(self):
+		"""
+		Propose the nearest item bone for each selected unassigned mesh, or all of them when fewer than two are selected,
+		the list always keeps its first row selected.
+		The artist confirms the whole table of proposals, then they are assigned in one undo chunk.
+
+		*Arguments:*
+			* ``None`` 
+
+		*Keyword Arguments:*
+			* ``None`` 
+
+		*Returns:*
+			* ``None`` 
+		"""
+
+		self.auto_assign_pushButton.setDown(False)
+
+		if not self.item_base_mesh:
+			cmds.warning('You must have a Base Mesh assigned to the item first!')
+			return False
+
+		meshes = self.get_selected_unassigned_nodes()
+		if len(meshes) < 2:
+			meshes = [pymel.PyNode(name) for name in self.unassigned_names if cmds.objExists(name)]
+		if not meshes:
+			cmds.warning('There are no unassigned meshes to assign.')
+			return False
+
+		bones = self.get_item_bone_table().keys()
+		if not bones:
+			cmds.warning('The item has no bones to assign meshes to.')
+			return False
+
+		pymel.waitCursor(state=True)
+		try:
+			proposals = rh_maya.get_nearest_bone_proposals(meshes, bones, bone_hints=self.get_bone_mesh_hints())
+		finally:
+			pymel.waitCursor(state=False)
+
+		dialog = AutoAssignDialog(proposals, bones, parent=self)
+		if not dialog.exec_():
+			return False
+
+		mesh_bones = dialog.get_assignments()
+		if not mesh_bones:
+			return False
+
+		meshes = [pymel.PyNode(mesh) for mesh in mesh_bones.keys()]
+		return self.run_assign_unassigned(meshes, mesh_bones=mesh_bones)
+
+
 	def on_cell_clicked(self, row_col):
 		"""
 		Enter a description of the function here.
@@ -6057,26 +6913,15 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/19/2014 12:20:38 PM
 		"""
 		
-		if self.listView.selectedItems():
-			name = self.listView.selectedItems()[0].text()
-			if name:								
-				if cmds.objExists(name):
-					if self.unassigned_names:
-						try:
-							node_longname = self.unassigned_names[self.listView.currentRow()]
-						except KeyError:
-							node_longname = None
-							
-						if node_longname:
-							if cmds.objExists(node_longname):
-								node = pymel.PyNode(node_longname)
-								if node:
-									self.unassigned_node = node
-									pymel.select(self.unassigned_node)
+		nodes = self.get_selected_unassigned_nodes()
+		if nodes:
+			self.unassigned_node = nodes[0]
+			pymel.select(nodes)
 		else:
 			self.unassigned_node = None
 
 
+	@rh_maya.undo_step('Item Rigger: Delete Unassigned')
 	def on_pressed_del_unassigned(self):
 		"""
 		Delete the selected unassigned mesh
@@ -6159,7 +7004,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			non_joints_string = ''
 			influences = rh_maya.get_skincluster_influences(mesh)
 			for inf in influences:
-				if not inf in self.get_item_bones():
+				if not self.is_item_bone(inf):
 					non_joints.append(inf)
 					non_joints_string += ' {0}\n'.format(inf.nodeName())		
 			if non_joints:
@@ -6251,22 +7096,13 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			# add mesh attr
 			pymel.lockNode(mesh, lock=False)
 			
-			if self.item_type == 'Weapon':
-				# skin the mesh
-				if not skincluster:				
-					self.do_item_skin_mesh(['weapon_grip'], mesh)
-					
-				if not mesh.hasAttr(self.item_type_attr):
-					pymel.addAttr(mesh, ln=self.item_type_attr, at='bool', keyable=False, dv=1)
-					mesh.setAttr(self.item_type_attr, lock=True)
-			else:
-				# skin the mesh
-				if not skincluster:				
-					self.do_item_skin_mesh(['frame'], mesh)					
-					
-				if not mesh.hasAttr(self.item_type_att):
-					pymel.addAttr(mesh, ln=self.item_type_attr, at='bool', keyable=False, dv=1)
-					mesh.setAttr(self.item_type_attr, lock=True)			
+			# skin the mesh to the default parent bone of the item
+			if not skincluster:
+				self.do_item_skin_mesh([rh_maya.get_item_rig_spec(self.item_type)['default_parent']], mesh)
+
+			if not mesh.hasAttr(self.item_type_attr):
+				pymel.addAttr(mesh, ln=self.item_type_attr, at='bool', keyable=False, dv=1)
+				mesh.setAttr(self.item_type_attr, lock=True)			
 	
 			# sort the mesh into the proper Mesh sub group
 			mat_group = self.get_material_group(index=0)
@@ -6291,6 +7127,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		return True
 		
 
+	@rh_maya.undo_step('Item Rigger: Add Mesh')
 	def on_pressed_mesh_picked(self, base_mesh=False):
 		"""
 		Update the item base mesh based on user input
@@ -6355,7 +7192,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 				non_joints_string = ''
 				influences = rh_maya.get_skincluster_influences(mesh)
 				for inf in influences:
-					if not inf in self.get_item_bones():
+					if not self.is_item_bone(inf):
 						non_joints.append(inf)
 						non_joints_string += ' {0}\n'.format(inf.nodeName())
 
@@ -6373,7 +7210,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 					if influences:
 						if len(influences) == 1:
 							infl = influences[0]
-							if not infl in self.item_bones:
+							if not self.is_item_bone(infl):
 								self.temp_bone = infl
 
 				query_txt = 'The mesh you are adding is already skinned.\nIf this is intentional would you like to keep the skinning and any existing rigging?'				
@@ -6392,7 +7229,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 				bone = self.get_attribute_value(mesh, 'rh_bone')
 				if bone:
 					self.temp_bone = bone
-					if not self.temp_bone in self.item_bones:
+					if not self.is_item_bone(self.temp_bone):
 						self.add_bone_picked = True				
 				
 			# keep existing control assigned
@@ -6456,15 +7293,14 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 11/3/2014 11:27:25 AM
 		"""
 
-		item_folder = 'weapons'
-		if not self.item_type == 'Weapon':
-			item_folder = 'vehicles'
+		item_folder = rh_maya.get_item_rig_spec(self.item_type)['folder']
 		export_path = None
 		if self.item_name:
 			export_path = os.path.join(PROJECT_ART_PATH, r'''{0}/{1}/export/'''.format(item_folder, self.item_name)).replace("\\","/")
 		return export_path
 	
 
+	@rh_maya.undo_step('Item Rigger: Create Item')
 	def on_pressed_accept_name(self):		
 		"""
 		Handle updating the item name
@@ -6496,9 +7332,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 		if update_name:
 			self.item_name = item_name
-			item_folder = 'weapons'
-			if self.item_type == 'Vehicle':
-				item_folder = 'vehicles'			
+			item_folder = rh_maya.get_item_rig_spec(self.item_type)['folder']
 
 			# save the item file			
 			item_base_path = os.path.join(PROJECT_ART_PATH, '''{1}/{0}/rig/{0}_rig.ma'''.format(item_name, item_folder)).replace("\\","/")
@@ -6527,7 +7361,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 			# Check to see if we already have a item node in the scene		
 			if not self.item_node:
-				item_node = rh_maya.weapon_create_rig(self.item_name)
+				item_node = rh_maya.create_item_rig(self.item_name, item_type=self.item_type, use_template=USE_RIG_TEMPLATE)
 				if item_node:
 					self.item_node = item_node
 					self._init_item_()				
@@ -6553,6 +7387,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 
 
 	@Slot()
+	@rh_maya.undo_step('Item Rigger: Rename Mesh')
 	def on_mesh_name_changed( self, row, col ):		
 		"""
 		If the value of the mesh name field has changed update it here
@@ -6668,7 +7503,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		if target in self.get_item_controls():
 			parent = rh_maya.get_obj_parent(target, parent_before='rig_grp')			
 			if parent:
-				with pymel.UndoChunk():
+				with rh_maya.undo_chunk('Item Rigger: Copy Pivot'):
 					all_constraints = {}
 					pymel.select(cl=True)
 					pymel.select(parent)
@@ -6697,20 +7532,20 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 							elif const == 'scale':
 								constraint = pymel.scaleConstraint(nodes, parent, mo=True, weight=1.0)							
 			else:
-				with pymel.UndoChunk():
+				with rh_maya.undo_chunk('Item Rigger: Copy Pivot'):
 					# transfer the pivot
 					rh_maya.transfer_pivot(source=source, target=target, freeze=False)				
 		else:
-			with pymel.UndoChunk():
+			with rh_maya.undo_chunk('Item Rigger: Copy Pivot'):
 				rh_maya.transfer_pivot(source=source, target=target, freeze=True)
 
 
 	def on_pressed_ctrl_scale(self, scale):
 		"""
-		Scale selected controller
+		Scale the selected controllers
 
 		*Arguments:*
-			* ``None`` 
+			* ``scale`` 1 to scale up, 0 to scale down
 
 		*Keyword Arguments:*
 			* ``None`` 
@@ -6722,38 +7557,21 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 10/29/2014 4:45:40 PM
 		"""
 
-		new_sel = pymel.ls(sl=True, type='transform')
-		with pymel.UndoChunk():		
-			if len(new_sel) == 1:
-				control = new_sel[0]
-				if control:
-					shape = control.getShape()
-					if shape:
-						pymel.select(cl=True)
-						pymel.select(control)					
-						pymel.selectMode(co=True)
-						maya.mel.eval('SelectAll;')
-						scale_val = 1.1
-						if scale == 0:
-							scale_val = -0.9
-						maya.mel.eval('scale -r -ocp {0} {0} {0};'.format(scale_val))
-						pymel.selectMode(o=True)
-						pymel.select(cl=True)
-						pymel.select(new_sel)
-					else:
-						cmds.warning('Select a single shape node.')
-				else:
-					cmds.warning('Select a single shape node.')
-			else:
-				cmds.warning('Select a single shape node.')
+		controls = pymel.ls(sl=True, type='transform')
+		scale_val = 1.1
+		if scale == 0:
+			scale_val = 0.9
+		with rh_maya.undo_chunk('Item Rigger: Scale Control'):
+			if not rh_maya.scale_control_shapes(controls, scale_val):
+				cmds.warning('Select one or more controls with curve shapes.')
 
 
 	def on_pressed_rot_90_axis(self, val):
 		"""
-		Rotate selected controller
+		Rotate the selected controllers 90 degrees about an axis
 
 		*Arguments:*
-			* ``None`` 
+			* ``val`` Axis index, 0 x, 1 y, 2 z
 
 		*Keyword Arguments:*
 			* ``None`` 
@@ -6765,43 +7583,17 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 10/29/2014 4:45:17 PM
 		"""
 
-		new_sel = pymel.ls(sl=True, type='transform')
-		with pymel.UndoChunk():
-			if len(new_sel) == 1:
-				control = new_sel[0]	
-				if control:
-					shape = control.getShape()
-					if shape:
-						rot_val = 90
-						#if not pos:
-							#rot_val = -90
-						x_val, y_val, z_val = [0.0, 0.0, 0.0]
-						if val == 0:					
-							x_val = rot_val
-						elif val == 1:
-							y_val = rot_val
-						elif val == 2:
-							z_val = rot_val					
-						pymel.select(cl=True)
-						pymel.select(control)
-						pymel.selectMode(co=True)
-						maya.mel.eval('SelectAll;')					
-						maya.mel.eval('rotate -r -ocp -os -fo {0} {1} {2};'.format(x_val, y_val, z_val))
-						#maya.mel.eval('scale -r -p 0cm 0cm 0cm {0} {0} {0};'.format(scale_val))
-						pymel.selectMode(o=True)
-						pymel.select(cl=True)
-						pymel.select(new_sel)
-					else:
-						cmds.warning('Select a single shape node.')					
-				else:
-					cmds.warning('Select a single shape node.')				
-			else:
-				cmds.warning('Select a single shape node.')			
+		controls = pymel.ls(sl=True, type='transform')
+		rotation = [0.0, 0.0, 0.0]
+		rotation[val] = 90.0
+		with rh_maya.undo_chunk('Item Rigger: Rotate Control'):
+			if not rh_maya.rotate_control_shapes(controls, rotation):
+				cmds.warning('Select one or more controls with curve shapes.')
 						
 
 	def on_pressed_color_index_changed(self):
 		"""
-		Change color on selected shape
+		Change color on the selected controllers
 
 		*Arguments:*
 			* ``None`` 
@@ -6816,26 +7608,11 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 10/29/2014 6:03:38 PM
 		"""
 
-		sel = pymel.ls(sl=True)
-		with pymel.UndoChunk():
-			new_sel = pymel.ls(sl=True, type='transform')
-			if len(new_sel) == 1:
-				pymel.select(cl=True)
-				control = new_sel[0]
-				if control:
-					shapes = control.getShapes()
-					if shapes:
-						for shape in shapes:
-							color_index = self.set_color_combo.currentIndex() + 1
-							shape.setAttr('overrideEnabled', True)
-							shape.setAttr('overrideColor', color_index)
-					else:
-						cmds.warning('Select a single shape node to change the color on.')
-				else:
-					cmds.warning('Select a single shape node to change the color on.')					
-			else:
-				cmds.warning('Select a single shape node to change the color on.')
-		pymel.select(sel)
+		controls = pymel.ls(sl=True, type='transform')
+		color_index = self.set_color_combo.currentIndex() + 1
+		with rh_maya.undo_chunk('Item Rigger: Control Color'):
+			if not rh_maya.set_control_color(controls, color_index):
+				cmds.warning('Select one or more controls with curve shapes to change the color on.')
 
 
 	def on_pressed_create_listbox_control(self):
@@ -6863,58 +7640,18 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 			cmds.warning('Select a single object to snap the newly created control object to!')
 			return
 			
-		create_cmd = ''
-		
 		# get the name of the control from the selected comboBox item
 		control_name = self.add_ctrl_combo.currentText()
-		if not control_name:
+		if not control_name in rh_maya.get_control_shape_names():
 			cmds.warning('Select a proper entry from the list of control names.')
 			return
-		
-		if control_name == 'arrow':
-			create_cmd = ('curve -d 1 -p 0 0.6724194 0.4034517 -p 0 0 0.4034517 -p 0 0 0.6724194 -p 0 -0.4034517 0 -p 0 0 -0.6724194 -p 0 0 -0.4034517 -p 0 0.6724194 -0.4034517 -p 0 0.6724194 0.4034517 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -n "arrow#"')
-		elif control_name == 'cross':
-			create_cmd = ('curve -d 1 -p 1 0 -1 -p 2 0 -1 -p 2 0 1 -p 1 0 1 -p 1 0 2 -p -1 0 2 -p -1 0 1 -p -2 0 1 -p -2 0 -1 -p -1 0 -1 -p -1 0 -2 -p 1 0 -2 -p 1 0 -1 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -n "cross#";')
-		elif control_name == 'square':
-			create_cmd = ('curve -d 1 -p -1 0 1 -p 1 0 1 -p 1 0 -1 -p -1 0 -1 -p -1 0 1 -k 0 -k 1 -k 2 -k 3 -k 4 -n "square#";')
-		elif control_name == 'cube':
-			create_cmd = ('curve -d 1 -p -0.5 0.5 0.5 -p 0.5 0.5 0.5 -p 0.5 0.5 -0.5 -p -0.5 0.5 -0.5 -p -0.5 0.5 0.5 -p -0.5 -0.5 0.5 -p -0.5 -0.5 -0.5 -p 0.5 -0.5 -0.5 -p 0.5 -0.5 0.5 -p -0.5 -0.5 0.5 -p 0.5 -0.5 0.5 -p 0.5 0.5 0.5 -p 0.5 0.5 -0.5 -p 0.5 -0.5 -0.5 -p -0.5 -0.5 -0.5 -p -0.5 0.5 -0.5 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -n "cube#";')
-		elif control_name == 'orient':
-			create_cmd = ('curve -d 3 -p 0.0959835 0.604001 -0.0987656 -p 0.500783 0.500458 -0.0987656 -p 0.751175 0.327886 -0.0987656 -p 0.751175 0.327886 -0.0987656 -p 0.751175 0.327886 -0.336638 -p 0.751175 0.327886 -0.336638 -p 1.001567 0 0 -p 1.001567 0 0 -p 0.751175 0.327886 0.336638 -p 0.751175 0.327886 0.336638 -p 0.751175 0.327886 0.0987656 -p 0.751175 0.327886 0.0987656 -p 0.500783 0.500458 0.0987656 -p 0.0959835 0.604001 0.0987656 -p 0.0959835 0.604001 0.0987656 -p 0.0959835 0.500458 0.500783 -p 0.0959835 0.327886 0.751175 -p 0.0959835 0.327886 0.751175 -p 0.336638 0.327886 0.751175 -p 0.336638 0.327886 0.751175 -p 0 0 1.001567 -p 0 0 1.001567 -p -0.336638 0.327886 0.751175 -p -0.336638 0.327886 0.751175 -p -0.0959835 0.327886 0.751175 -p -0.0959835 0.327886 0.751175 -p -0.0959835 0.500458 0.500783 -p -0.0959835 0.604001 0.0987656 -p -0.0959835 0.604001 0.0987656 -p -0.500783 0.500458 0.0987656 -p -0.751175 0.327886 0.0987656 -p -0.751175 0.327886 0.0987656 -p -0.751175 0.327886 0.336638 -p -0.751175 0.327886 0.336638 -p -1.001567 0 0 -p -1.001567 0 0 -p -0.751175 0.327886 -0.336638 -p -0.751175 0.327886 -0.336638 -p -0.751175 0.327886 -0.0987656 -p -0.751175 0.327886 -0.0987656 -p -0.500783 0.500458 -0.0987656 -p -0.0959835 0.604001 -0.0987656 -p -0.0959835 0.604001 -0.0987656 -p -0.0959835 0.500458 -0.500783 -p -0.0959835 0.327886 -0.751175 -p -0.0959835 0.327886 -0.751175 -p -0.336638 0.327886 -0.751175 -p -0.336638 0.327886 -0.751175 -p 0 0 -1.001567 -p 0 0 -1.001567 -p 0.336638 0.327886 -0.751175 -p 0.336638 0.327886 -0.751175 -p 0.0959835 0.327886 -0.751175 -p 0.0959835 0.327886 -0.751175 -p 0.0959835 0.500458 -0.500783 -p 0.0959835 0.604001 -0.0987656 -k 0 -k 0 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -k 16 -k 17 -k 18 -k 19 -k 20 -k 21 -k 22 -k 23 -k 24 -k 25 -k 26 -k 27 -k 28 -k 29 -k 30 -k 31 -k 32 -k 33 -k 34 -k 35 -k 36 -k 37 -k 38 -k 39 -k 40 -k 41 -k 42 -k 43 -k 44 -k 45 -k 46 -k 47 -k 48 -k 49 -k 50 -k 51 -k 52 -k 53 -k 53 -k 53 -n "orient#";')
-		elif control_name == 'circleY':
-			create_cmd = ('string $tc[] = `circle -c 0 0 0 -nr 0 1 0 -sw 360 -r 1 -d 3 -ut 0 -tol 0.01 -s 8 -ch 1`; $c=$tc[0];')
-		elif control_name == 'circleZ':
-			create_cmd = ('string $tc[] = `circle -c 0 0 0 -nr 0 0 1 -sw 360 -r 1 -d 3 -ut 0 -tol 0.01 -s 8 -ch 1`; $c=$tc[0];')
-		elif control_name == 'circleX':
-			create_cmd = ('string $tc[] = `circle -c 0 0 0 -nr 1 0 0 -sw 360 -r 1 -d 3 -ut 0 -tol 0.01 -s 8 -ch 1`;	$c=$tc[0];')
-		elif control_name == 'sphere':	
-			create_cmd = ('curve -d 1 -p 0 3 0 -p 0 2 -2 -p 0 0 -3 -p 0 -2 -2 -p 0 -3 0 -p 0 -2 2 -p 0 0 3 -p 0 2 2 -p 0 3 0 -p 2 2 0 -p 3 0 0 -p 2 -2 0 -p 0 -3 0 -p -2 -2 0 -p -3 0 0 -p -2 2 0 -p 0 3 0 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -k 16 -n "sphere#";')
-		elif control_name == 'plus':
-			create_cmd = ('curve -d 1 -p 0 1 0 -p 0 -1 0 -p 0 0 0 -p -1 0 0 -p 1 0 0 -p 0 0 0 -p 0 0 1 -p 0 0 -1 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -n "plus#";')
-		else:
-			cmds.warning('Select a proper entry from the list of control names.')
-			return	
 
-		# create the control
-		with pymel.UndoChunk():
-			pymel.select(cl=True)
-			maya.mel.eval(create_cmd)
-
-			control = None
-			new_sel = pymel.ls(sl=True)
-			if len(new_sel) == 1:
-				control = new_sel[0]
-
-			if control:		
-				pymel.selectMode(co=True)
-				maya.mel.eval('SelectAll;')
-				scale_val = 3
-				maya.mel.eval('scale -r -p 0cm 0cm 0cm {0} {0} {0};'.format(scale_val))
-				pymel.selectMode(o=True)
-				if obj:
-					constraint = pymel.parentConstraint(obj, control, mo=False, weight=1.0)							
-					if constraint:
-						pymel.delete(constraint)
+		# create the control, sized and snapped to the object
+		with rh_maya.undo_chunk('Item Rigger: Create Control'):
+			control = rh_maya.create_control(control_name, size=3.0)
+			if obj:
+				frame_matrix = rh_maya.get_control_frame_matrices(obj)[1]
+				cmds.xform(control, ws=True, m=rh_maya.get_matrix_list(frame_matrix))
 						
 	
 	def on_pressed_create_pivot_bone(self):
@@ -6934,7 +7671,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/24/2014 6:49:23 PM
 		"""	
 
-		with pymel.UndoChunk():
+		with rh_maya.undo_chunk('Item Rigger: Create Pivot Bone'):
 			rh_maya.create_pivot_bone()
 			
 
@@ -6955,7 +7692,7 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 11/10/2014 10:08:17 AM
 		"""
 		
-		with pymel.UndoChunk():
+		with rh_maya.undo_chunk('Item Rigger: Transfer Material'):
 			rh_maya.transfer_shading_groups()
 		
 
@@ -6976,9 +7713,33 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 11/9/2014 12:22:28 PM
 		"""
 		
-		cmds.warning('Implement your own method to transfer skinweights to a new mesh and replace the shape to preserve all attributes')
-		#with pymel.UndoChunk():			
-			#rh_maya.replace_mesh()
+		self.replace_mesh_pushButton.setDown(False)
+
+		selection = pymel.ls(sl=True, type='transform')
+		if not len(selection) == 2:
+			cmds.warning('Select the original mesh then the new mesh to replace it with.')
+			return False
+
+		mesh, new_mesh = selection
+		if not mesh.hasAttr(self.item_type_attr):
+			cmds.warning('The first selected mesh is not an item mesh: {0}'.format(mesh.nodeName()))
+			return False
+
+		pymel.waitCursor(state=True)
+		try:
+			with rh_maya.undo_chunk('Item Rigger: Replace Mesh'):
+				replaced, message = rh_maya.replace_mesh(mesh, new_mesh)
+		finally:
+			pymel.waitCursor(state=False)
+
+		if not replaced:
+			cmds.warning(message)
+			return False
+
+		print message
+		pymel.select(mesh)
+		self.update_ui()
+		return True
 			
 
 	def on_pressed_create_cvc_bone(self):
@@ -6998,10 +7759,11 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/23/2014 3:22:45 PM
 		"""
 
-		with pymel.UndoChunk():
+		with rh_maya.undo_chunk('Item Rigger: Create CVC Bone'):
 			rh_maya.create_cluster_bone()
 
 
+	@rh_maya.undo_step('Item Rigger: Rename Item')
 	def on_pressed_rename(self):
 		"""
 		Handle renaming the item name
@@ -7095,29 +7857,26 @@ class ItemRigger(MayaQWidgetDockableMixin, QDialog):
 		* randall.hess, randall.hess@gmail.com, 9/11/2014 1:27:45 PM
 		"""	
 		
-		with pymel.UndoChunk():
-			# get the material index from the item node
-			mat_index = self.item_node.getAttr('rh_material_index')
-	
-			# increment the material index and update the item node attribute
-			new_index = int(mat_index + 1)
-			index_string = str( new_index ).zfill( 2 )
+		with rh_maya.undo_chunk('Item Rigger: Create Material Group'):
+			# take the lowest free material index and update the item node attributes
+			allocator = self.get_material_index_allocator()
+			new_index = rh_maya.allocate_index(allocator)
 			pymel.lockNode(self.item_node, lock=False)
-			self.item_node.setAttr('rh_material_index', lock = False)
-			self.item_node.setAttr('rh_material_index', new_index)
-			self.item_node.setAttr('rh_material_index', lock = True)
+			rh_maya.save_index_counter(self.item_node, 'rh_material_index', allocator)
 	
 			# create the new mat group under the mesh_grp and setup the material attribute message
-			mat_group_name = 'Mat_' + index_string
+			mat_group_name = rh_maya.get_index_name('Mat_', new_index)
 			mat_group = pymel.group(empty=True, name=mat_group_name)
 			rh_maya.lock_channels(mat_group)
 			rh_maya.hide_channels(mat_group)
 			mat_group.setAttr('v', keyable=False)
 			
 			rh_maya.setAttrSpecial(mat_group, 'rh_material', materials, multi=True, keyable=False, h=False, lock=True)	
-			pymel.addAttr( mat_group, ln= 'rh_item_material_index', niceName = 'Material Index', at = 'double', defaultValue = new_index, minValue = 0.0, maxValue = 20.0, keyable = False, h = False )				
+			pymel.addAttr( mat_group, ln= 'rh_item_material_index', niceName = 'Material Index', at = 'double', defaultValue = new_index, minValue = 0.0, keyable = False, h = False )				
 			mat_group.setAttr('rh_item_material_index', lock=True)
 			pymel.parent(mat_group, self.item_mesh_group)	
+
+		self.add_material_signature(materials, mat_group)
 		return mat_group
 
 
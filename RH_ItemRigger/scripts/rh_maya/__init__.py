@@ -6,5 +6,11 @@ Add all new modules to this list
 
 from rh_maya_general import *
 from rh_maya_rigging import *
+from rh_maya_rig_spec import *
+from rh_maya_control_shapes import *
+from rh_maya_skin import *
 from rh_maya_modeling import *
+from rh_maya_lint import *
+from rh_maya_index import *
 from rh_maya_export import *
+from rh_maya_fbx import *
@@ -0,0 +1,461 @@
+"""
+Control Shape Library for use in Maya
+
+Control shapes are cached CV arrays, built with their final size and orientation.
+Studio shapes are .json files in RH_CONTROL_SHAPE_PATH, loaded once per session.
+
+License: GNU General Public License v3.0
+"""
+
+import os
+import json
+
+import maya.cmds as cmds
+import maya.OpenMaya as openMaya
+
+
+CONTROL_SHAPE_EXT = '.json'
+
+# cv positions of an 8 section, radius 1 circle
+CIRCLE_CORNER = 0.783612
+CIRCLE_SIDE = 1.108194
+
+# shapes are dicts of degree, points and periodic, knots are generated
+CONTROL_SHAPES = {
+	'square':{'degree':1, 'points':[(-1, 0, 1), (1, 0, 1), (1, 0, -1), (-1, 0, -1), (-1, 0, 1)]},
+	'cube':{'degree':1, 'points':[(-0.5, 0.5, 0.5), (0.5, 0.5, 0.5), (0.5, 0.5, -0.5), (-0.5, 0.5, -0.5), (-0.5, 0.5, 0.5), (-0.5, -0.5, 0.5),
+	                              (-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, -0.5, 0.5), (-0.5, -0.5, 0.5), (0.5, -0.5, 0.5), (0.5, 0.5, 0.5),
+	                              (0.5, 0.5, -0.5), (0.5, -0.5, -0.5), (-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5)]},
+	'sphere':{'degree':1, 'points':[(0, 3, 0), (0, 2, -2), (0, 0, -3), (0, -2, -2), (0, -3, 0), (0, -2, 2), (0, 0, 3), (0, 2, 2), (0, 3, 0),
+	                                (2, 2, 0), (3, 0, 0), (2, -2, 0), (0, -3, 0), (-2, -2, 0), (-3, 0, 0), (-2, 2, 0), (0, 3, 0)]},
+	'arrow':{'degree':1, 'points':[(0, 0.6724194, 0.4034517), (0, 0, 0.4034517), (0, 0, 0.6724194), (0, -0.4034517, 0), (0, 0, -0.6724194),
+	                               (0, 0, -0.4034517), (0, 0.6724194, -0.4034517), (0, 0.6724194, 0.4034517)]},
+	'cross':{'degree':1, 'points':[(1, 0, -1), (2, 0, -1), (2, 0, 1), (1, 0, 1), (1, 0, 2), (-1, 0, 2), (-1, 0, 1), (-2, 0, 1), (-2, 0, -1),
+	                               (-1, 0, -1), (-1, 0, -2), (1, 0, -2), (1, 0, -1)]},
+	'plus':{'degree':1, 'points':[(0, 1, 0), (0, -1, 0), (0, 0, 0), (-1, 0, 0), (1, 0, 0), (0, 0, 0), (0, 0, 1), (0, 0, -1)]},
+	'orient':{'degree':3, 'points':[
+		(0.0959835, 0.604001, -0.0987656), (0.500783, 0.500458, -0.0987656), (0.751175, 0.327886, -0.0987656), (0.751175, 0.327886, -0.0987656),
+		(0.751175, 0.327886, -0.336638), (0.751175, 0.327886, -0.336638), (1.001567, 0, 0), (1.001567, 0, 0), (0.751175, 0.327886, 0.336638),
+		(0.751175, 0.327886, 0.336638), (0.751175, 0.327886, 0.0987656), (0.751175, 0.327886, 0.0987656), (0.500783, 0.500458, 0.0987656),
+		(0.0959835, 0.604001, 0.0987656), (0.0959835, 0.604001, 0.0987656), (0.0959835, 0.500458, 0.500783), (0.0959835, 0.327886, 0.751175),
+		(0.0959835, 0.327886, 0.751175), (0.336638, 0.327886, 0.751175), (0.336638, 0.327886, 0.751175), (0, 0, 1.001567), (0, 0, 1.001567),
+		(-0.336638, 0.327886, 0.751175), (-0.336638, 0.327886, 0.751175), (-0.0959835, 0.327886, 0.751175), (-0.0959835, 0.327886, 0.751175),
+		(-0.0959835, 0.500458, 0.500783), (-0.0959835, 0.604001, 0.0987656), (-0.0959835, 0.604001, 0.0987656), (-0.500783, 0.500458, 0.0987656),
+		(-0.751175, 0.327886, 0.0987656), (-0.751175, 0.327886, 0.0987656), (-0.751175, 0.327886, 0.336638), (-0.751175, 0.327886, 0.336638),
+		(-1.001567, 0, 0), (-1.001567, 0, 0), (-0.751175, 0.327886, -0.336638), (-0.751175, 0.327886, -0.336638), (-0.751175, 0.327886, -0.0987656),
+		(-0.751175, 0.327886, -0.0987656), (-0.500783, 0.500458, -0.0987656), (-0.0959835, 0.604001, -0.0987656), (-0.0959835, 0.604001, -0.0987656),
+		(-0.0959835, 0.500458, -0.500783), (-0.0959835, 0.327886, -0.751175), (-0.0959835, 0.327886, -0.751175), (-0.336638, 0.327886, -0.751175),
+		(-0.336638, 0.327886, -0.751175), (0, 0, -1.001567), (0, 0, -1.001567), (0.336638, 0.327886, -0.751175), (0.336638, 0.327886, -0.751175),
+		(0.0959835, 0.327886, -0.751175), (0.0959835, 0.327886, -0.751175), (0.0959835, 0.500458, -0.500783), (0.0959835, 0.604001, -0.0987656)]},
+	'circleY':{'degree':3, 'periodic':True, 'points':[
+		(CIRCLE_CORNER, 0, -CIRCLE_CORNER), (0, 0, -CIRCLE_SIDE), (-CIRCLE_CORNER, 0, -CIRCLE_CORNER), (-CIRCLE_SIDE, 0, 0),
+		(-CIRCLE_CORNER, 0, CIRCLE_CORNER), (0, 0, CIRCLE_SIDE), (CIRCLE_CORNER, 0, CIRCLE_CORNER), (CIRCLE_SIDE, 0, 0),
+		(CIRCLE_CORNER, 0, -CIRCLE_CORNER), (0, 0, -CIRCLE_SIDE), (-CIRCLE_CORNER, 0, -CIRCLE_CORNER)]},
+}
+CONTROL_SHAPES['circleX'] = {'degree':3, 'periodic':True, 'points':[(y, x, z) for x, y, z in CONTROL_SHAPES['circleY']['points']]}
+CONTROL_SHAPES['circleZ'] = {'degree':3, 'periodic':True, 'points':[(x, z, y) for x, y, z in CONTROL_SHAPES['circleY']['points']]}
+
+# studio shapes are loaded into CONTROL_SHAPES the first time a shape is looked up
+STUDIO_SHAPES_LOADED = False
+
+# point arrays by (shape name, size, rotation)
+CONTROL_SHAPE_POINT_CACHE = {}
+
+
+def get_control_shape_dir():
+	"""
+	Get the folder studio control shapes are loaded from
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``shape_dir`` RH_CONTROL_SHAPE_PATH, or the control shape folder in the Maya user app dir
+	"""
+
+	shape_dir = os.environ.get('RH_CONTROL_SHAPE_PATH')
+	if not shape_dir:
+		shape_dir = os.path.join(cmds.internalVar(userAppDir=True), 'rh_item_rigger', 'control_shapes')
+	return shape_dir.replace('\\', '/')
+
+
+def register_control_shape(name, points, degree=1, periodic=False):
+	"""
+	Add a shape to the control shape library
+
+	*Arguments:*
+		* ``name``   Shape name
+		* ``points`` List of (x, y, z) cvs, periodic shapes repeat their first degree cvs at the end
+
+	*Keyword Arguments:*
+		* ``degree``   Curve degree
+		* ``periodic`` Closed periodic curve
+
+	*Returns:*
+		* ``None``
+	"""
+
+	CONTROL_SHAPES[name] = {'degree':degree, 'periodic':periodic, 'points':[tuple(point) for point in points]}
+	for key in CONTROL_SHAPE_POINT_CACHE.keys():
+		if key[0] == name:
+			del CONTROL_SHAPE_POINT_CACHE[key]
+
+
+def load_control_shapes(shape_dir=None, force=False):
+	"""
+	Load the studio control shapes, a .json file per shape
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``shape_dir`` Folder of .json shapes, the studio shape folder if not given
+		* ``force``     Load again when the shapes were already loaded this session
+
+	*Returns:*
+		* ``names`` List of loaded shape names
+	"""
+
+	global STUDIO_SHAPES_LOADED
+	if STUDIO_SHAPES_LOADED and not force:
+		return []
+	STUDIO_SHAPES_LOADED = True
+
+	if not shape_dir:
+		shape_dir = get_control_shape_dir()
+	if not os.path.isdir(shape_dir):
+		return []
+
+	names = []
+	for file_name in sorted(os.listdir(shape_dir)):
+		if not file_name.lower().endswith(CONTROL_SHAPE_EXT):
+			continue
+		shape_file = os.path.join(shape_dir, file_name)
+		try:
+			with open(shape_file, 'r') as json_file:
+				shape = json.load(json_file)
+			name = shape.get('name', os.path.splitext(file_name)[0])
+			register_control_shape(name, shape['points'], degree=shape.get('degree', 1), periodic=shape.get('periodic', False))
+			names.append(name)
+		except (IOError, ValueError, KeyError, TypeError):
+			cmds.warning('Could not load the control shape: {0}'.format(shape_file))
+	return names
+
+
+def save_control_shape(curve, name, shape_dir=None):
+	"""
+	Save the first curve shape of a transform as a studio control shape and register it
+
+	*Arguments:*
+		* ``curve`` Curve transform or shape
+		* ``name``  Shape name
+
+	*Keyword Arguments:*
+		* ``shape_dir`` Folder to save to, the studio shape folder if not given
+
+	*Returns:*
+		* ``shape_file`` Path of the saved shape or None
+	"""
+
+	shapes = cmds.ls(str(curve), dag=True, type='nurbsCurve', noIntermediate=True, long=True)
+	if not shapes:
+		cmds.warning('{0} has no curve shape to save.'.format(curve))
+		return None
+
+	shape = shapes[0]
+	points = [list(point) for point in cmds.getAttr(shape + '.controlPoints[*]')]
+	degree = cmds.getAttr(shape + '.degree')
+	periodic = cmds.getAttr(shape + '.form') == 2
+
+	if not shape_dir:
+		shape_dir = get_control_shape_dir()
+	if not os.path.isdir(shape_dir):
+		os.makedirs(shape_dir)
+
+	shape_file = os.path.join(shape_dir, name + CONTROL_SHAPE_EXT).replace('\\', '/')
+	with open(shape_file, 'w') as json_file:
+		json.dump({'name':name, 'degree':degree, 'periodic':periodic, 'points':points}, json_file, indent=1)
+
+	register_control_shape(name, points, degree=degree, periodic=periodic)
+	return shape_file
+
+
+def get_control_shape_names():
+	"""
+	Get the names of the library shapes, with the studio shapes
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``names`` Sorted list of shape names
+	"""
+
+	load_control_shapes()
+	return sorted(CONTROL_SHAPES.keys())
+
+
+def get_curve_knots(count, degree=1, periodic=False):
+	"""
+	Get uniform knots for a curve, in the Maya convention of count + degree - 1 knots
+
+	*Arguments:*
+		* ``count`` Number of cvs
+
+	*Keyword Arguments:*
+		* ``degree``   Curve degree
+		* ``periodic`` Closed periodic curve
+
+	*Returns:*
+		* ``knots`` List of knot values
+	"""
+
+	if periodic:
+		return range(1 - degree, count)
+	spans = count - degree
+	return [0] * degree + range(1, spans) + [spans] * degree
+
+
+def get_control_shape_points(shape_name, size=1.0, rotation=None, matrix=None):
+	"""
+	Get the cvs of a library shape with its final size and orientation.
+	Sized and rotated cvs are cached, the matrix is applied to a copy.
+
+	*Arguments:*
+		* ``shape_name`` Library shape name
+
+	*Keyword Arguments:*
+		* ``size``     Uniform scale of the shape
+		* ``rotation`` (x, y, z) rotation in degrees
+		* ``matrix``   MMatrix applied after the size and rotation
+
+	*Returns:*
+		* ``shape``  Shape dict
+		* ``points`` List of (x, y, z) cvs
+	"""
+
+	if not shape_name in CONTROL_SHAPES:
+		load_control_shapes()
+	shape = CONTROL_SHAPES[shape_name]
+
+	if rotation:
+		rotation = tuple(rotation)
+	key = (shape_name, size, rotation)
+	points = CONTROL_SHAPE_POINT_CACHE.get(key)
+	if points is None:
+		shape_matrix = openMaya.MMatrix()
+		if rotation:
+			shape_matrix = openMaya.MEulerRotation(*[openMaya.MAngle(value, openMaya.MAngle.kDegrees).asRadians() for value in rotation]).asMatrix()
+		points = []
+		for point in shape['points']:
+			position = openMaya.MPoint(point[0] * size, point[1] * size, point[2] * size) * shape_matrix
+			points.append((position.x, position.y, position.z))
+		CONTROL_SHAPE_POINT_CACHE[key] = points
+
+	if matrix:
+		matrix_points = []
+		for point in points:
+			position = openMaya.MPoint(point[0], point[1], point[2]) * matrix
+			matrix_points.append((position.x, position.y, position.z))
+		points = matrix_points
+	return shape, points
+
+
+def create_control_shape(shape_name, parent, size=1.0, rotation=None, matrix=None):
+	"""
+	Create a library shape under a transform with MFnNurbsCurve.create.
+	The curve is not on the undo queue, use create_control for undoable tools.
+
+	*Arguments:*
+		* ``shape_name`` Library shape name
+		* ``parent``     MObject transform to create the shape under
+
+	*Keyword Arguments:*
+		* ``size``     Uniform scale of the shape
+		* ``rotation`` (x, y, z) rotation in degrees
+		* ``matrix``   MMatrix applied after the size and rotation
+
+	*Returns:*
+		* ``MObject`` Curve shape
+	"""
+
+	shape, points = get_control_shape_points(shape_name, size=size, rotation=rotation, matrix=matrix)
+	return create_curve_shape(points, parent, degree=shape.get('degree', 1), periodic=shape.get('periodic', False))
+
+
+def create_curve_shape(points, parent, degree=1, periodic=False):
+	"""
+	Create a curve shape under a transform from a cv array with MFnNurbsCurve.create
+
+	*Arguments:*
+		* ``points`` List of (x, y, z) cvs
+		* ``parent`` MObject transform to create the shape under
+
+	*Keyword Arguments:*
+		* ``degree``   Curve degree
+		* ``periodic`` Closed periodic curve
+
+	*Returns:*
+		* ``MObject`` Curve shape
+	"""
+
+	point_array = openMaya.MPointArray()
+	for point in points:
+		point_array.append(openMaya.MPoint(point[0], point[1], point[2]))
+	knot_array = openMaya.MDoubleArray()
+	for knot in get_curve_knots(len(points), degree=degree, periodic=periodic):
+		knot_array.append(knot)
+
+	form = openMaya.MFnNurbsCurve.kPeriodic if periodic else openMaya.MFnNurbsCurve.kOpen
+	return openMaya.MFnNurbsCurve().create(point_array, knot_array, degree, form, False, False, parent)
+
+
+def create_control(shape_name, name=None, size=1.0, rotation=None, matrix=None, color=None):
+	"""
+	Create a control curve from the shape library.
+	The cached cvs go to a single curve command, so the control can be undone.
+
+	*Arguments:*
+		* ``shape_name`` Library shape name
+
+	*Keyword Arguments:*
+		* ``name``     Name of the control, the shape name if not given
+		* ``size``     Uniform scale of the shape
+		* ``rotation`` (x, y, z) rotation in degrees
+		* ``matrix``   MMatrix applied to the cvs after the size and rotation
+		* ``color``    Override color index
+
+	*Returns:*
+		* ``control`` Name of the control transform
+	"""
+
+	if not name:
+		name = shape_name + '#'
+
+	shape, points = get_control_shape_points(shape_name, size=size, rotation=rotation, matrix=matrix)
+	degree = shape.get('degree', 1)
+	periodic = shape.get('periodic', False)
+	knots = get_curve_knots(len(points), degree=degree, periodic=periodic)
+	control = cmds.curve(degree=degree, point=points, knot=knots, periodic=periodic, name=name)
+
+	curve_shape = cmds.listRelatives(control, shapes=True, fullPath=True)[0]
+	curve_shape = cmds.rename(curve_shape, control.split('|')[-1] + 'Shape')
+	if not color is None:
+		cmds.setAttr(curve_shape + '.overrideEnabled', True)
+		cmds.setAttr(curve_shape + '.overrideColor', color)
+	return control
+
+
+def get_control_curve_shapes(controls):
+	"""
+	Get the curve shapes of controls, intermediate shapes are skipped
+
+	*Arguments:*
+		* ``controls`` List of control transforms
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``shapes`` List of curve shape long names
+	"""
+
+	if not controls:
+		return []
+	controls = [str(control) for control in controls]
+	return cmds.listRelatives(controls, shapes=True, type='nurbsCurve', noIntermediate=True, fullPath=True) or []
+
+
+def get_curve_shape_center(shape):
+	"""
+	Get the world bounding box center of the cvs of a curve shape, read as one array
+
+	*Arguments:*
+		* ``shape`` Curve shape
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``center`` [x, y, z]
+	"""
+
+	positions = cmds.xform(shape + '.cv[*]', q=True, ws=True, t=True)
+	center = []
+	for axis in xrange(3):
+		values = positions[axis::3]
+		center.append((min(values) + max(values)) * 0.5)
+	return center
+
+
+def scale_control_shapes(controls, scale):
+	"""
+	Scale the cvs of controls about the center of each shape.
+	Nothing is selected, each shape is one scale command so it can be undone.
+
+	*Arguments:*
+		* ``controls`` List of control transforms
+		* ``scale``    Uniform scale
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``shapes`` List of scaled shapes
+	"""
+
+	shapes = get_control_curve_shapes(controls)
+	for shape in shapes:
+		cmds.scale(scale, scale, scale, shape + '.cv[*]', relative=True, pivot=get_curve_shape_center(shape))
+	return shapes
+
+
+def rotate_control_shapes(controls, rotation):
+	"""
+	Rotate the cvs of controls in object space about the center of each shape.
+	Nothing is selected, each shape is one rotate command so it can be undone.
+
+	*Arguments:*
+		* ``controls`` List of control transforms
+		* ``rotation`` (x, y, z) rotation in degrees
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``shapes`` List of rotated shapes
+	"""
+
+	shapes = get_control_curve_shapes(controls)
+	for shape in shapes:
+		cmds.rotate(rotation[0], rotation[1], rotation[2], shape + '.cv[*]', relative=True, objectSpace=True,
+		            forceOrderXYZ=True, pivot=get_curve_shape_center(shape))
+	return shapes
+
+
+def set_control_color(controls, color):
+	"""
+	Set the override color of the curve shapes of controls
+
+	*Arguments:*
+		* ``controls`` List of control transforms
+		* ``color``    Override color index
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``shapes`` List of colored shapes
+	"""
+
+	shapes = get_control_curve_shapes(controls)
+	for shape in shapes:
+		cmds.setAttr(shape + '.overrideEnabled', True)
+		cmds.setAttr(shape + '.overrideColor', color)
+	return shapes
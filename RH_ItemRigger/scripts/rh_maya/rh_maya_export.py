@@ -6,14 +6,26 @@ License: GNU General Public License v3.0
 """
 
 import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
 import maya.cmds as cmds
-import maya.mel as mel
+import maya.OpenMaya as openMaya
 import pymel.core as pymel
 
 import rh_maya_rigging
+import rh_maya_rig_spec
+import rh_maya_fbx
 
 PERFORCE = None
 
+# prefix for the result lines attachment export workers print to stdout
+WORKER_RESULT_PREFIX = 'RH_EXPORT_RESULT '
+
 # See my blog post for cleaning FBX files groups, layer, un-wanted meshes or nodes
 # https://techanimator.blogspot.com/2017/04/flexible-fbx-with-fbx-python-sdk.html
 try:
@@ -204,16 +216,200 @@ def set_fbx_options(custom_dict=None, reset=False, bake=False, start=None, end=N
 	return True
 	
 
-def export_weapon(item_type='Weapon'):
+def new_export_manifest(item_name=None, item_type='Weapon'):
 	"""
-	Export a weapon model/rig
+	Start a manifest that records the files written by an export
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``item_name`` Name of the exported item, names the manifest file
+		* ``item_type`` Weapon or Vehicle
+
+	*Returns:*
+		* ``manifest`` Manifest dict to pass to the export methods
+	"""
+
+	return {'item':item_name,
+	        'item_type':item_type,
+	        'scene':cmds.file(q=True, sceneName=True),
+	        'date':time.strftime('%Y-%m-%d %H:%M:%S'),
+	        'start_time':time.time(),
+	        'files':[]}
+
+
+def get_mesh_export_stats(meshes, influences=None):
+	"""
+	Count the geometry and skinning going into an export
+
+	*Arguments:*
+		* ``meshes`` Exported mesh transforms, transforms without mesh shapes are skipped
+
+	*Keyword Arguments:*
+		* ``influences`` Joints influencing the exported meshes
+
+	*Returns:*
+		* ``stats`` Dict of mesh, vertex, triangle and influence counts
+	"""
+
+	stats = {'meshes':0, 'vertices':0, 'triangles':0, 'influences':len(set([str(infl) for infl in influences or []]))}
+	for mesh in meshes:
+		if not cmds.listRelatives(str(mesh), shapes=True, noIntermediate=True, type='mesh'):
+			continue
+		stats['meshes'] += 1
+		stats['vertices'] += cmds.polyEvaluate(str(mesh), vertex=True)
+		stats['triangles'] += cmds.polyEvaluate(str(mesh), triangle=True)
+
+	return stats
+
+
+def add_export_manifest_file(manifest, export_file, meshes=None, bones=None, influences=None, timings=None, post_process=None):
+	"""
+	Record an exported fbx file in an export manifest
+
+	*Arguments:*
+		* ``manifest``    Manifest from new_export_manifest, nothing is recorded if None
+		* ``export_file`` Exported fbx file
+
+	*Keyword Arguments:*
+		* ``meshes``       Exported mesh transforms
+		* ``bones``        Exported joints
+		* ``influences``   Joints influencing the exported meshes
+		* ``timings``      Dict of phase name to seconds
+		* ``post_process`` Post process thread still writing the file
+
+	*Returns:*
+		* ``entry`` Manifest entry dict
+	"""
+
+	if manifest is None:
+		return None
+
+	entry = get_mesh_export_stats(meshes or [], influences=influences)
+	entry['path'] = export_file
+	entry['bones'] = len(set([str(bone) for bone in bones or []]))
+	entry['timings'] = dict(timings or {})
+	entry['post_process'] = post_process
+	manifest['files'].append(entry)
+	return entry
+
+
+def get_file_hash(filepath, block_size=1048576):
+	"""
+	Get the sha1 hash of a file without reading it all into memory
 
 	*Arguments:*
+		* ``filepath`` File to hash
+
+	*Keyword Arguments:*
+		* ``block_size`` Bytes read at a time
+
+	*Returns:*
+		* ``hash`` Hex digest
+	"""
+
+	sha = hashlib.sha1()
+	with open(filepath, 'rb') as f:
+		block = f.read(block_size)
+		while block:
+			sha.update(block)
+			block = f.read(block_size)
+	return sha.hexdigest()
+
+
+def finalize_export_manifest_file(entry):
+	"""
+	Wait for the post process of an exported file and record its final size and hash
+
+	*Arguments:*
+		* ``entry`` Manifest entry from add_export_manifest_file
+
+	*Keyword Arguments:*
 		* ``None`` 
 
+	*Returns:*
+		* ``entry`` Json ready manifest entry
+	"""
+
+	post_process = entry.pop('post_process', None)
+	if post_process:
+		post_process.join()
+		entry['timings']['post_process'] = post_process.duration
+		if post_process.result and not post_process.result[0]:
+			entry['post_process_error'] = post_process.result[1]
+
+	entry['size'] = None
+	entry['hash'] = None
+	if os.path.isfile(entry['path']):
+		entry['size'] = os.path.getsize(entry['path'])
+		entry['hash'] = get_file_hash(entry['path'])
+	return entry
+
+
+def write_export_manifest(manifest, manifest_file=None):
+	"""
+	Write an export manifest as json next to the exported fbx files.
+	Waits on any post process still running on the files.
+
+	*Arguments:*
+		* ``manifest`` Manifest from new_export_manifest
+
+	*Keyword Arguments:*
+		* ``manifest_file`` Json file to write, defaults to <item>_manifest.json in the folder of the first export
+
+	*Returns:*
+		* ``manifest_file`` Written file or None if nothing was exported
+	"""
+
+	if not manifest or not manifest['files']:
+		return None
+
+	for entry in manifest['files']:
+		finalize_export_manifest_file(entry)
+
+	if not manifest_file:
+		first_file = manifest['files'][0]['path']
+		item_name = manifest['item'] or os.path.splitext(os.path.basename(first_file))[0]
+		manifest_file = os.path.join(os.path.dirname(first_file), '{0}_manifest.json'.format(item_name))
+
+	data = dict(manifest)
+	data['duration'] = time.time() - data.pop('start_time')
+	with open(manifest_file, 'w') as f:
+		json.dump(data, f, indent=4, sort_keys=True)
+	return manifest_file
+
+
+def write_export_manifest_async(manifest, manifest_file=None):
+	"""
+	Write an export manifest from a background thread so the ui is not held up by post processing
+
+	*Arguments:*
+		* ``manifest`` Manifest from new_export_manifest
+
 	*Keyword Arguments:*
+		* ``manifest_file`` Json file to write
+
+	*Returns:*
+		* ``Thread`` The running thread
+	"""
+
+	thread = threading.Thread(target=write_export_manifest, args=(manifest,), kwargs={'manifest_file':manifest_file}, name='rh_export_manifest')
+	thread.start()
+	return thread
+
+
+def export_weapon(item_type='Weapon', exclude=None, manifest=None):
+	"""
+	Export a weapon model/rig
+
+	*Arguments:*
 		* ``None`` 
 
+	*Keyword Arguments:*
+		* ``exclude``  Meshes under the MESH_ group to leave out of the export, (attachments)
+		* ``manifest`` Export manifest to record the exported file in
+
 	*Returns:*
 		* ``None`` 
 
@@ -223,6 +419,7 @@ def export_weapon(item_type='Weapon'):
 
 	error_msg = ''
 	debug = False
+	start_time = time.time()
 
 	old_selection = pymel.ls(sl = True)
 
@@ -328,71 +525,64 @@ def export_weapon(item_type='Weapon'):
 	skinned_joints = {}	
 	all_materials = []
 	non_skinned_meshes = False
-
-	pymel.select(weapon_mesh, replace=True)
+	exclude_meshes = []
 
 	# clean off unicode starting characters
 	weapon_mesh = str( weapon_mesh )
 	if not weapon_mesh.startswith( 'MESH' ) and not weapon_mesh == 'MESH':		
 		# handle a single mesh selected weapon
-		skincluster = mel.eval( 'findRelatedSkinCluster {0};'.format( weapon_mesh_name ) )	
-		if skincluster:	
-			# check if it's a skinCluster
-			if cmds.nodeType(skincluster) != 'skinCluster':
-				error_msg = 'The mesh does not have a valid skinCluster!\nWeapon Mesh: {0}'.format( weapon_mesh )
-				return False, error_msg
-		else:
+		skin_map = rh_maya_rigging.get_skin_influence_map(meshes=[py_weapon_mesh])
+		if not skin_map.get(py_weapon_mesh.longName()):
 			error_msg = 'The mesh does not have a skinCluster!'
 			return False, error_msg
 	else:		
-		meshes = pymel.ls( py_weapon_mesh, dag = True, type = 'transform', shapes = False)
+		# one pass over the skinClusters for every mesh under the export group
+		skin_map = rh_maya_rigging.get_skin_influence_map(root=py_weapon_mesh)
+
+		# leave out excluded meshes without moving them out of the hierarchy
+		if exclude:
+			exclude_meshes = pymel.ls(exclude, dag=True, type='transform')
+			for mesh in exclude_meshes:
+				skin_map.pop(mesh.longName(), None)
 
 		# make sure all meshes are skinned under the export group		
-		for mesh in meshes:			
-			mesh_shape = mesh.listRelatives(s=True, ni=True)
-			if mesh_shape:				
-				pymel.select( mesh, replace = True )
-				skincluster = mesh.listHistory(type="skinCluster")
-				if not skincluster:
-					non_skinned_meshes = True
-					error_msg += ' ' + mesh.nodeName() + '\n'					
+		for mesh_name, skin_info in sorted(skin_map.iteritems()):
+			if not skin_info:
+				non_skinned_meshes = True
+				error_msg += ' ' + mesh_name.split('|')[-1] + '\n'					
 
 		# return if unskinned meshes were found
 		if non_skinned_meshes:			 
 			error_pre = 'You have non-skinned meshes in your export group. Please fix or remove them.\n\n' + error_msg
 			return False, error_pre
 
-		renamed_shading_grps = []
-		for mesh in meshes:
-			# make sure the transform has shapes
-			if mesh.getShapes():
-				pymel.select( mesh, replace = True )		
-				skincluster = mesh.listHistory(type="skinCluster")
-				if skincluster:
+		for mesh_name, skin_info in sorted(skin_map.iteritems()):
 
-					# store off the mesh piece to export
-					if not mesh in weapon_meshes:
-						weapon_meshes.append(mesh)
+			# store off the mesh piece to export
+			mesh = pymel.PyNode(mesh_name)
+			if not mesh in weapon_meshes:
+				weapon_meshes.append(mesh)
 
-					# get the influence members# get the influence members
-					influences = rh_maya_rigging.get_skincluster_influences(mesh)
-					if len(influences) == 0:						
-						error_msg = 'No influence objects found in the skinCluster!\n Mesh: {0}\n SkinCluster: {1}'.format( mesh_name, skincluster )
-						print error_msg
+			# get the influence members
+			if not skin_info['influences']:
+				error_msg = 'No influence objects found in the skinCluster!\n Mesh: {0}\n SkinCluster: {1}'.format( mesh.nodeName(), skin_info['skincluster'] )
+				print error_msg
 
-					else:
-						for infl in influences:
-							if not pymel.nodeType( infl ) == 'joint':
-								print 'WARNING!! Influence is not a joint!\nInfluence: {0}'.format( infl )
-							else:
-								skinned_joints[ infl ] = skincluster[0]
+			for infl in skin_info['other_influences']:
+				print 'WARNING!! Influence is not a joint!\nInfluence: {0}'.format( infl )
+
+			for infl in skin_info['influences']:
+				skinned_joints[ pymel.PyNode(infl) ] = skin_info['skincluster']
+
+	timings = {'validation':time.time() - start_time}
+	phase_time = time.time()
 
 	# get a list of the export bones	
 	# base bones, bones that are skinned and bones that are constrained to be animated
 	export_objects = []
 
 	# weapon_base bones
-	base_bones = ['weapon_root','weapon_grip','weapon_mag','weapon_muzzle_flash','weapon_secondary_grip','weapon_trigger']
+	base_bones = rh_maya_rig_spec.get_item_rig_spec(item_type)['export_bones']
 	for bone in base_bones:
 		if not cmds.objExists(bone):
 			continue
@@ -476,10 +666,19 @@ def export_weapon(item_type='Weapon'):
 			print '  {0}'.format( obj )		
 		print ' Meshes:'
 	
+	# selecting a parent group would pull the excluded meshes back into the export
+	select_meshes = weapon_meshes
+	if exclude_meshes:
+		exclude_parents = set()
+		for mesh in exclude_meshes:
+			exclude_parents.update(mesh.getAllParents())
+		select_meshes = [mesh for mesh in weapon_meshes if not mesh in exclude_parents]
+
 	# select meshes for export
-	for mesh in weapon_meshes:
-		pymel.select( weapon_meshes, add = True )
-		if debug: print '  {0}'.format( mesh )
+	pymel.select( select_meshes, add = True )
+	if debug:
+		for mesh in select_meshes:
+			print '  {0}'.format( mesh )
 
 	if debug: print '\n'
 
@@ -503,11 +702,16 @@ def export_weapon(item_type='Weapon'):
 	                }
 
 	set_fbx_options(custom_dict=fbx_options)	
+	timings['selection'] = time.time() - phase_time
+	phase_time = time.time()
+	# a background prune of the last export of this file still reads it
+	rh_maya_fbx.wait_for_fbx_prune(weapon_export_file)
 	try:
 		pymel.mel.FBXExport( f= weapon_export_file, s=True ) #@UndefinedVariable
 	except:
 		error_msg = 'Error running FBX Export!\nCheck path for invalid characters.\nThe file may also not be getting checked out.\n\nPath: {0}'.format( weapon_export_file )
 		return False, error_msg
+	timings['fbx_write'] = time.time() - phase_time
 
 	# mark the export file for add	
 	# Perforce Add Operation	
@@ -519,19 +723,17 @@ def export_weapon(item_type='Weapon'):
 	# Process FBX File to Clean out objects we dont need
 	# See my blog post on how to Post Process FBX files after exporting them
 	# https://techanimator.blogspot.com/2017/04/flexible-fbx-with-fbx-python-sdk.html
-	#for mesh in weapon_meshes:		
-		#export_objects.append( mesh )
-	#print '\n-Cleaning {0} FBX-'.format(item_type)
-	#update_weapon_fbx = Fbx_Scene.update_weapon_scene(weapon_export_file, export_objects)
-	#if not update_weapon_fbx:
-		#error_msg = 'Error running FBX {0} Update\nPath: {1}'.format( item_type, weapon_export_file )
-		#return False, error_msg
+	export_names = rh_maya_fbx.get_fbx_keep_names(export_objects + weapon_meshes)
+	export_names += list(set([str(skincluster) for skincluster in skinned_joints.values()]))
+	post_process = rh_maya_fbx.prune_ascii_fbx_async(weapon_export_file, export_names)
+	add_export_manifest_file(manifest, weapon_export_file, meshes=weapon_meshes, bones=export_objects,
+	                         influences=skinned_joints.keys(), timings=timings, post_process=post_process)
 
 	export_status = '\n{0} Exported:\n{1}'.format( item_type, weapon_export_file )
 	return True, export_status
 
 
-def export_weapon_prep(quiet=False, item_type='Weapon'):
+def export_weapon_prep(quiet=False, item_type='Weapon', exclude=None, manifest=None):
 	"""
 	Based on the objects selected determine how to export the weapon or weapon parts
 
@@ -539,7 +741,9 @@ def export_weapon_prep(quiet=False, item_type='Weapon'):
 		* ``None`` 
 
 	*Keyword Arguments:*
-		* ``None`` 
+		* ``exclude``  Meshes to leave out of the export, (attachments)
+		* ``manifest`` Export manifest to record the exported files in,
+		  when not given a manifest is written next to the exported files
 
 	*Returns:*
 		* ``None`` 
@@ -550,6 +754,10 @@ def export_weapon_prep(quiet=False, item_type='Weapon'):
 
 	selection = pymel.ls( sl = True )
 
+	write_manifest = manifest is None
+	if write_manifest:
+		manifest = new_export_manifest(item_type=item_type)
+
 	# Try to find a singular weapon MESH
 	if len( selection ) == 0:
 		meshes = pymel.ls('MESH_*')
@@ -608,25 +816,31 @@ def export_weapon_prep(quiet=False, item_type='Weapon'):
 	# export each weapon selection	
 	for parent, children in parents.iteritems():
 		if parent.startswith('MESH_PARTS_'):
+			skin_map = rh_maya_rigging.get_skin_influence_map(meshes=children)
 			for child in children:
-				do_export, return_msg = export_weapon_part(child, parent)				
+				if exclude and child in exclude:
+					continue
+				do_export, return_msg = export_weapon_part(child, parent, manifest=manifest, skin_map=skin_map)				
 				log_export += return_msg + '\n'				
 		else:
 			pymel.select(parent)
-			do_export, return_msg = export_weapon(item_type=item_type)
+			do_export, return_msg = export_weapon(item_type=item_type, exclude=exclude, manifest=manifest)
 			log_export += return_msg + '\n'
 
 	#return_msg = 'Nothing valid was selected to export.'
 	if do_export == None:
 		log_export = 'Nothing was selected to export!'
 
+	if write_manifest:
+		write_export_manifest_async(manifest)
+
 	if not quiet:
 		cmds.confirmDialog( t='{0} Export: Status'.format(item_type) , m=log_export, b='OK' )
 
 	return True, log_export
 
 
-def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_mesh=False):
+def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_mesh=False, manifest=None, skin_map=None):
 	"""
 	Export chunks of weapon parts into different fbx files
 
@@ -635,7 +849,8 @@ def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_m
 		* ``parent`` Mesh objects parent Group "MESH_PARTS_"
 
 	*Keyword Arguments:*
-		* ``None`` 
+		* ``manifest`` Export manifest to record the exported file in
+		* ``skin_map`` Shared result of get_skin_influence_map, gathered for the mesh if not given
 
 	*Returns:*
 		* ``None`` 
@@ -646,6 +861,8 @@ def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_m
 
 	old_selection = cmds.ls(sl=True)	
 	debug = False
+	start_time = time.time()
+	influences = []
 
 	# save channels for moving and resetting	
 	stored_channels = {}	
@@ -680,16 +897,20 @@ def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_m
 	export_objects = [parent, weapon_mesh]		
 
 	# clean off unicode starting characters
+	weapon_mesh_long = cmds.ls(str(weapon_mesh), long=True)[0]
 	weapon_mesh = str(weapon_mesh)
 
-	# select the weapon_mesh
-	cmds.select(weapon_mesh, replace=True)	
-
 	# determine if this is a skinned mesh or static mesh		
-	skincluster = mel.eval( 'findRelatedSkinCluster {0};'.format( weapon_mesh ) )	
-	if skincluster:		
+	if skin_map is None or not weapon_mesh_long in skin_map:
+		skin_map = rh_maya_rigging.get_skin_influence_map(meshes=[weapon_mesh_long])
+	skin_info = skin_map.get(weapon_mesh_long)
+	skincluster = None
+	if skin_info:		
 		# get the influence members
-		influences = cmds.skinCluster(skincluster, q = True, inf = True)
+		skincluster = skin_info['skincluster']
+		influences = skin_info['influences']
+		for infl in skin_info['other_influences']:
+			print 'Warning!! Influence is not a joint!\nInfluence: {0}'.format( infl )
 		if len(influences) == 0:						
 			error_msg = 'No influence objects found in the skinCluster!\n Mesh: {0}\n SkinCluster: {1}'.format( weapon_mesh, skincluster )
 			print error_msg		
@@ -698,15 +919,13 @@ def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_m
 			base_bones = ['weapon_root','weapon_grip']
 			for bone in base_bones:
 				if cmds.objExists( bone ):
+					bone = cmds.ls( bone, long = True )[0]
 					export_objects.append( bone )
 					export_names.append( bone )
 
 			for infl in influences:
-				if not cmds.nodeType( infl ) == 'joint':
-					print 'Warning!! Influence is not a joint!\nInfluence: {0}'.format( infl )
-				else:
-					export_objects.append( infl )
-					export_names.append( infl )
+				export_objects.append( infl )
+				export_names.append( infl )
 	else:
 		is_static_mesh = True
 
@@ -719,55 +938,448 @@ def export_weapon_part(weapon_mesh, parent, weapon_export_file=None, is_static_m
 			if not value == 1:
 				return False, '\n FAILED: Your mesh has improper scale values. You must Freeze Transformations!\n Mesh: {0}'.format( weapon_mesh )
 
-		# store then zero out the translation values
-		pymel.setAttr( weapon_mesh + '.v', lock = False, keyable = False, cb = True )
-		channels = ['.tx','.ty','.tz','.rx','.ry','.rz']
-		for attr in channels:			
-			locked = pymel.getAttr( weapon_mesh + attr, lock = True)			
-			value = pymel.getAttr( weapon_mesh + attr )
-			locked = pymel.setAttr( weapon_mesh + attr, lock = False)
-			stored_channels[ attr ] = value
-			if not '.s' in attr:
-				pymel.setAttr( weapon_mesh + attr, 0.0 )
+	try:
+		if is_static_mesh:
+			# store then zero out the translation values
+			pymel.setAttr( weapon_mesh + '.v', lock = False, keyable = False, cb = True )
+			channels = ['.tx','.ty','.tz','.rx','.ry','.rz']
+			for attr in channels:			
+				locked = pymel.getAttr( weapon_mesh + attr, lock = True)			
+				value = pymel.getAttr( weapon_mesh + attr )
+				locked = pymel.setAttr( weapon_mesh + attr, lock = False)
+				stored_channels[ attr ] = value
+				if not '.s' in attr:
+					pymel.setAttr( weapon_mesh + attr, 0.0 )
+
+			# rotation values should also be zero
+			# check rotation values
+
+		timings = {'validation':time.time() - start_time}
+		phase_time = time.time()
+
+		# select for export
+		export_objects = list(set(export_objects))
+		export_names = list(set(export_names))
+		pymel.select( clear = True )
+		pymel.select( export_objects )
+		pymel.select( weapon_mesh, add = True )
+
+		# print selected
+		export_selection = cmds.ls( sl = True )
+		if debug:
+			print 'Exporting Selection'
+			for obj in export_selection:
+				print ' {0}'.format( obj )
+
+		# EXPORT
+		set_fbx_options()
+		timings['selection'] = time.time() - phase_time
+		phase_time = time.time()
+		# a background prune of the last export of this file still reads it
+		rh_maya_fbx.wait_for_fbx_prune(weapon_export_file)
+		try:
+			pymel.mel.FBXExport( f= weapon_export_file, s=True ) #@UndefinedVariable
+		except:
+			error_msg = 'Error running FBX Export!\nCheck path for invalid characters.\nThe file may also not be getting checked out.\n\nPath: {0}'.format( weapon_export_file )
+			return False, error_msg
+		timings['fbx_write'] = time.time() - phase_time
 
-		# rotation values should also be zero
-		# check rotation values
+		# select original selection
+		pymel.select( clear = True )
+		pymel.select( old_selection )
+	finally:
+		# reset static mesh channels, also when the export fails
+		for attr, value in stored_channels.iteritems():
+			pymel.setAttr( weapon_mesh + attr, value )
 
-	# select for export
-	export_objects = list(set(export_objects))
-	export_names = list(set(export_names))
-	pymel.select( clear = True )
-	pymel.select( export_objects )
-	pymel.select( weapon_mesh, add = True )
+	# Process FBX File to Clean out objects we dont need
+	if skincluster:
+		export_names.append(skincluster)
+	post_process = rh_maya_fbx.prune_ascii_fbx_async(weapon_export_file, rh_maya_fbx.get_fbx_keep_names(export_names))
+	add_export_manifest_file(manifest, weapon_export_file, meshes=[weapon_mesh], bones=[obj for obj in export_objects if cmds.nodeType(str(obj)) == 'joint'],
+	                         influences=influences, timings=timings, post_process=post_process)
 
-	# print selected
-	export_selection = cmds.ls( sl = True )
-	if debug:
-		print 'Exporting Selection'
-		for obj in export_selection:
-			print ' {0}'.format( obj )
+	return True, '\n{0}'.format( weapon_export_file )
 
-	# EXPORT
-	set_fbx_options()
+def get_attachment_export_matrix(mesh, bone):
+	"""
+	Compute the matrix that places an attachment mesh relative to its bone for export.
+	The mesh keeps its world orientation and is offset so the bone position sits at the origin.
+
+	*Arguments:*
+		* ``mesh`` Attachment mesh transform
+		* ``bone`` Bone the attachment is placed relative to
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``MMatrix`` Object space to export space matrix
+	"""
+
+	mesh_matrix = cmds.xform(str(mesh), q=True, ws=True, m=True)
+	bone_position = cmds.xform(str(bone), q=True, ws=True, t=True)
+	for index in range(3):
+		mesh_matrix[12 + index] -= bone_position[index]
+
+	matrix = openMaya.MMatrix()
+	openMaya.MScriptUtil.createMatrixFromList(mesh_matrix, matrix)
+	return matrix
+
+
+def create_static_attachment_mesh(mesh, bone):
+	"""
+	Build a standalone copy of a static attachment outside of the rig for export.
+	The geometry is computed from the source mesh and its bone, nothing in the rig hierarchy is touched.
+
+	*Arguments:*
+		* ``mesh`` Attachment mesh transform
+		* ``bone`` Bone the attachment is placed relative to
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``export_group`` Temporary MESH_ group at the world root, delete after export
+		* ``export_mesh``  Temporary mesh transform under the export group
+	"""
+
+	mesh = pymel.PyNode(mesh)
+	source_shape = mesh.getShape()
+	if not source_shape:
+		return None, None
+
+	# group and transform named like the attachment, under the world instead of the rig
+	fn_transform = openMaya.MFnTransform()
+	group_obj = fn_transform.create()
+	fn_transform.setName('MESH_' + mesh.nodeName())
+	export_group = fn_transform.fullPathName()
+	export_obj = fn_transform.create(group_obj)
+	fn_transform.setName(mesh.nodeName())
+	export_mesh = fn_transform.fullPathName()
+
+	sel_list = openMaya.MSelectionList()
+	sel_list.add(source_shape.longName())
+	source_path = openMaya.MDagPath()
+	sel_list.getDagPath(0, source_path)
+
+	# copy the evaluated mesh and bake the export space into the points
+	fn_mesh = openMaya.MFnMesh()
+	fn_mesh.copy(source_path.node(), export_obj)
+	fn_mesh.setName(source_shape.nodeName())
+	points = openMaya.MPointArray()
+	openMaya.MFnMesh(source_path).getPoints(points, openMaya.MSpace.kObject)
+	matrix = get_attachment_export_matrix(mesh, bone)
+	for index in xrange(points.length()):
+		points.set(points[index] * matrix, index)
+	fn_mesh.setPoints(points, openMaya.MSpace.kObject)
+	export_shape = fn_mesh.fullPathName()
+
+	# assign the same shading groups, face indices match the source mesh
+	shading_groups = list(set(cmds.listConnections(source_shape.longName(), type='shadingEngine') or []))
+	source_names = [source_shape.longName(), mesh.longName()]
+	for shading_group in shading_groups:
+		for member in cmds.sets(shading_group, q=True) or []:
+			member_obj = cmds.ls(member, objectsOnly=True, long=True)
+			if not member_obj or not member_obj[0] in source_names:
+				continue
+			if '.' in member:
+				cmds.sets(export_shape + '.' + member.split('.', 1)[-1], e=True, forceElement=shading_group)
+			else:
+				cmds.sets(export_shape, e=True, forceElement=shading_group)
+
+	return export_group, export_mesh
+
+
+def export_attachment(mesh, export_file, bone=None, is_static_mesh=False, manifest=None, skin_map=None):
+	"""
+	Export an attachment into its own fbx file without modifying the item rig.
+	Skinned attachments are exported in place with their influences,
+	static attachments are exported from a computed copy placed relative to their bone.
+	Temporary nodes are built and removed with undo recording suspended.
+
+	*Arguments:*
+		* ``mesh``        Attachment mesh transform
+		* ``export_file`` Fbx file to write
+
+	*Keyword Arguments:*
+		* ``bone``           Bone a static attachment is placed relative to
+		* ``is_static_mesh`` Export the mesh as a static mesh
+		* ``manifest``       Export manifest to record the exported file in
+		* ``skin_map``       Shared result of get_skin_influence_map, gathered for the mesh if not given
+
+	*Returns:*
+		* ``Bool``    If the export succeeded
+		* ``message`` Exported file or error message
+	"""
+
+	if not export_file:
+		return False, 'Failed to generate the attachment export file'
+
+	start_time = time.time()
+	export_dir = os.path.dirname(export_file)
+	if export_dir and not os.path.lexists(export_dir):
+		try:
+			os.makedirs(export_dir)
+		except:
+			pass
+
+	# make sure the path is valid
 	try:
-		pymel.mel.FBXExport( f= weapon_export_file, s=True ) #@UndefinedVariable
+		can_export, error_msg = can_write_file(export_file)
 	except:
-		error_msg = 'Error running FBX Export!\nCheck path for invalid characters.\nThe file may also not be getting checked out.\n\nPath: {0}'.format( weapon_export_file )
+		can_export = False
+		error_msg = 'Failed to validate export file with Perforce.'
+
+	if not can_export:
 		return False, error_msg
 
-	# select original selection
-	pymel.select( clear = True )
-	pymel.select( old_selection )
+	mesh = pymel.PyNode(mesh)
+	export_objects = []
+	influences = []
+	if skin_map is None or not mesh.longName() in skin_map:
+		skin_map = rh_maya_rigging.get_skin_influence_map(meshes=[mesh])
+	skin_info = skin_map.get(mesh.longName())
+	skincluster = skin_info['skincluster'] if skin_info else None
+	if skincluster and not is_static_mesh:
+		influences = skin_info['influences']
+		if not influences:
+			print 'No influence objects found in the skinCluster!\n Mesh: {0}\n SkinCluster: {1}'.format(mesh.nodeName(), skincluster)
+		for bone_name in ['weapon_root', 'weapon_grip']:
+			if cmds.objExists(bone_name):
+				export_objects.append(cmds.ls(bone_name, long=True)[0])
+		for infl in skin_info['other_influences']:
+			print 'Warning!! Influence is not a joint!\nInfluence: {0}'.format(infl)
+		for infl in influences:
+			if not infl in export_objects:
+				export_objects.append(infl)
+
+		# select the mesh alone, selecting its parent group would export the other item meshes
+		export_objects.append(mesh.longName())
+	else:
+		is_static_mesh = True
+		if not bone:
+			return False, '\n FAILED: A primary bone was not found for this attachment!\n Mesh: {0}'.format(mesh.nodeName())
 
-	# reset static mesh channels
-	if is_static_mesh:
-		for attr, value in stored_channels.iteritems():			
-			pymel.setAttr( weapon_mesh + attr, value )	
+	timings = {'validation':time.time() - start_time}
+	phase_time = time.time()
+
+	old_selection = cmds.ls(sl=True, long=True)
+	undo_state = cmds.undoInfo(q=True, state=True)
+	cmds.undoInfo(stateWithoutFlush=False)
+	export_group = None
+	try:
+		export_meshes = [mesh.longName()]
+		if is_static_mesh:
+			export_group, export_mesh = create_static_attachment_mesh(mesh, bone)
+			if not export_group:
+				return False, '\n FAILED: The attachment has no mesh shape!\n Mesh: {0}'.format(mesh.nodeName())
+			export_objects = [export_group, export_mesh]
+			export_meshes = [export_mesh]
+
+		cmds.select(export_objects, replace=True)
+		set_fbx_options()
+		timings['selection'] = time.time() - phase_time
+		phase_time = time.time()
+		# a background prune of the last export of this file still reads it
+		rh_maya_fbx.wait_for_fbx_prune(export_file)
+		try:
+			pymel.mel.FBXExport( f= export_file, s=True ) #@UndefinedVariable
+		except:
+			error_msg = 'Error running FBX Export!\nCheck path for invalid characters.\nThe file may also not be getting checked out.\n\nPath: {0}'.format( export_file )
+			return False, error_msg
+		timings['fbx_write'] = time.time() - phase_time
+
+		# Process FBX File to Clean out the skeleton and groups we dont need
+		post_process = None
+		if not is_static_mesh:
+			post_process = rh_maya_fbx.prune_ascii_fbx_async(export_file, rh_maya_fbx.get_fbx_keep_names(export_objects) + [skincluster])
+		add_export_manifest_file(manifest, export_file, meshes=export_meshes, bones=[obj for obj in export_objects if cmds.nodeType(obj) == 'joint'],
+		                         influences=influences, timings=timings, post_process=post_process)
+	finally:
+		if export_group and cmds.objExists(export_group):
+			cmds.delete(export_group)
+		cmds.select(clear=True)
+		if old_selection:
+			cmds.select(old_selection, replace=True)
+		cmds.undoInfo(stateWithoutFlush=undo_state)
+
+	return True, '\n{0}'.format( export_file )
+
+
+def get_mayapy_path():
+	"""
+	Get the mayapy executable of the running Maya
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``path`` Path to mayapy or None if it was not found
+	"""
+
+	maya_location = os.environ.get('MAYA_LOCATION')
+	if not maya_location:
+		return None
+
+	mayapy = os.path.join(maya_location, 'bin', 'mayapy')
+	if sys.platform.startswith('win'):
+		mayapy += '.exe'
+	if not os.path.isfile(mayapy):
+		return None
+	return mayapy
+
+
+def save_export_snapshot():
+	"""
+	Write the current scene to a temp file for export workers.
+	The open scene keeps its name and modified state.
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``snapshot_file`` Path of the scene snapshot
+	"""
+
+	temp_dir = tempfile.mkdtemp(prefix='rh_export_')
+	snapshot_file = os.path.join(temp_dir, 'export_snapshot.mb').replace('\\', '/')
+	cmds.file(snapshot_file, exportAll=True, type='mayaBinary', preserveReferences=True, force=True)
+	return snapshot_file
 
-	## Process FBX File to Clean out objects we dont need
-	#update_weapon_fbx = RHPython.Core.Py_Fbx.update_weapon_scene( weapon_export_file, export_names )	
-	#if not update_weapon_fbx:
-		#error_msg = 'Error running FBX Weapon Update\nPath: {0}'.format( weapon_export_file )
-		#return False, error_msg	
 
-	return True, '\n{0}'.format( weapon_export_file )
\ No newline at end of file
+def write_attachment_worker_jobs(snapshot_file, jobs, worker_count=4):
+	"""
+	Split attachment export jobs across workers and write a job file for each
+
+	*Arguments:*
+		* ``snapshot_file`` Scene snapshot the workers open
+		* ``jobs``          List of job dicts, {'mesh', 'file', 'bone', 'static'}
+
+	*Keyword Arguments:*
+		* ``worker_count`` Maximum number of workers
+
+	*Returns:*
+		* ``job_files`` List of job files, one per worker
+	"""
+
+	worker_count = max(1, min(worker_count, len(jobs)))
+	temp_dir = os.path.dirname(snapshot_file)
+	job_files = []
+	for index in range(worker_count):
+		worker_jobs = jobs[index::worker_count]
+		if not worker_jobs:
+			continue
+		job_file = os.path.join(temp_dir, 'export_jobs_{0}.json'.format(index)).replace('\\', '/')
+		with open(job_file, 'w') as f:
+			json.dump({'snapshot': snapshot_file, 'jobs': worker_jobs}, f)
+		job_files.append(job_file)
+
+	return job_files
+
+
+def get_attachment_worker_args(job_file):
+	"""
+	Get the mayapy arguments that run an attachment export worker
+
+	*Arguments:*
+		* ``job_file`` Job file written by write_attachment_worker_jobs
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``args`` List of arguments for mayapy
+	"""
+
+	module_path = os.path.dirname(os.path.abspath(__file__)).replace('\\', '/')
+	code = 'import sys; sys.path.insert(0, {0!r}); import maya.standalone; maya.standalone.initialize(name="python"); ' \
+	       'import rh_maya_export; rh_maya_export.run_attachment_worker({1!r})'.format(module_path, job_file)
+	return ['-c', code]
+
+
+def run_attachment_worker(job_file):
+	"""
+	Export attachments from a scene snapshot, runs inside a mayapy worker.
+	Each result is printed as a single json line so the UI can stream progress,
+	along with the export manifest entry of the written file.
+
+	*Arguments:*
+		* ``job_file`` Job file written by write_attachment_worker_jobs
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``None`` 
+	"""
+
+	with open(job_file, 'r') as f:
+		job_data = json.load(f)
+
+	if not cmds.pluginInfo('fbxmaya', q=True, loaded=True):
+		cmds.loadPlugin('fbxmaya')
+	cmds.file(job_data['snapshot'], open=True, force=True)
+
+	for job in job_data['jobs']:
+		result = {'mesh': job['mesh'], 'file': job['file'], 'success': False, 'message': '', 'manifest': None}
+		manifest = new_export_manifest()
+		try:
+			bone = job.get('bone')
+			if bone and not cmds.objExists(bone):
+				bone = None
+			result['success'], result['message'] = export_attachment(job['mesh'], job['file'], bone=bone, is_static_mesh=job.get('static', False), manifest=manifest)
+			if manifest['files']:
+				result['manifest'] = finalize_export_manifest_file(manifest['files'][0])
+		except Exception as e:
+			result['message'] = str(e)
+		sys.stdout.write(WORKER_RESULT_PREFIX + json.dumps(result) + '\n')
+		sys.stdout.flush()
+
+
+def parse_attachment_worker_output(line):
+	"""
+	Parse a line of attachment worker output
+
+	*Arguments:*
+		* ``line`` Line of text from the worker stdout
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``result`` Result dict {'mesh', 'file', 'success', 'message', 'manifest'} or None for non result lines
+	"""
+
+	line = line.strip()
+	if not line.startswith(WORKER_RESULT_PREFIX.strip()):
+		return None
+	try:
+		return json.loads(line[len(WORKER_RESULT_PREFIX.strip()):])
+	except ValueError:
+		return None
+
+
+def remove_export_snapshot(snapshot_file):
+	"""
+	Delete a scene snapshot and the worker job files written next to it
+
+	*Arguments:*
+		* ``snapshot_file`` Path returned by save_export_snapshot
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``None`` 
+	"""
+
+	temp_dir = os.path.dirname(snapshot_file)
+	if os.path.basename(temp_dir).startswith('rh_export_'):
+		shutil.rmtree(temp_dir, ignore_errors=True)
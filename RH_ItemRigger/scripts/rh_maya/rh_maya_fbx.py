@@ -0,0 +1,449 @@
+"""
+ASCII FBX Post Process Methods
+
+Streams an exported ascii fbx file line by line and removes the records
+we do not want in the game file, without loading the scene into memory.
+Written against the FBX 7.x ascii layout Maya exports.
+
+License: GNU General Public License v3.0
+"""
+
+import os
+import re
+import time
+import tempfile
+import threading
+
+import maya.cmds as cmds
+
+try:
+	import maya.utils as maya_utils
+except:
+	maya_utils = None
+
+
+# Model: 2035615392, "Model::weapon_root", "LimbNode" {
+RE_OBJECT_RECORD = re.compile(r'^\t(\w+): (-?\d+), "([^"]*)", "([^"]*)"')
+# C: "OO",2035615392,0
+RE_CONNECTION = re.compile(r'^(\s*)C: "(\w+)",(-?\d+),(-?\d+)(.*)$')
+RE_QUOTED = re.compile(r'"[^"]*"')
+RE_POSE_NODE_ID = re.compile(r'^\s*Node: (-?\d+)')
+RE_POSE_NODE_COUNT = re.compile(r'^(\s*NbPoseNodes: )\d+')
+
+# prunes running in the background, by normalized file path, see wait_for_fbx_prune
+PRUNE_THREADS = {}
+PRUNE_THREADS_LOCK = threading.Lock()
+
+
+def _get_brace_delta(line):
+	"""
+	Get the change in record depth for a line of an ascii fbx file
+
+	*Arguments:*
+		* ``line`` Line of the fbx file
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``int`` Opened minus closed braces outside of strings and comments
+	"""
+
+	stripped = line.lstrip()
+	if stripped.startswith(';'):
+		return 0
+	stripped = RE_QUOTED.sub('', stripped)
+	return stripped.count('{') - stripped.count('}')
+
+
+def _get_record_name(name):
+	"""
+	Strip the fbx class prefix from a record name, "Model::weapon_root" > "weapon_root"
+
+	*Arguments:*
+		* ``name`` Fbx record name
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``name`` Node name
+	"""
+
+	return name.split('::', 1)[-1]
+
+
+def _filter_pose_record(lines, removed_ids):
+	"""
+	Remove pose nodes that point at removed models from a buffered Pose record
+
+	*Arguments:*
+		* ``lines``       Lines of the pose record
+		* ``removed_ids`` Ids of removed records
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``lines`` Filtered lines
+	"""
+
+	filtered = []
+	pose_node = None
+	depth = 0
+	num_pose_nodes = 0
+	for line in lines:
+		if pose_node is None and depth == 1 and line.strip().startswith('PoseNode:'):
+			pose_node = []
+		if pose_node is not None:
+			pose_node.append(line)
+			depth += _get_brace_delta(line)
+			if depth == 1:
+				node_id = None
+				for node_line in pose_node:
+					match = RE_POSE_NODE_ID.match(node_line)
+					if match:
+						node_id = match.group(1)
+						break
+				if not node_id in removed_ids:
+					filtered.extend(pose_node)
+					num_pose_nodes += 1
+				pose_node = None
+			continue
+		filtered.append(line)
+		depth += _get_brace_delta(line)
+
+	for index, line in enumerate(filtered):
+		match = RE_POSE_NODE_COUNT.match(line)
+		if match:
+			filtered[index] = '{0}{1}\n'.format(match.group(1), num_pose_nodes)
+			break
+
+	return filtered
+
+
+def _read_fbx_graph(fbx_file):
+	"""
+	Read the object records and connections of an ascii fbx file, ids only
+
+	*Arguments:*
+		* ``fbx_file`` Ascii fbx file
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``objects``     Dict of record id to (record type, record name)
+		* ``connections`` List of (connection type, child id, parent id)
+	"""
+
+	objects = {}
+	connections = []
+	section = None
+	depth = 0
+	with open(fbx_file, 'r') as source:
+		for line in source:
+			delta = _get_brace_delta(line)
+			if depth == 0:
+				if delta > 0:
+					section = line.split(':', 1)[0].strip()
+			elif depth == 1 and section == 'Objects':
+				match = RE_OBJECT_RECORD.match(line)
+				if match:
+					record_type, record_id, record_name, record_class = match.groups()
+					objects[record_id] = (record_type, record_name)
+			elif section == 'Connections':
+				match = RE_CONNECTION.match(line)
+				if match:
+					connections.append(match.group(2, 3, 4))
+			depth += delta
+	return objects, connections
+
+
+def get_fbx_removed_ids(objects, connections, keep_names):
+	"""
+	Get the records to remove from an fbx file.
+	Models are removed when they and all of their descendants are not kept, so kept models
+	never lose a parent or its transform. Named deformers that are not kept are removed,
+	then every record whose connections all lead to removed records, (geometry, node attributes,
+	materials, sub deformers), is removed with them.
+
+	*Arguments:*
+		* ``objects``     Dict of record id to (record type, record name), from _read_fbx_graph
+		* ``connections`` List of (connection type, child id, parent id), from _read_fbx_graph
+		* ``keep_names``  Names of the nodes to keep
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``removed_ids`` Set of record ids
+	"""
+
+	keep = set([str(name).split('|')[-1] for name in keep_names])
+	parents = {}
+	for connection_type, child_id, parent_id in connections:
+		parents.setdefault(child_id, set()).add(parent_id)
+
+	# kept models and every model above them stay
+	kept_models = set()
+	for record_id, (record_type, record_name) in objects.iteritems():
+		if record_type != 'Model' or not _get_record_name(record_name) in keep:
+			continue
+		stack = [record_id]
+		while stack:
+			model_id = stack.pop()
+			if model_id in kept_models:
+				continue
+			kept_models.add(model_id)
+			stack.extend([parent_id for parent_id in parents.get(model_id, []) if objects.get(parent_id, ('',))[0] == 'Model'])
+
+	removed_ids = set()
+	for record_id, (record_type, record_name) in objects.iteritems():
+		name = _get_record_name(record_name)
+		if record_type == 'Model' and not record_id in kept_models:
+			removed_ids.add(record_id)
+		elif record_type == 'Deformer' and record_name.startswith('Deformer::') and name and not name in keep:
+			removed_ids.add(record_id)
+
+	# records only connected to removed records are orphans
+	changed = True
+	while changed:
+		changed = False
+		for record_id, (record_type, record_name) in objects.iteritems():
+			if record_id in removed_ids or record_type in ('Model', 'Pose') or _get_record_name(record_name) in keep:
+				continue
+			record_parents = parents.get(record_id)
+			if record_parents and record_parents <= removed_ids:
+				removed_ids.add(record_id)
+				changed = True
+
+	return removed_ids
+
+
+def prune_ascii_fbx(fbx_file, keep_names, output_file=None):
+	"""
+	Remove Model and Deformer records that are not in the keep list from an ascii fbx file,
+	along with the records only they use and every connection to them, see get_fbx_removed_ids.
+	Models with kept descendants are kept. Bind pose entries of removed models are dropped.
+
+	The file is read twice, once for the ids and connections and once to write it,
+	the output goes to a unique temp file next to it first.
+
+	*Arguments:*
+		* ``fbx_file``   Ascii fbx file to process
+		* ``keep_names`` Names of the nodes to keep, (export_names)
+
+	*Keyword Arguments:*
+		* ``output_file`` File to write, the fbx file is replaced if not given
+
+	*Returns:*
+		* ``Bool``    If the file was processed
+		* ``message`` Status or error message
+	"""
+
+	if not os.path.isfile(fbx_file):
+		return False, 'The fbx file does not exist: {0}'.format(fbx_file)
+
+	with open(fbx_file, 'r') as source:
+		if not source.readline().startswith('; FBX'):
+			return False, 'The fbx file is not ascii and was not processed: {0}'.format(fbx_file)
+
+	objects, connections = _read_fbx_graph(fbx_file)
+	removed_ids = get_fbx_removed_ids(objects, connections, keep_names)
+
+	handle, temp_file = tempfile.mkstemp(suffix='.prune', prefix=os.path.basename(fbx_file) + '.', dir=os.path.dirname(os.path.abspath(fbx_file)))
+	os.close(handle)
+	try:
+		with open(fbx_file, 'r') as source:
+			with open(temp_file, 'w') as target:
+				section = None
+				depth = 0
+				skip_depth = None
+				pose_lines = None
+				pending_comment = None
+
+				for line in source:
+					delta = _get_brace_delta(line)
+
+					# top level sections
+					if depth == 0:
+						if delta > 0:
+							section = line.split(':', 1)[0].strip()
+						target.write(line)
+						depth += delta
+						continue
+
+					if section == 'Objects':
+
+						# inside a removed record
+						if skip_depth is not None:
+							depth += delta
+							if depth <= skip_depth:
+								skip_depth = None
+							continue
+
+						# buffer bind poses until they can be filtered
+						if pose_lines is not None:
+							pose_lines.append(line)
+							depth += delta
+							if depth == 1:
+								target.writelines(_filter_pose_record(pose_lines, removed_ids))
+								pose_lines = None
+							continue
+
+						if depth == 1:
+							match = RE_OBJECT_RECORD.match(line)
+							if match:
+								record_type, record_id = match.group(1, 2)
+								if record_type == 'Pose' and delta > 0:
+									pose_lines = [line]
+									depth += delta
+									continue
+								if record_id in removed_ids:
+									if delta > 0:
+										skip_depth = depth
+										depth += delta
+									continue
+
+						target.write(line)
+						depth += delta
+						continue
+
+					if section == 'Connections':
+						if line.lstrip().startswith(';'):
+							pending_comment = line
+							continue
+
+						match = RE_CONNECTION.match(line)
+						if match:
+							comment = pending_comment
+							pending_comment = None
+							if match.group(3) in removed_ids or match.group(4) in removed_ids:
+								continue
+							if comment:
+								target.write(comment)
+							target.write(line)
+							continue
+
+						if pending_comment and line.strip():
+							target.write(pending_comment)
+							pending_comment = None
+
+					target.write(line)
+					depth += delta
+
+		if output_file:
+			if os.path.isfile(output_file):
+				os.remove(output_file)
+			os.rename(temp_file, output_file)
+		else:
+			os.remove(fbx_file)
+			os.rename(temp_file, fbx_file)
+	finally:
+		if os.path.isfile(temp_file):
+			os.remove(temp_file)
+
+	return True, 'Removed {0} records from: {1}'.format(len(removed_ids), output_file or fbx_file)
+
+
+def wait_for_fbx_prune(fbx_file):
+	"""
+	Wait for a background prune of a file to finish, call this before exporting over the file
+
+	*Arguments:*
+		* ``fbx_file`` Fbx file
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	with PRUNE_THREADS_LOCK:
+		thread = PRUNE_THREADS.get(os.path.normcase(os.path.abspath(fbx_file)))
+	if thread and not thread is threading.current_thread():
+		thread.join()
+
+
+def prune_ascii_fbx_async(fbx_file, keep_names, output_file=None):
+	"""
+	Run prune_ascii_fbx in a background thread so the export returns right away.
+	Failures are reported as warnings once Maya is idle.
+
+	*Arguments:*
+		* ``fbx_file``   Ascii fbx file to process
+		* ``keep_names`` Names of the nodes to keep, (export_names)
+
+	*Keyword Arguments:*
+		* ``output_file`` File to write, the fbx file is replaced if not given
+
+	*Returns:*
+		* ``Thread`` The running thread, join it to wait for the file.
+		  After the join, ``thread.result`` holds the (Bool, message) result and ``thread.duration`` the seconds taken
+	"""
+
+	keep_names = [str(name) for name in keep_names]
+	paths = [os.path.normcase(os.path.abspath(path)) for path in set([fbx_file, output_file or fbx_file])]
+
+	# a prune of the same file has to finish before this one reads it
+	for path in paths:
+		wait_for_fbx_prune(path)
+
+	def run():
+		start_time = time.time()
+		try:
+			processed, message = prune_ascii_fbx(fbx_file, keep_names, output_file=output_file)
+		except Exception as e:
+			processed, message = False, 'Error processing fbx file: {0}\n{1}'.format(fbx_file, e)
+		thread.result = (processed, message)
+		thread.duration = time.time() - start_time
+		with PRUNE_THREADS_LOCK:
+			for path in paths:
+				if PRUNE_THREADS.get(path) is thread:
+					del PRUNE_THREADS[path]
+		if not processed:
+			if maya_utils:
+				maya_utils.executeDeferred(cmds.warning, message)
+			else:
+				print message
+
+	thread = threading.Thread(target=run, name='rh_prune_fbx')
+	thread.result = None
+	thread.duration = 0.0
+	with PRUNE_THREADS_LOCK:
+		for path in paths:
+			PRUNE_THREADS[path] = thread
+	thread.start()
+	return thread
+
+
+def get_fbx_keep_names(objects):
+	"""
+	Get the names to keep when pruning an exported fbx file.
+	Parent joints of kept joints are added so the skeleton keeps its local transforms.
+
+	*Arguments:*
+		* ``objects`` Exported nodes to keep
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``names`` List of node names
+	"""
+
+	names = set()
+	for obj in objects:
+		obj = str(obj)
+		if not cmds.objExists(obj):
+			continue
+		names.add(obj.split('|')[-1])
+		if cmds.nodeType(obj) == 'joint':
+			parent = cmds.listRelatives(obj, parent=True, fullPath=True)
+			while parent and cmds.nodeType(parent[0]) == 'joint':
+				names.add(parent[0].split('|')[-1])
+				parent = cmds.listRelatives(parent[0], parent=True, fullPath=True)
+
+	return sorted(names)
@@ -7,15 +7,31 @@ License: GNU General Public License v3.0
 
 import os
 import re
+import sys
 import collections
 import time
+import functools
 import contextlib
 
 import maya.mel as mel
 import maya.cmds as cmds
+import maya.OpenMaya as openMaya
 import pymel.core as pymel
 
 
+# plugin with the rhUndoable command, see do_undoable
+UNDO_PLUGIN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rh_maya_undo_cmd.py')
+
+# undo steps that run more commands than this are reported,
+# every command is counted, (queries too), not only the ones that land on the undo queue
+UNDO_CHUNK_COMMAND_BUDGET = 1000
+
+# stats of the most recent undo steps, newest last
+UNDO_CHUNK_STATS = collections.deque(maxlen=50)
+
+# the open undo step, nested steps fold into the outermost one
+UNDO_CHUNK_STATE = {'name':None, 'depth':0, 'suspended':0, 'commands_run':0, 'suspended_commands':0}
+
 
 def get_duplicated_node_names():
 	"""
@@ -324,3 +340,281 @@ def setAttrSpecial(obj, attr, value, prefix=None, channelBox=None, cb=None,
 
 	return(pAttr)
 
+
+def create_kd_tree(points, indices=None, depth=0):
+	"""
+	Build a kd-tree over 3d points for nearest neighbour queries
+
+	*Arguments:*
+		* ``points`` List of (x, y, z) positions
+
+	*Keyword Arguments:*
+		* ``indices`` Point indices to build the branch from, all points if not given
+		* ``depth``   Depth of the branch, picks the split axis
+
+	*Returns:*
+		* ``tree`` Nested (point index, axis, left branch, right branch) tuples or None
+	"""
+
+	if indices is None:
+		indices = range(len(points))
+	if not indices:
+		return None
+
+	axis = depth % 3
+	indices = sorted(indices, key=lambda index: points[index][axis])
+	middle = len(indices) // 2
+	return (indices[middle], axis,
+	        create_kd_tree(points, indices[:middle], depth + 1),
+	        create_kd_tree(points, indices[middle + 1:], depth + 1))
+
+
+def get_kd_tree_nearest(tree, points, position, count=1):
+	"""
+	Find the nearest points to a position in a kd-tree
+
+	*Arguments:*
+		* ``tree``     Result of create_kd_tree
+		* ``points``   Points the tree was built from
+		* ``position`` (x, y, z) position to search from
+
+	*Keyword Arguments:*
+		* ``count`` Number of points to find
+
+	*Returns:*
+		* ``nearest`` List of (squared distance, point index), closest first
+	"""
+
+	nearest = []
+
+	def search(branch):
+		if branch is None:
+			return
+		index, axis, left, right = branch
+		point = points[index]
+		distance = sum((point[i] - position[i]) ** 2 for i in xrange(3))
+		if len(nearest) < count or distance < nearest[-1][0]:
+			nearest.append((distance, index))
+			nearest.sort()
+			del nearest[count:]
+
+		offset = position[axis] - point[axis]
+		near, far = (left, right) if offset < 0 else (right, left)
+		search(near)
+		# the far side can only hold closer points if the split plane is within range
+		if len(nearest) < count or offset ** 2 < nearest[-1][0]:
+			search(far)
+
+	search(tree)
+	return nearest
+
+
+def _count_step_command(*args):
+	"""
+	Command callback, count the commands run while an undo step is open
+	"""
+
+	if UNDO_CHUNK_STATE['suspended']:
+		UNDO_CHUNK_STATE['suspended_commands'] += 1
+	else:
+		UNDO_CHUNK_STATE['commands_run'] += 1
+
+
+@contextlib.contextmanager
+def undo_chunk(name):
+	"""
+	Record everything run inside as one undo step.
+	Nested undo chunks fold into the outermost one, the number of commands each step runs
+	is kept in UNDO_CHUNK_STATS and steps over the command budget are reported.
+
+	*Arguments:*
+		* ``name`` Name of the undo step
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	state = UNDO_CHUNK_STATE
+	if state['depth']:
+		state['depth'] += 1
+		try:
+			yield
+		finally:
+			state['depth'] -= 1
+		return
+
+	state.update(name=name, depth=1, commands_run=0, suspended_commands=0)
+	callback_id = None
+	try:
+		callback_id = openMaya.MCommandMessage.addCommandCallback(_count_step_command)
+	except:
+		pass
+
+	start_time = time.time()
+	cmds.undoInfo(openChunk=True, chunkName=name)
+	try:
+		yield
+	finally:
+		cmds.undoInfo(closeChunk=True)
+		if callback_id is not None:
+			openMaya.MMessage.removeCallback(callback_id)
+		stats = {'name':name,
+		         'commands_run':state['commands_run'],
+		         'suspended_commands':state['suspended_commands'],
+		         'duration':time.time() - start_time}
+		UNDO_CHUNK_STATS.append(stats)
+		state.update(name=None, depth=0)
+		if stats['commands_run'] > UNDO_CHUNK_COMMAND_BUDGET:
+			print 'Undo step "{0}" ran {1} commands, over the budget of {2}'.format(name, stats['commands_run'], UNDO_CHUNK_COMMAND_BUDGET)
+
+
+@contextlib.contextmanager
+def undo_suspended():
+	"""
+	Run internal bookkeeping without recording undo, (temp selections, temp groups).
+	Only use this for changes that are restored before the step ends.
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	undo_state = cmds.undoInfo(q=True, state=True)
+	cmds.undoInfo(stateWithoutFlush=False)
+	UNDO_CHUNK_STATE['suspended'] += 1
+	try:
+		yield
+	finally:
+		UNDO_CHUNK_STATE['suspended'] -= 1
+		cmds.undoInfo(stateWithoutFlush=undo_state)
+
+
+def undo_step(name):
+	"""
+	Decorator, run the function as one undo step, see undo_chunk
+
+	*Arguments:*
+		* ``name`` Name of the undo step
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``decorator``
+	"""
+
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			with undo_chunk(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def get_undo_chunk_stats(name=None):
+	"""
+	Get the stats of the recent undo steps
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``name`` Only the steps with this name
+
+	*Returns:*
+		* ``stats`` List of dicts of the step name, commands run, commands run with undo suspended and duration
+	"""
+
+	return [dict(stats) for stats in UNDO_CHUNK_STATS if name is None or stats['name'] == name]
+
+
+def get_open_undo_chunk_stats():
+	"""
+	Get the command counts of the undo step that is open
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``stats`` Dict of the step name and command counts, or None if no step is open
+	"""
+
+	state = UNDO_CHUNK_STATE
+	if not state['depth']:
+		return None
+	return {'name':state['name'], 'commands_run':state['commands_run'], 'suspended_commands':state['suspended_commands']}
+
+
+def get_undo_plugin():
+	"""
+	Load the rhUndoable plugin and get its module
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``module`` Plugin module or None if it could not be loaded
+	"""
+
+	plugin_name = os.path.splitext(os.path.basename(UNDO_PLUGIN_FILE))[0]
+	if not cmds.pluginInfo(plugin_name, q=True, loaded=True):
+		try:
+			cmds.loadPlugin(UNDO_PLUGIN_FILE, quiet=True)
+		except:
+			cmds.warning('Could not load the undo plugin: {0}'.format(UNDO_PLUGIN_FILE))
+			return None
+
+	# maya loads the plugin as its own module, find that one and not an imported copy
+	for module in sys.modules.values():
+		module_file = getattr(module, '__file__', None)
+		if module_file and hasattr(module, 'UNDO_OPERATIONS'):
+			if os.path.splitext(os.path.abspath(module_file))[0] == os.path.splitext(UNDO_PLUGIN_FILE)[0]:
+				return module
+	return None
+
+
+def do_undoable(operations):
+	"""
+	Run (do, undo) operations as one entry on the undo queue.
+	Use this for API edits, (modifiers, plug locks), that are not recorded by themselves,
+	undo runs the undo callables in reverse and redo runs the operations again.
+
+	*Arguments:*
+		* ``operations`` List of (do, undo) callables
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``Bool`` True if the operations are on the undo queue, False if they ran without undo
+	"""
+
+	plugin = get_undo_plugin()
+	if not plugin:
+		for do, undo in operations:
+			do()
+		return False
+
+	plugin.UNDO_OPERATIONS.append(list(operations))
+	try:
+		getattr(cmds, plugin.UNDO_COMMAND_NAME)()
+	finally:
+		# a failed command leaves its operations queued
+		if plugin.UNDO_OPERATIONS and plugin.UNDO_OPERATIONS[-1] == list(operations):
+			plugin.UNDO_OPERATIONS.pop()
+	return True
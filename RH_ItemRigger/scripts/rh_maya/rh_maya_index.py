@@ -0,0 +1,304 @@
+"""
+Index Allocator Methods for use in Maya
+
+Item bones and material groups are numbered from pools of indices.
+An allocator keeps the used indices as a bitmap and the freed ones in a heap,
+so the lowest free index is handed out again instead of the pool drifting upwards.
+Allocators are built from the scene scans, the item node only keeps the index counter in step.
+Index attributes have no upper limit and index names grow past the padding,
+so items can hold thousands of bones and material groups.
+
+License: GNU General Public License v3.0
+"""
+
+import heapq
+import re
+
+import maya.cmds as cmds
+
+
+# index names are padded to this many digits, (Mat_01, weapon_07), larger indices just use more digits
+INDEX_NAME_PADDING = 2
+
+# attributes holding bone and material indices, older rigs capped these at 20 and 60
+INDEX_ATTRIBUTES = ['rh_material_index', 'rh_bone_index', 'rh_item_material_index', 'rh_item_bone_index']
+
+INDEX_NAME_PATTERN = re.compile(r'^(.*?)(\d+)$')
+
+
+def create_index_allocator(used=None, start=0):
+	"""
+	Create an index allocator
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``used``  Indices already in use, repeated indices are collected as duplicates
+		* ``start`` Lowest index handed out
+
+	*Returns:*
+		* ``allocator`` Dict of the start, used bitmap, free heap, high mark and duplicates
+	"""
+
+	allocator = {'start':start, 'bits':0L, 'free':[], 'high':start, 'duplicates':[]}
+	for index in used or []:
+		if not claim_index(allocator, index):
+			allocator['duplicates'].append(int(index))
+	return allocator
+
+
+def is_index_used(allocator, index):
+	"""
+	Check if an index is in use
+
+	*Arguments:*
+		* ``allocator`` Allocator dict
+		* ``index``     Index
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``bool``
+	"""
+
+	return bool(allocator['bits'] & (1L << int(index)))
+
+
+def claim_index(allocator, index):
+	"""
+	Mark an index as used, indices below the start are ignored
+
+	*Arguments:*
+		* ``allocator`` Allocator dict
+		* ``index``     Index
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``bool`` False if the index was already in use
+	"""
+
+	index = int(index)
+	if index < allocator['start']:
+		return True
+	if is_index_used(allocator, index):
+		return False
+
+	allocator['bits'] |= 1L << index
+	if index >= allocator['high']:
+		# indices skipped over become free
+		for skipped in xrange(allocator['high'], index):
+			heapq.heappush(allocator['free'], skipped)
+		allocator['high'] = index + 1
+	return True
+
+
+def get_free_index(allocator):
+	"""
+	Get the lowest free index without taking it
+
+	*Arguments:*
+		* ``allocator`` Allocator dict
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``index`` Lowest free index
+	"""
+
+	# the heap is cleaned lazily, drop entries claimed or trimmed since they were freed
+	free = allocator['free']
+	while free and (free[0] >= allocator['high'] or is_index_used(allocator, free[0])):
+		heapq.heappop(free)
+	if free:
+		return free[0]
+	return allocator['high']
+
+
+def allocate_index(allocator):
+	"""
+	Take the lowest free index
+
+	*Arguments:*
+		* ``allocator`` Allocator dict
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``index`` Index
+	"""
+
+	index = get_free_index(allocator)
+	claim_index(allocator, index)
+	return index
+
+
+def free_index(allocator, index):
+	"""
+	Give an index back to the allocator
+
+	*Arguments:*
+		* ``allocator`` Allocator dict
+		* ``index``     Index
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``bool`` False if the index was not in use
+	"""
+
+	index = int(index)
+	if index < allocator['start'] or not is_index_used(allocator, index):
+		return False
+
+	allocator['bits'] &= ~(1L << index)
+	heapq.heappush(allocator['free'], index)
+
+	# drop unused indices off the top so the high mark stays the next new index
+	while allocator['high'] > allocator['start'] and not is_index_used(allocator, allocator['high'] - 1):
+		allocator['high'] -= 1
+	return True
+
+
+def save_index_counter(node, attribute, allocator):
+	"""
+	Keep the index counter of a node in step with an allocator,
+	the counter holds how many indices from the start lie below the high mark.
+	Nothing is written when the stored value already matches.
+
+	*Arguments:*
+		* ``node``      Node name, (the item node)
+		* ``attribute`` Index counter attribute, (rh_bone_index or rh_material_index)
+		* ``allocator`` Allocator dict
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``bool`` True if the node was changed
+	"""
+
+	node = str(node)
+	counter_plug = '{0}.{1}'.format(node, attribute)
+	count = allocator['high'] - allocator['start']
+	if not cmds.attributeQuery(attribute, node=node, exists=True):
+		return False
+	if int(cmds.getAttr(counter_plug)) == count:
+		return False
+
+	node_locked = cmds.lockNode(node, q=True, lock=True)[0]
+	cmds.lockNode(node, lock=False)
+	try:
+		cmds.setAttr(counter_plug, lock=False)
+		cmds.setAttr(counter_plug, count)
+		cmds.setAttr(counter_plug, lock=True)
+	finally:
+		cmds.lockNode(node, lock=node_locked)
+	return True
+
+
+def get_index_name(prefix, index, padding=INDEX_NAME_PADDING):
+	"""
+	Get the name for an index, (Mat_01, weapon_120)
+
+	*Arguments:*
+		* ``prefix`` Name prefix
+		* ``index``  Index
+
+	*Keyword Arguments:*
+		* ``padding`` Minimum number of digits
+
+	*Returns:*
+		* ``name`` Index name
+	"""
+
+	return '{0}{1}'.format(prefix, str(int(index)).zfill(padding))
+
+
+def get_free_named_index(allocator, prefix, suffixes=None, ignore=None, padding=INDEX_NAME_PADDING):
+	"""
+	Get the lowest free index whose names are not taken in the scene, without taking it.
+	Nodes keep their index name after they leave the item, (removed bones in the unassigned group),
+	so free indices with a taken name are claimed and skipped.
+
+	*Arguments:*
+		* ``allocator`` Allocator dict
+		* ``prefix``    Name prefix
+
+	*Keyword Arguments:*
+		* ``suffixes`` Name suffixes to check along with the index name, (_anim)
+		* ``ignore``   Nodes that do not count as taking a name, (the nodes being renamed)
+		* ``padding``  Minimum number of digits
+
+	*Returns:*
+		* ``index`` Lowest free index with free names
+	"""
+
+	suffixes = [''] + list(suffixes or [])
+	ignore = set(cmds.ls([str(node) for node in ignore or [] if node], long=True) or [])
+	while True:
+		index = get_free_index(allocator)
+		name = get_index_name(prefix, index, padding=padding)
+		taken = [node for suffix in suffixes for node in cmds.ls(name + suffix, long=True) or [] if not node in ignore]
+		if not taken:
+			return index
+		claim_index(allocator, index)
+
+
+def get_index_name_key(name):
+	"""
+	Sort key for index names so weapon_100 sorts after weapon_99
+
+	*Arguments:*
+		* ``name`` Node name
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``key`` Tuple of the name prefix and index
+	"""
+
+	match = INDEX_NAME_PATTERN.match(name)
+	if match:
+		return (match.group(1), int(match.group(2)))
+	return (name, -1)
+
+
+def remove_index_limits(nodes):
+	"""
+	Migrate older rigs, remove the maximum value from the index attributes on the nodes
+
+	*Arguments:*
+		* ``nodes`` Nodes to check, (the item node, item bones and material groups)
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``plugs`` List of the migrated attributes
+	"""
+
+	plugs = []
+	for node in nodes:
+		node = str(node)
+		attributes = [attribute for attribute in INDEX_ATTRIBUTES if cmds.attributeQuery(attribute, node=node, exists=True) and cmds.attributeQuery(attribute, node=node, maxExists=True)]
+		if not attributes:
+			continue
+
+		node_locked = cmds.lockNode(node, q=True, lock=True)[0]
+		cmds.lockNode(node, lock=False)
+		try:
+			for attribute in attributes:
+				plug = '{0}.{1}'.format(node, attribute)
+				cmds.addAttr(plug, e=True, hasMaxValue=False)
+				plugs.append(plug)
+		finally:
+			cmds.lockNode(node, lock=node_locked)
+	return plugs
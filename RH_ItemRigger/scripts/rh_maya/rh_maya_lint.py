@@ -0,0 +1,425 @@
+"""
+Scene Lint Methods for use in Maya
+
+Export checks are rules that declare the node types, attributes and scene data they read.
+The engine gathers everything the rules need in one pass over the scene,
+runs the rules over that snapshot and caches their findings.
+A rule only runs again when its inputs change.
+
+License: GNU General Public License v3.0
+"""
+
+import os
+import collections
+import traceback
+
+import maya.cmds as cmds
+
+import rh_maya_general
+import rh_maya_modeling
+import rh_maya_rig_spec
+
+
+LINT_ERROR = 'error'
+LINT_WARNING = 'warning'
+
+# scene data a rule can ask for besides nodes and attributes
+LINT_SCENE_KEYS = ['names', 'namespaces', 'filename']
+
+# registered rules by name, run in registration order
+LINT_RULES = collections.OrderedDict()
+
+
+def register_lint_rule(name, check, title, node_types=None, attributes=None, scene=None, context=None, cache=True, severity=LINT_ERROR):
+	"""
+	Register a scene lint rule
+
+	*Arguments:*
+		* ``name``  Unique rule name
+		* ``check`` Function taking (snapshot, context) and returning a list of findings
+		* ``title`` Title the findings are reported under
+
+	*Keyword Arguments:*
+		* ``node_types`` Node types the rule reads, snapshot['nodes'][node_type]
+		* ``attributes`` Attributes the rule reads, snapshot['attributes'][attribute][node]
+		* ``scene``      Scene data the rule reads, any of LINT_SCENE_KEYS
+		* ``context``    Context keys the rule reads
+		* ``cache``      Reuse the findings while the inputs are unchanged, turn off for rules that read more than they declare
+		* ``severity``   Default severity of the findings
+
+	*Returns:*
+		* ``rule`` Rule dict
+	"""
+
+	rule = {'name':name,
+	        'check':check,
+	        'title':title,
+	        'node_types':list(node_types or []),
+	        'attributes':list(attributes or []),
+	        'scene':list(scene or []),
+	        'context':list(context or []),
+	        'cache':cache,
+	        'severity':severity}
+	LINT_RULES[name] = rule
+	return rule
+
+
+def create_lint_finding(message, nodes=None, severity=None, editor=None):
+	"""
+	Create a finding for a rule to return
+
+	*Arguments:*
+		* ``message`` Description of the problem
+
+	*Keyword Arguments:*
+		* ``nodes``    Nodes or names the finding is about
+		* ``severity`` LINT_ERROR or LINT_WARNING, defaults to the rule severity
+		* ``editor``   Mel command of an editor that helps fix the problem
+
+	*Returns:*
+		* ``finding`` Finding dict
+	"""
+
+	return {'message':message, 'nodes':list(nodes or []), 'severity':severity, 'editor':editor}
+
+
+def get_lint_snapshot(rules, context=None):
+	"""
+	Gather the scene data a list of rules reads.
+	All nodes are listed once with their types and sorted into the requested types,
+	attributes are read once for every node that has them.
+
+	*Arguments:*
+		* ``rules`` List of rule dicts
+
+	*Keyword Arguments:*
+		* ``context`` Dict of values passed in by the caller
+
+	*Returns:*
+		* ``snapshot`` Dict of nodes, attributes, scene data and context
+	"""
+
+	node_types = set()
+	attributes = set()
+	scene = set()
+	for rule in rules:
+		node_types.update(rule['node_types'])
+		attributes.update(rule['attributes'])
+		scene.update(rule['scene'])
+
+	snapshot = {'nodes':{}, 'attributes':{}, 'names':[], 'namespaces':[], 'filename':'', 'context':context or {}}
+
+	if node_types or 'names' in scene:
+		scene_nodes = cmds.ls(long=True, showType=True) or []
+		nodes = scene_nodes[0::2]
+		types = scene_nodes[1::2]
+		if 'names' in scene:
+			snapshot['names'] = [node.split('|')[-1] for node in nodes]
+		for node_type in node_types:
+			derived = set(cmds.nodeType(node_type, derived=True, isTypeName=True) or [])
+			derived.add(node_type)
+			snapshot['nodes'][node_type] = [node for node, scene_type in zip(nodes, types) if scene_type in derived]
+
+	# message attributes hold their connected nodes
+	for attribute in attributes:
+		values = {}
+		for node in cmds.ls('*.{0}'.format(attribute), objectsOnly=True, long=True) or []:
+			plug = '{0}.{1}'.format(node, attribute)
+			try:
+				if cmds.getAttr(plug, type=True) == 'message':
+					values[node] = cmds.listConnections(plug, source=True, destination=False) or []
+				else:
+					values[node] = cmds.getAttr(plug)
+			except:
+				values[node] = None
+		snapshot['attributes'][attribute] = values
+
+	if 'namespaces' in scene:
+		snapshot['namespaces'] = rh_maya_general.get_scene_namespaces()
+	if 'filename' in scene:
+		snapshot['filename'] = cmds.file(q=True, sceneName=True) or ''
+
+	return snapshot
+
+
+def get_lint_rule_inputs(rule, snapshot):
+	"""
+	Get the part of a snapshot a rule reads, to tell when its cached findings are stale
+
+	*Arguments:*
+		* ``rule``     Rule dict
+		* ``snapshot`` Snapshot dict from get_lint_snapshot
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``inputs`` Tuple of the rule inputs
+	"""
+
+	inputs = []
+	for node_type in rule['node_types']:
+		inputs.append(snapshot['nodes'].get(node_type, []))
+	for attribute in rule['attributes']:
+		inputs.append(sorted(snapshot['attributes'].get(attribute, {}).items()))
+	for key in rule['scene']:
+		inputs.append(snapshot.get(key))
+	for key in rule['context']:
+		inputs.append(snapshot['context'].get(key))
+	return tuple(inputs)
+
+
+def run_lint_rules(rules=None, context=None, cache=None):
+	"""
+	Run lint rules over one snapshot of the scene
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``rules``   Rule names to run, all registered rules if not given
+		* ``context`` Dict of values the rules read besides the scene
+		* ``cache``   Dict kept by the caller between runs, holds the inputs and findings per rule
+
+	*Returns:*
+		* ``findings`` List of finding dicts, with the rule, title and severity filled in
+	"""
+
+	if rules is None:
+		rules = LINT_RULES.keys()
+	rules = [LINT_RULES[name] for name in rules if name in LINT_RULES]
+	if cache is None:
+		cache = {}
+
+	snapshot = get_lint_snapshot(rules, context=context)
+
+	findings = []
+	for rule in rules:
+		inputs = None
+		if rule['cache']:
+			inputs = get_lint_rule_inputs(rule, snapshot)
+			cached = cache.get(rule['name'])
+			if cached and cached[0] == inputs:
+				findings.extend(cached[1])
+				continue
+
+		try:
+			rule_findings = rule['check'](snapshot, snapshot['context']) or []
+		except:
+			rule_findings = [create_lint_finding('The check failed to run!\n{0}'.format(traceback.format_exc()))]
+
+		for finding in rule_findings:
+			finding['rule'] = rule['name']
+			finding['title'] = rule['title']
+			if not finding.get('severity'):
+				finding['severity'] = rule['severity']
+
+		if rule['cache']:
+			cache[rule['name']] = (inputs, rule_findings)
+		findings.extend(rule_findings)
+
+	return findings
+
+
+def get_lint_errors(findings):
+	"""
+	Get the findings that block an export
+
+	*Arguments:*
+		* ``findings`` List of finding dicts
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``errors`` List of finding dicts
+	"""
+
+	return [finding for finding in findings if finding['severity'] == LINT_ERROR]
+
+
+def format_lint_findings(findings):
+	"""
+	Format findings as text, grouped under their titles
+
+	*Arguments:*
+		* ``findings`` List of finding dicts
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``message`` Text of the findings
+	"""
+
+	grouped = collections.OrderedDict()
+	for finding in findings:
+		grouped.setdefault(finding['title'], []).append(finding)
+
+	message = ''
+	for title, title_findings in grouped.iteritems():
+		message += '{0}:\n'.format(title)
+		for finding in title_findings:
+			if finding['severity'] == LINT_WARNING:
+				message += 'Warning: '
+			message += '{0}\n'.format(finding['message'])
+		message += '\n'
+	return message
+
+
+def lint_namespaces(snapshot, context):
+	"""
+	Lint rule, there can be no namespaces in the scene
+
+	*Arguments:*
+		* ``snapshot`` Snapshot dict
+		* ``context``  Context dict
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``findings`` List of finding dicts
+	"""
+
+	namespaces = snapshot['namespaces']
+	if not namespaces:
+		return []
+	message = 'There are namespaces found in your scene.\nYou must get rid of all namespaces before continuing.\n {0}'.format(' \n '.join(namespaces))
+	return [create_lint_finding(message, nodes=namespaces, editor='NamespaceEditor')]
+
+
+def lint_duplicate_names(snapshot, context):
+	"""
+	Lint rule, no two nodes can have the same name
+
+	*Arguments:*
+		* ``snapshot`` Snapshot dict
+		* ``context``  Context dict
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``findings`` List of finding dicts
+	"""
+
+	duplicate_names = sorted([name for name, count in collections.Counter(snapshot['names']).iteritems() if count > 1])
+	if not duplicate_names:
+		return []
+	message = 'Multiple objects in the scene have the same name.\nPlease make sure these objects have unique names.\n'
+	message += '\n'.join([' Duplicate Object Name: {0}'.format(name) for name in duplicate_names])
+	return [create_lint_finding(message, nodes=duplicate_names)]
+
+
+def lint_scene_file(snapshot, context):
+	"""
+	Lint rule, the scene must be saved in a rig folder of the item type under the project art path
+
+	*Arguments:*
+		* ``snapshot`` Snapshot dict
+		* ``context``  Context dict, reads item_type and project_art_path
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``findings`` List of finding dicts
+	"""
+
+	item_folder = rh_maya_rig_spec.get_item_rig_spec(context.get('item_type', 'Weapon'))['folder']
+	item_path = os.path.join(context.get('project_art_path', ''), item_folder).lower().replace('\\', '/')
+
+	filename = snapshot['filename']
+	if not filename:
+		return [create_lint_finding('This file has not been saved in the depot project art path.\nPlease save file under {0}'.format(item_path))]
+
+	findings = []
+	if not '/rig/' in filename.lower():
+		findings.append(create_lint_finding('The item rig file must be saved in a rig subfolder.\nPlease save file under {0}'.format(item_path + '/itemName/rig/itemName_rig.ma')))
+	if not filename.lower().startswith(item_path):
+		findings.append(create_lint_finding('This file is not saved in the depot project art path.\nPlease save file under {0}'.format(item_path)))
+	return findings
+
+
+def lint_item(snapshot, context):
+	"""
+	Lint rule, there must be a rigged item with a base mesh
+
+	*Arguments:*
+		* ``snapshot`` Snapshot dict
+		* ``context``  Context dict
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``findings`` List of finding dicts
+	"""
+
+	item_nodes = set(snapshot['attributes'].get('rh_item_data', {}).keys())
+	item_nodes.update(snapshot['attributes'].get('rh_weapon_data', {}).keys())
+	if not item_nodes:
+		return [create_lint_finding('There is not yet a rigged item to export.')]
+
+	base_meshes = snapshot['attributes'].get('rh_mesh_base', {})
+	if not any([base_meshes.get(node) for node in item_nodes]):
+		return [create_lint_finding('There is not yet a rigged item base mesh to export.', nodes=sorted(item_nodes))]
+	return []
+
+
+def lint_item_meshes(snapshot, context):
+	"""
+	Lint rule, the item meshes must pass the mesh validation of the caller
+
+	*Arguments:*
+		* ``snapshot`` Snapshot dict
+		* ``context``  Context dict, reads validate_meshes, a function returning (valid, message)
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``findings`` List of finding dicts
+	"""
+
+	validate_meshes = context.get('validate_meshes')
+	if not validate_meshes:
+		return []
+	valid, message = validate_meshes()
+	if valid:
+		return []
+	return [create_lint_finding(message.replace('MESH ERRORS:\n', '', 1).rstrip())]
+
+
+def lint_mesh_geometry(snapshot, context):
+	"""
+	Lint rule, the item meshes must pass the geometry checks
+
+	*Arguments:*
+		* ``snapshot`` Snapshot dict
+		* ``context``  Context dict, reads item_meshes
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``findings`` List of finding dicts
+	"""
+
+	findings = []
+	for mesh in context.get('item_meshes') or []:
+		if not cmds.objExists(str(mesh)):
+			continue
+		for issue in rh_maya_modeling.check_mesh_geometry(mesh):
+			severity = LINT_WARNING if issue['severity'] == 'warning' else LINT_ERROR
+			findings.append(create_lint_finding(issue['message'], nodes=issue['components'] or [issue['mesh']], severity=severity))
+	return findings
+
+
+register_lint_rule('namespaces', lint_namespaces, 'NAMESPACES', scene=['namespaces'])
+register_lint_rule('duplicate_names', lint_duplicate_names, 'DUPLICATED NAMED OBJECTS', scene=['names'])
+register_lint_rule('scene_file', lint_scene_file, 'FILENAME', scene=['filename'], context=['item_type', 'project_art_path'])
+register_lint_rule('item', lint_item, 'NO ITEM', attributes=['rh_item_data', 'rh_weapon_data', 'rh_mesh_base'])
+register_lint_rule('item_meshes', lint_item_meshes, 'MESH ERRORS', context=['validate_meshes'], cache=False)
+register_lint_rule('mesh_geometry', lint_mesh_geometry, 'MESH GEOMETRY', context=['item_meshes'], cache=False)
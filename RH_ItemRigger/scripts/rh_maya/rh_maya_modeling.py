@@ -7,8 +7,25 @@ License: GNU General Public License v3.0
 
 
 import maya.cmds as cmds
+import maya.OpenMaya as openMaya
 import pymel.core as pymel
 
+try:
+	import numpy
+except:
+	numpy = None
+
+
+# per mesh budgets checked before export
+MESH_VERTEX_BUDGET = 65535
+MESH_TRIANGLE_BUDGET = 100000
+
+# faces with less area than this, (in world units or uv space), are degenerate
+MESH_AREA_TOLERANCE = 1.0e-8
+MESH_UV_AREA_TOLERANCE = 1.0e-10
+
+# components listed in a geometry issue message
+MESH_ISSUE_MAX_LISTED = 10
 
 def get_mesh_materials(mesh, info=False):
 	"""
@@ -78,6 +95,31 @@ def get_mesh_materials(mesh, info=False):
 	return mesh_materials
 	
 	
+def get_material_signature(materials):
+	"""
+	Get a canonical key for a set of materials, the sorted material uuids.
+	Node long names are used on Maya versions without uuids.
+
+	*Arguments:*
+		* ``materials`` List of materials
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``signature`` Tuple of material keys
+	"""
+
+	names = list(set([str(material) for material in materials]))
+	try:
+		keys = cmds.ls(names, uuid=True) or []
+	except:
+		keys = []
+	if not len(keys) == len(names):
+		keys = cmds.ls(names, long=True) or []
+	return tuple(sorted(set(keys)))
+
+
 def get_mesh_shape(mesh):
 	"""
 	Get the shape from a pyNode object
@@ -269,3 +311,313 @@ def validate_mesh(mesh, mesh_type=None, uv_num=3):
 	
 	return True, 'Mesh is valid'
 
+
+def get_mesh_arrays(mesh):
+	"""
+	Get the geometry of a mesh as flat arrays, read once through MFnMesh.
+	Points are in world space, uvs are from the current uv set.
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``arrays`` Dict of points, counts, vertex_ids, us, vs, uv_counts and uv_ids, numpy arrays, or None
+	"""
+
+	shapes = cmds.listRelatives(str(mesh), shapes=True, noIntermediate=True, fullPath=True, type='mesh')
+	if not shapes:
+		return None
+
+	sel_list = openMaya.MSelectionList()
+	sel_list.add(shapes[0])
+	dag_path = openMaya.MDagPath()
+	sel_list.getDagPath(0, dag_path)
+	fn_mesh = openMaya.MFnMesh(dag_path)
+
+	points = openMaya.MPointArray()
+	fn_mesh.getPoints(points, openMaya.MSpace.kWorld)
+	counts = openMaya.MIntArray()
+	vertex_ids = openMaya.MIntArray()
+	fn_mesh.getVertices(counts, vertex_ids)
+	us = openMaya.MFloatArray()
+	vs = openMaya.MFloatArray()
+	fn_mesh.getUVs(us, vs)
+	uv_counts = openMaya.MIntArray()
+	uv_ids = openMaya.MIntArray()
+	fn_mesh.getAssignedUVs(uv_counts, uv_ids)
+
+	arrays = {}
+	arrays['points'] = numpy.array([(points[index].x, points[index].y, points[index].z) for index in xrange(points.length())], dtype=numpy.float64).reshape(-1, 3)
+	arrays['counts'] = numpy.array(list(counts), dtype=numpy.int64)
+	arrays['vertex_ids'] = numpy.array(list(vertex_ids), dtype=numpy.int64)
+	arrays['us'] = numpy.array(list(us), dtype=numpy.float64)
+	arrays['vs'] = numpy.array(list(vs), dtype=numpy.float64)
+	arrays['uv_counts'] = numpy.array(list(uv_counts), dtype=numpy.int64)
+	arrays['uv_ids'] = numpy.array(list(uv_ids), dtype=numpy.int64)
+	return arrays
+
+
+def get_geometry_issue(mesh, check, message, components=None, severity='error'):
+	"""
+	Create a geometry issue, listing the first few components in the message
+
+	*Arguments:*
+		* ``mesh``    Mesh transform
+		* ``check``   Name of the check
+		* ``message`` Description of the problem
+
+	*Keyword Arguments:*
+		* ``components`` Component names
+		* ``severity``   'error' or 'warning'
+
+	*Returns:*
+		* ``issue`` Dict of mesh, check, severity, message and components
+	"""
+
+	components = components or []
+	if components:
+		listed = [component.split('.')[-1] for component in components[:MESH_ISSUE_MAX_LISTED]]
+		if len(components) > MESH_ISSUE_MAX_LISTED:
+			listed.append('... {0} more'.format(len(components) - MESH_ISSUE_MAX_LISTED))
+		message += ' ({0}): {1}'.format(len(components), ', '.join(listed))
+	return {'mesh':str(mesh), 'check':check, 'severity':severity, 'message':'{0}: {1}'.format(str(mesh).split('|')[-1], message), 'components':components}
+
+
+def check_mesh_geometry(mesh, max_vertices=MESH_VERTEX_BUDGET, max_triangles=MESH_TRIANGLE_BUDGET):
+	"""
+	Check the geometry of a mesh for problems that break an export.
+	The geometry is read once and every check is vectorized over the face-vertex arrays:
+	zero area faces, lamina faces, non-manifold edges, degenerate or missing uvs,
+	unfrozen or negative scale transforms and vertex/triangle budgets.
+	Without numpy only the transform and budget checks run.
+	Budget overruns are warnings, the other geometry problems are errors that block the export.
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``max_vertices``  Vertex budget
+		* ``max_triangles`` Triangle budget
+
+	*Returns:*
+		* ``issues`` List of issue dicts, from get_geometry_issue
+	"""
+
+	mesh = str(mesh)
+	issues = []
+
+	# transforms, the world matrix flips with an odd number of negative scales
+	matrix = cmds.getAttr(mesh + '.matrix')
+	identity = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+	if any([abs(value - default) > 1.0e-5 for value, default in zip(matrix, identity)]):
+		issues.append(get_geometry_issue(mesh, 'unfrozen', 'The transforms are not frozen', severity='warning'))
+	world_matrix = openMaya.MMatrix()
+	openMaya.MScriptUtil.createMatrixFromList(cmds.getAttr(mesh + '.worldMatrix[0]'), world_matrix)
+	if world_matrix.det3x3() < 0.0:
+		issues.append(get_geometry_issue(mesh, 'negative_scale', 'The mesh has a negative scale'))
+
+	if not numpy:
+		num_vertices = cmds.polyEvaluate(mesh, vertex=True)
+		num_triangles = cmds.polyEvaluate(mesh, triangle=True)
+		if isinstance(num_vertices, int) and num_vertices > max_vertices:
+			issues.append(get_geometry_issue(mesh, 'vertex_budget', 'The mesh has {0} vertices, the budget is {1}'.format(num_vertices, max_vertices), severity='warning'))
+		if isinstance(num_triangles, int) and num_triangles > max_triangles:
+			issues.append(get_geometry_issue(mesh, 'triangle_budget', 'The mesh has {0} triangles, the budget is {1}'.format(num_triangles, max_triangles), severity='warning'))
+		return issues
+
+	arrays = get_mesh_arrays(mesh)
+	if not arrays or not len(arrays['counts']):
+		return issues
+
+	points = arrays['points']
+	counts = arrays['counts']
+	vertex_ids = arrays['vertex_ids']
+	num_faces = len(counts)
+
+	# budgets, maya triangulates an n-gon into n-2 triangles
+	num_triangles = int((counts - 2).clip(min=0).sum())
+	if len(points) > max_vertices:
+		issues.append(get_geometry_issue(mesh, 'vertex_budget', 'The mesh has {0} vertices, the budget is {1}'.format(len(points), max_vertices), severity='warning'))
+	if num_triangles > max_triangles:
+		issues.append(get_geometry_issue(mesh, 'triangle_budget', 'The mesh has {0} triangles, the budget is {1}'.format(num_triangles, max_triangles), severity='warning'))
+
+	# face-vertex layout, the face of each face-vertex and the next face-vertex around its face
+	starts = numpy.cumsum(counts) - counts
+	face_index = numpy.repeat(numpy.arange(num_faces), counts)
+	next_index = numpy.arange(len(vertex_ids)) + 1
+	next_index[starts + counts - 1] = starts
+	next_ids = vertex_ids[next_index]
+
+	# zero area faces, the area is half the length of the summed edge cross products
+	relative = points[vertex_ids] - points[vertex_ids[starts]][face_index]
+	cross = numpy.cross(relative, relative[next_index])
+	area_vector = numpy.column_stack([numpy.bincount(face_index, weights=cross[:, axis], minlength=num_faces) for axis in xrange(3)])
+	areas = 0.5 * numpy.sqrt((area_vector ** 2).sum(axis=1))
+	faces = numpy.nonzero(areas < MESH_AREA_TOLERANCE)[0]
+	if len(faces):
+		issues.append(get_geometry_issue(mesh, 'zero_area', 'Faces have zero area', ['{0}.f[{1}]'.format(mesh, face) for face in faces]))
+
+	# non-manifold edges are shared by more than two faces
+	edge_keys = numpy.minimum(vertex_ids, next_ids) * len(points) + numpy.maximum(vertex_ids, next_ids)
+	edge_keys, edge_counts = numpy.unique(edge_keys, return_counts=True)
+	edge_keys = edge_keys[edge_counts > 2]
+	if len(edge_keys):
+		vertices = numpy.unique(numpy.concatenate([edge_keys // len(points), edge_keys % len(points)]))
+		issues.append(get_geometry_issue(mesh, 'non_manifold', 'Edges are shared by more than two faces, on the vertices', ['{0}.vtx[{1}]'.format(mesh, vertex) for vertex in vertices]))
+
+	# lamina faces share all their vertices with another face,
+	# faces with the same vertex count, sums and bounds are candidates that are confirmed on their sorted vertex ids
+	face_keys = numpy.column_stack([counts,
+	                                numpy.bincount(face_index, weights=vertex_ids, minlength=num_faces),
+	                                numpy.bincount(face_index, weights=vertex_ids.astype(numpy.float64) ** 2, minlength=num_faces),
+	                                numpy.minimum.reduceat(vertex_ids, starts),
+	                                numpy.maximum.reduceat(vertex_ids, starts)])
+	order = numpy.lexsort(face_keys.T[::-1])
+	same = numpy.all(face_keys[order][1:] == face_keys[order][:-1], axis=1)
+	candidates = numpy.unique(numpy.concatenate([order[1:][same], order[:-1][same]]))
+	face_vertices = {}
+	for face in candidates:
+		key = tuple(sorted(vertex_ids[starts[face]:starts[face] + counts[face]]))
+		face_vertices.setdefault(key, []).append(face)
+	faces = sorted([face for shared in face_vertices.itervalues() if len(shared) > 1 for face in shared])
+	if len(faces):
+		issues.append(get_geometry_issue(mesh, 'lamina', 'Faces share all their vertices with another face', ['{0}.f[{1}]'.format(mesh, face) for face in faces]))
+
+	# uvs, faces without uvs and faces with zero uv area
+	mapped = arrays['uv_counts'] == counts
+	faces = numpy.nonzero(~mapped)[0]
+	if len(faces):
+		issues.append(get_geometry_issue(mesh, 'missing_uvs', 'Faces have no uvs', ['{0}.f[{1}]'.format(mesh, face) for face in faces], severity='warning'))
+	if mapped.any():
+		face_mapped = numpy.repeat(mapped, counts)
+		us = numpy.zeros(len(vertex_ids))
+		vs = numpy.zeros(len(vertex_ids))
+		us[face_mapped] = arrays['us'][arrays['uv_ids']]
+		vs[face_mapped] = arrays['vs'][arrays['uv_ids']]
+		uv_areas = 0.5 * numpy.abs(numpy.bincount(face_index, weights=us * vs[next_index] - us[next_index] * vs, minlength=num_faces))
+		faces = numpy.nonzero(mapped & (uv_areas < MESH_UV_AREA_TOLERANCE))[0]
+		if len(faces):
+			issues.append(get_geometry_issue(mesh, 'degenerate_uvs', 'Faces have zero uv area', ['{0}.f[{1}]'.format(mesh, face) for face in faces], severity='warning'))
+
+	return issues
+
+
+def get_mesh_history(meshes):
+	"""
+	Get the interesting history of the mesh shapes, in one dependency sweep
+
+	*Arguments:*
+		* ``meshes`` Mesh transforms
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``history`` Set of history node names
+	"""
+
+	meshes = [str(mesh) for mesh in meshes]
+	if not meshes:
+		return set()
+	shapes = cmds.listRelatives(meshes, shapes=True, noIntermediate=True, fullPath=True, type='mesh') or []
+	if not shapes:
+		return set()
+	return set(cmds.listHistory(shapes, interestLevel=1, pruneDagObjects=True) or [])
+
+
+def bake_non_deformer_history(meshes, known_history=None):
+	"""
+	Bake the non-deformer history, (modeling operations), of meshes into their shapes, keeping the deformers.
+	The history of all shapes is swept once, only history nodes that are not in known_history are looked at,
+	and the shapes downstream of those nodes are baked with one bakePartialHistory.
+
+	*Arguments:*
+		* ``meshes`` Mesh transforms
+
+	*Keyword Arguments:*
+		* ``known_history`` Set of history nodes to ignore, from get_mesh_history at the start of an edit session
+
+	*Returns:*
+		* ``shapes`` List of the baked shapes
+	"""
+
+	meshes = [str(mesh) for mesh in meshes]
+	if not meshes:
+		return []
+	shapes = cmds.listRelatives(meshes, shapes=True, noIntermediate=True, fullPath=True, type='mesh') or []
+	if not shapes:
+		return []
+
+	history = set(cmds.listHistory(shapes, interestLevel=1, pruneDagObjects=True) or [])
+	if known_history:
+		history.difference_update(known_history)
+	if not history:
+		return []
+
+	# deformers and blind data are kept
+	history = list(history)
+	kept = set(cmds.ls(history, type=['geometryFilter', 'polyBlindData']) or [])
+	nodes = [node for node in history if not node in kept]
+	if not nodes:
+		return []
+	for node in nodes:
+		print 'Shape has NonDeformerHistory: {0}'.format(node)
+
+	future = set(cmds.ls(cmds.listHistory(nodes, future=True) or [], type='mesh', long=True) or [])
+	shapes = [shape for shape in shapes if shape in future]
+	if not shapes:
+		return []
+
+	transforms = cmds.listRelatives(shapes, parent=True, fullPath=True) or []
+	cmds.lockNode(transforms, lock=False)
+	try:
+		print 'Baking NonDeformerHistory on Shapes: {0}'.format(', '.join([shape.split('|')[-1] for shape in shapes]))
+		cmds.bakePartialHistory(shapes, prePostDeformers=True)
+	finally:
+		cmds.lockNode(transforms, lock=True)
+	return shapes
+
+
+def get_mesh_shape_count(root):
+	"""
+	Count the mesh shapes, intermediate ones included, under a dag node
+
+	*Arguments:*
+		* ``root`` Dag node
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``count`` Number of mesh shapes
+	"""
+
+	return len(cmds.ls(str(root), dag=True, type='mesh') or [])
+
+
+def get_orphan_intermediate_shapes(root):
+	"""
+	Get the intermediate mesh shapes under a dag node that have no connections.
+	The shapes come from one ls and their connections from one listConnections.
+
+	*Arguments:*
+		* ``root`` Dag node
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``shapes`` List of shape long names
+	"""
+
+	shapes = cmds.ls(str(root), dag=True, type='mesh', intermediateObjects=True, long=True) or []
+	if not shapes:
+		return []
+
+	# connection pairs start with the plug on the shape
+	connections = cmds.listConnections(shapes, connections=True) or []
+	connected = set(cmds.ls(connections[0::2], objectsOnly=True, long=True) or [])
+	return [shape for shape in shapes if not shape in connected]
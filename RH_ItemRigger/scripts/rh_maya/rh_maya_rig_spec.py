@@ -0,0 +1,698 @@
+"""
+Item Rig Specs and the Rig Compiler for use in Maya
+
+An item type is described as data: nodes, bones, controls, shapes, colors,
+attributes, connections, lock policy and the base export bones.
+compile_item_rig turns a spec into a small number of batched DAG/DG modifier calls.
+
+License: GNU General Public License v3.0
+"""
+
+from functools import partial
+
+import maya.cmds as cmds
+import maya.OpenMaya as openMaya
+import pymel.core as pymel
+
+import rh_maya_general
+import rh_maya_control_shapes
+
+
+# node types the compiler creates with the dag modifier, anything else is a dg node
+DAG_NODE_TYPES = ['transform', 'joint', 'locator', 'curve']
+
+CHANNELS = ['tx', 'ty', 'tz', 'rx', 'ry', 'rz', 'sx', 'sy', 'sz']
+
+# attributes are (long name, nice name, type, options)
+# options: default, min, max, keyable, channel_box, multi, locked
+ITEM_NODE_ATTRIBUTES = [
+	('rh_item_name', 'ItemName', 'string', {'locked':True}),
+	('rh_item_data', 'ItemData', 'bool', {'default':1, 'locked':True}),
+	('rh_item_data_version', 'ItemDataVersion', 'double', {'default':1.0, 'min':1.0, 'max':100.0, 'locked':True}),
+	('rh_item_version', 'ItemVersion', 'double', {'default':1.0, 'min':1.0, 'max':100.0, 'locked':True}),
+	('rh_material_index', 'MaterialIndex', 'double', {'default':0.0, 'min':0.0, 'locked':True}),
+	('rh_bone_index', 'BoneIndex', 'double', {'default':0.0, 'min':0.0, 'locked':True}),
+	('rh_mesh_base', 'BaseMesh', 'message', {'locked':True}),
+	('rh_mesh_grp', 'MeshGrp', 'message', {'locked':True}),
+	('rh_rig_grp', 'RigGrp', 'message', {'locked':True}),
+	('rh_item_root', 'ItemRoot', 'message', {'locked':True}),
+	('rh_item_constraint_object', 'ItemConstraint', 'message', {'locked':True}),
+	('rh_item_edit', 'ItemEditMode', 'bool', {'default':0}),
+]
+
+ITEM_BONE_ATTRIBUTES = [
+	('rh_item', 'Item', 'bool', {'default':1}),
+	('rh_item_bone', 'ItemBone', 'bool', {'default':1}),
+]
+
+ITEM_ROOT_ATTRIBUTES = [
+	('rh_mesh', 'Mesh', 'message', {}),
+	('rh_owner', 'Owner', 'message', {}),
+	('character', 'character', 'message', {}),
+	('export', 'export', 'string', {}),
+	('slot', 'slot', 'string', {}),
+] + ITEM_BONE_ATTRIBUTES
+
+ITEM_CONTROL_ATTRIBUTES = [
+	('rh_item_control', 'ItemControl', 'bool', {'default':1}),
+	('rh_item', 'Item', 'bool', {'default':1}),
+]
+
+MATERIAL_GROUP_ATTRIBUTES = [
+	('rh_material', 'Material', 'message', {'multi':True, 'locked':True}),
+	('rh_item_material_index', 'Material Index', 'double', {'default':0.0, 'min':0.0, 'locked':True}),
+]
+
+GLOBAL_SCALE_ATTRIBUTES = [
+	('global_scale', 'Global Scale', 'double', {'default':1.0, 'min':0.0, 'max':10.0, 'keyable':True}),
+]
+
+# flags shared by the locked down organizational groups
+LOCKED_GROUP = {'type':'transform', 'lock_channels':True, 'hide_channels':True, 'lock':True}
+
+
+WEAPON_RIG_SPEC = {
+	'item_type':'Weapon',
+	'item_node':'Weapon',
+	'folder':'weapons',
+	'root_bone':'weapon_root',
+	'default_parent':'weapon_grip',
+	'export_bones':['weapon_root', 'weapon_grip', 'weapon_mag', 'weapon_muzzle_flash', 'weapon_secondary_grip', 'weapon_trigger'],
+	'base_controls':['weapon_root_anim', 'weapon_root_pivot_offset_anim', 'weapon_root_pivot_anim'],
+	'plugins':['matrixNodes'],
+	'nodes':[
+		dict(LOCKED_GROUP, name='Weapon', attributes=ITEM_NODE_ATTRIBUTES + [('rh_weapon', 'Weapon', 'bool', {'default':1, 'locked':True})]),
+		dict(LOCKED_GROUP, name='rig_grp', parent='Weapon'),
+		{'name':'weapon_root', 'type':'joint', 'parent':'Weapon', 'lock':True,
+		 'attributes':ITEM_ROOT_ATTRIBUTES + [('rh_weapon', 'Weapon', 'bool', {'default':1, 'locked':True})]},
+		{'name':'weapon_grip', 'type':'joint', 'parent':'weapon_root', 'lock':True, 'attributes':ITEM_BONE_ATTRIBUTES},
+		{'name':'weapon_secondary_grip', 'type':'joint', 'parent':'weapon_grip', 'lock':True, 'attributes':ITEM_BONE_ATTRIBUTES},
+		dict(LOCKED_GROUP, name='_UNASSIGNED_'),
+		dict(LOCKED_GROUP, name='MESH_{item_name}', parent='Weapon'),
+		dict(LOCKED_GROUP, name='Mat_00', parent='MESH_{item_name}', attributes=MATERIAL_GROUP_ATTRIBUTES),
+	],
+	'controls':[
+		{'bone':'weapon_root', 'color':14,
+		 'points':[(0, -30, -10), (0, 30, -10), (0, 30, 10), (0, -30, 10), (0, -30, -10)],
+		 'attributes':GLOBAL_SCALE_ATTRIBUTES + ITEM_CONTROL_ATTRIBUTES,
+		 'connections':[('weapon_root_anim.global_scale', 'weapon_root_anim.' + attr) for attr in ['sx', 'sy', 'sz']]},
+		{'bone':'weapon_grip', 'shape':'cube', 'size':12.0, 'color':22, 'constraint':'weapon_root_anim',
+		 'attributes':ITEM_CONTROL_ATTRIBUTES},
+		{'bone':'weapon_secondary_grip', 'shape':'sphere', 'size':2.25, 'color':18, 'constraint':'weapon_grip_anim',
+		 'attributes':ITEM_CONTROL_ATTRIBUTES},
+	],
+	'pivot':{'base_name':'weapon_root', 'parent_obj':'weapon_root_grp', 'main_ctrl':'weapon_root_anim',
+	         'attributes':ITEM_CONTROL_ATTRIBUTES},
+	'connections':[
+		('rig_grp.message', 'Weapon.rh_rig_grp'),
+		('MESH_{item_name}.message', 'Weapon.rh_mesh_grp'),
+		('weapon_root.message', 'Weapon.rh_item_root'),
+		('weapon_root_constrain.message', 'Weapon.rh_item_constraint_object'),
+	],
+	'layers':[('Bones', ['weapon_root']), ('Mesh', ['MESH_{item_name}'])],
+}
+
+
+VEHICLE_RIG_SPEC = {
+	'item_type':'Vehicle',
+	'item_node':'Vehicle',
+	'folder':'vehicles',
+	'root_bone':'root',
+	'default_parent':'frame',
+	'export_bones':['root', 'ground', 'frame'],
+	'base_controls':['main_anim', 'ground_anim', 'frame_anim', 'anim_root_pivot_offset_anim', 'anim_root_pivot_anim'],
+	'plugins':['matrixNodes'],
+	'nodes':[
+		dict(LOCKED_GROUP, name='Vehicle', attributes=ITEM_NODE_ATTRIBUTES + [('rh_vehicle', 'Vehicle', 'bool', {'default':1, 'locked':True})]),
+		dict(LOCKED_GROUP, name='rig_grp', parent='Vehicle'),
+		{'name':'root', 'type':'joint', 'parent':'Vehicle', 'lock':True,
+		 'attributes':ITEM_ROOT_ATTRIBUTES + [('rh_vehicle', 'Vehicle', 'bool', {'default':1, 'locked':True})]},
+		{'name':'ground', 'type':'joint', 'parent':'root', 'lock':True, 'attributes':ITEM_BONE_ATTRIBUTES},
+		{'name':'frame', 'type':'joint', 'parent':'ground', 'lock':True, 'attributes':ITEM_BONE_ATTRIBUTES},
+		dict(LOCKED_GROUP, name='_UNASSIGNED_'),
+		dict(LOCKED_GROUP, name='MESH_{item_name}', parent='Vehicle'),
+		dict(LOCKED_GROUP, name='Mat_00', parent='MESH_{item_name}', attributes=MATERIAL_GROUP_ATTRIBUTES),
+	],
+	'controls':[
+		{'bone':'root', 'name':'main_anim', 'shape':'square', 'size':150.0, 'color':14,
+		 'attributes':GLOBAL_SCALE_ATTRIBUTES + ITEM_CONTROL_ATTRIBUTES,
+		 'connections':[('main_anim.global_scale', 'main_anim.' + attr) for attr in ['sx', 'sy', 'sz']]},
+		{'bone':'ground', 'shape':'square', 'size':120.0, 'color':17, 'constraint':'main_anim',
+		 'attributes':ITEM_CONTROL_ATTRIBUTES},
+		{'bone':'frame', 'shape':'cube', 'size':80.0, 'color':22, 'constraint':'ground_anim',
+		 'attributes':ITEM_CONTROL_ATTRIBUTES},
+	],
+	'pivot':{'base_name':'anim_root', 'parent_obj':'main_grp', 'main_ctrl':'main_anim', 'size':4.0,
+	         'attributes':ITEM_CONTROL_ATTRIBUTES},
+	'connections':[
+		('rig_grp.message', 'Vehicle.rh_rig_grp'),
+		('MESH_{item_name}.message', 'Vehicle.rh_mesh_grp'),
+		('root.message', 'Vehicle.rh_item_root'),
+		('anim_root_constrain.message', 'Vehicle.rh_item_constraint_object'),
+	],
+	'layers':[('Bones', ['root']), ('Mesh', ['MESH_{item_name}'])],
+}
+
+
+ITEM_RIG_SPECS = {'Weapon':WEAPON_RIG_SPEC, 'Vehicle':VEHICLE_RIG_SPEC}
+
+
+def get_item_rig_spec(item_type='Weapon'):
+	"""
+	Get the rig spec of an item type
+
+	*Arguments:*
+		* ``None``
+
+	*Keyword Arguments:*
+		* ``item_type`` Weapon or Vehicle
+
+	*Returns:*
+		* ``spec`` Rig spec dict, the weapon spec for unknown item types
+	"""
+
+	return ITEM_RIG_SPECS.get(item_type, WEAPON_RIG_SPEC)
+
+
+def get_control_spec_nodes(control):
+	"""
+	Expand a control entry into its group hierarchy, connections and constraints.
+	The hierarchy matches create_weapon_control with space groups.
+
+	*Arguments:*
+		* ``control`` Control entry of a rig spec
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``nodes``       List of node entries
+		* ``connections`` List of (source, destination) plugs
+		* ``constraints`` List of (constraint type, driver, driven, maintain offset)
+	"""
+
+	bone = control['bone']
+	ctrl_name = control.get('name', bone + '_anim')
+	base_name = ctrl_name
+	if base_name.endswith('_anim'):
+		base_name = base_name[:-len('_anim')]
+	grp_name = base_name + '_grp'
+	parent_handle_name = ctrl_name + '_PH'
+	snap_grp_name = ctrl_name + '_SN'
+
+	nodes = [
+		{'name':grp_name, 'type':'transform', 'parent':control.get('parent', 'rig_grp'), 'lock':True},
+		{'name':parent_handle_name, 'type':'transform', 'parent':grp_name},
+		{'name':snap_grp_name, 'type':'transform', 'parent':parent_handle_name},
+		{'name':ctrl_name, 'type':'curve', 'parent':snap_grp_name, 'lock':True,
+		 'shape':control.get('shape'), 'points':control.get('points'), 'size':control.get('size', 1.0), 'rotation':control.get('rotation'),
+		 'color':control.get('color'),
+		 'attributes':control.get('attributes', [])},
+	]
+
+	# the ctrl scale drives the bone, segment scale compensate is off on item bones
+	connections = [('{0}.{1}'.format(ctrl_name, attr), '{0}.{1}'.format(bone, attr)) for attr in ['sx', 'sy', 'sz']]
+	connections += control.get('connections', [])
+
+	constraints = []
+	if control.get('constraint'):
+		constraints.append(('parentConstraint', control['constraint'], grp_name, True))
+		constraints.append(('scaleConstraint', control['constraint'], grp_name, False))
+	constraints.append(('parentConstraint', ctrl_name, bone, False))
+
+	return nodes, connections, constraints
+
+
+def get_pivot_spec_nodes(pivot, parent_grp='rig_grp'):
+	"""
+	Expand a pivot entry into the animatable pivot nodes.
+	The nodes match create_animatable_pivot.
+
+	*Arguments:*
+		* ``pivot`` Pivot entry of a rig spec
+
+	*Keyword Arguments:*
+		* ``parent_grp`` Group the pivot nodes are parented to
+
+	*Returns:*
+		* ``nodes``       List of node entries
+		* ``connections`` List of (source, destination) plugs
+		* ``constraints`` List of (constraint type, driver, driven, maintain offset)
+	"""
+
+	base_name = pivot['base_name']
+	parent_obj = pivot['parent_obj']
+	main_ctrl = pivot['main_ctrl']
+	size = pivot.get('size', 1.0)
+	attributes = pivot.get('attributes', [])
+
+	constrain_name = base_name + '_constrain'
+	pivot_grp_name = base_name + '_pivot_grp'
+	offset_anim_name = base_name + '_pivot_offset_anim'
+	pivot_anim_name = base_name + '_pivot_anim'
+	locator_name = base_name + '_parent_locator'
+	decomp_name = base_name + '_decompose'
+	anim_policy = {'locked_channels':['sx', 'sy', 'sz'], 'channel_box':['v']}
+
+	nodes = [
+		dict(LOCKED_GROUP, name=constrain_name + '_grp', parent=parent_grp),
+		{'name':constrain_name + '_PH', 'type':'transform', 'parent':constrain_name + '_grp'},
+		{'name':constrain_name + '_SN', 'type':'transform', 'parent':constrain_name + '_PH'},
+		{'name':constrain_name, 'type':'transform', 'parent':constrain_name + '_SN', 'lock':True,
+		 'attributes':[('rh_constraint_object', 'Constraint Object', 'double', {'default':1.0, 'min':1.0, 'max':1.0, 'keyable':True, 'locked':True})]},
+		dict(LOCKED_GROUP, name=base_name + '_world_spaceLoc', type='locator', parent=parent_grp, values={'v':False}),
+		{'name':pivot_grp_name, 'type':'transform', 'parent':constrain_name, 'lock_channels':True, 'hide_channels':True},
+		dict(anim_policy, name=offset_anim_name, type='curve', parent=pivot_grp_name, shape='cube', size=10.0 * size, color=14,
+		     attributes=attributes),
+		dict(anim_policy, name=pivot_anim_name, type='curve', parent=offset_anim_name, shape='sphere', size=2.0 * size, color=13,
+		     attributes=attributes),
+		{'name':locator_name, 'type':'locator', 'parent':pivot_grp_name, 'values':{'v':False}},
+		{'name':decomp_name, 'type':'decomposeMatrix', 'lock':True},
+	]
+
+	# the main ctrl shows the pivot ctrls
+	nodes.append({'name':main_ctrl, 'extend':True,
+	              'attributes':[('anim_pivot_vis', 'Anim Pivot Vis', 'double', {'default':0.0, 'min':0.0, 'max':1.0, 'channel_box':True})]})
+
+	# constraint names match the maya defaults the ui looks for
+	obj_constraint = parent_obj + '_parentConstraint1'
+	connections = [
+		(offset_anim_name + '.inverseMatrix', decomp_name + '.inputMatrix'),
+		(decomp_name + '.outputTranslate', obj_constraint + '.target[0].targetOffsetTranslate'),
+		(decomp_name + '.outputRotate', obj_constraint + '.target[0].targetOffsetRotate'),
+		(main_ctrl + '.anim_pivot_vis', offset_anim_name + '.visibility'),
+	]
+	constraints = [
+		('parentConstraint', pivot_anim_name, locator_name, True),
+		('parentConstraint', locator_name, parent_obj, True),
+	]
+
+	return nodes, connections, constraints
+
+
+def get_rig_spec_program(spec, item_name):
+	"""
+	Expand a rig spec into the flat node, connection and constraint lists the compiler runs.
+	Names are formatted with the item name.
+
+	*Arguments:*
+		* ``spec``      Rig spec dict
+		* ``item_name`` Name of the item
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``nodes``       List of node entries in creation order
+		* ``connections`` List of (source, destination) plugs
+		* ``constraints`` List of (constraint type, driver, driven, maintain offset)
+	"""
+
+	nodes = list(spec.get('nodes', []))
+	connections = []
+	constraints = []
+	for control in spec.get('controls', []):
+		control_nodes, control_connections, control_constraints = get_control_spec_nodes(control)
+		nodes += control_nodes
+		connections += control_connections
+		constraints += control_constraints
+
+	if spec.get('pivot'):
+		pivot_nodes, pivot_connections, pivot_constraints = get_pivot_spec_nodes(spec['pivot'])
+		nodes += pivot_nodes
+		connections += pivot_connections
+		constraints += pivot_constraints
+
+	connections += spec.get('connections', [])
+
+	def format_name(name):
+		if name:
+			return name.format(item_name=item_name)
+		return name
+
+	program_nodes = []
+	for node in nodes:
+		node = dict(node)
+		node['name'] = format_name(node['name'])
+		node['parent'] = format_name(node.get('parent'))
+		program_nodes.append(node)
+	connections = [(format_name(source), format_name(destination)) for source, destination in connections]
+	constraints = [(constraint_type, format_name(driver), format_name(driven), offset) for constraint_type, driver, driven, offset in constraints]
+
+	return program_nodes, connections, constraints
+
+
+def create_spec_attribute(long_name, nice_name, attr_type, options):
+	"""
+	Create a dynamic attribute object to add with a modifier
+
+	*Arguments:*
+		* ``long_name`` Attribute name
+		* ``nice_name`` Attribute nice name
+		* ``attr_type`` string, message, bool, long or double
+		* ``options``   Dict of default, min, max, keyable, channel_box and multi
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``MObject`` Attribute
+	"""
+
+	if attr_type == 'message':
+		attr_fn = openMaya.MFnMessageAttribute()
+		attr = attr_fn.create(long_name, long_name)
+	elif attr_type == 'string':
+		attr_fn = openMaya.MFnTypedAttribute()
+		attr = attr_fn.create(long_name, long_name, openMaya.MFnData.kString)
+	else:
+		data_types = {'bool':openMaya.MFnNumericData.kBoolean, 'long':openMaya.MFnNumericData.kInt, 'double':openMaya.MFnNumericData.kDouble}
+		attr_fn = openMaya.MFnNumericAttribute()
+		attr = attr_fn.create(long_name, long_name, data_types[attr_type], options.get('default', 0))
+		if 'min' in options:
+			attr_fn.setMin(options['min'])
+		if 'max' in options:
+			attr_fn.setMax(options['max'])
+
+	attr_fn.setNiceNameOverride(nice_name)
+	attr_fn.setKeyable(options.get('keyable', False))
+	attr_fn.setChannelBox(options.get('channel_box', False))
+	attr_fn.setArray(options.get('multi', False))
+	attr_fn.setStorable(True)
+	attr_fn.setHidden(False)
+	return attr
+
+
+def get_spec_plug(plug_name):
+	"""
+	Get an MPlug from a node.attribute string
+
+	*Arguments:*
+		* ``plug_name`` node.attribute
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``MPlug`` Plug
+	"""
+
+	selection = openMaya.MSelectionList()
+	selection.add(plug_name)
+	plug = openMaya.MPlug()
+	selection.getPlug(0, plug)
+	return plug
+
+
+def compile_item_rig(spec, item_name):
+	"""
+	Build an item rig from a rig spec.
+	Nodes, attributes and parenting are created with one DAG and one DG modifier,
+	values and connections with one modifier each, constraints are one command each
+	and the lock policy is applied last.
+	The modifiers run through the rhUndoable command and are undone and redone in place,
+	without the undo plugin the rig is still built but cannot be undone.
+
+	*Arguments:*
+		* ``spec``      Rig spec dict
+		* ``item_name`` Name of the item
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``item_node`` PyNode item node, or None if the rig could not be built
+	"""
+
+	nodes, connections, constraints = get_rig_spec_program(spec, item_name)
+
+	# nodes are found by name after they are built
+	clashes = [node['name'] for node in nodes if not node.get('extend') and cmds.objExists(node['name'])]
+	if clashes:
+		cmds.warning('Nodes from the {0} rig spec already exist in the scene: {1}'.format(spec['item_type'], ', '.join(clashes)))
+		return None
+
+	for plugin_name in spec.get('plugins', []):
+		try:
+			cmds.loadPlugin(plugin_name, quiet=True)
+			cmds.pluginInfo(plugin_name, edit=True, autoload=True)
+		except:
+			cmds.warning('Could not load the {0} plugin'.format(plugin_name))
+			return None
+
+	for layer_name, members in spec.get('layers', []):
+		if cmds.objExists(layer_name):
+			cmds.lockNode(layer_name, lock=False)
+			cmds.delete(layer_name)
+
+	# the modifiers are not on the undo queue, they are kept by undoable commands that take them back on undo
+	# and do them again on redo, so the rig nodes stay the same objects for the commands recorded after them
+	state = {}
+	undoable = rh_maya_general.do_undoable([(partial(_build_item_rig_nodes, nodes, state),
+	                                         partial(_remove_item_rig_nodes, state))])
+
+	for constraint_type, driver, driven, offset in constraints:
+		constraint_cmd = getattr(cmds, constraint_type)
+		constraint_cmd(driver, driven, mo=offset, weight=1.0, name='{0}_{1}1'.format(driven, constraint_type))
+
+	# connections can target the constraints, the lock policy is applied after everything is connected
+	rh_maya_general.do_undoable([(partial(_connect_item_rig, connections, state),
+	                              partial(_disconnect_item_rig, state)),
+	                             (partial(_lock_item_rig_channels, nodes, state),
+	                              partial(_unlock_item_rig_channels, state))])
+	if not undoable:
+		cmds.warning('The undo plugin is not loaded, creating the {0} rig cannot be undone'.format(spec['item_type']))
+
+	for layer_name, members in spec.get('layers', []):
+		layer = cmds.createDisplayLayer([member.format(item_name=item_name) for member in members], name=layer_name, noRecurse=False)
+		cmds.lockNode(layer, lock=True)
+
+	locked_nodes = [node['name'] for node in nodes if node.get('lock')]
+	cmds.lockNode(locked_nodes, lock=True)
+	cmds.select(cl=True)
+
+	return pymel.PyNode(spec['item_node'])
+
+
+def _build_item_rig_nodes(nodes, state):
+	"""
+	Create the nodes, attributes, control shapes and values of a rig spec program, see compile_item_rig.
+	The first run builds the modifiers and keeps them in state, later runs, (redo), do them again.
+
+	*Arguments:*
+		* ``nodes`` Program nodes
+		* ``state`` Dict the modifiers and node objects are kept in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	if state.get('value_mod'):
+		state['dag_mod'].doIt()
+		state['dg_mod'].doIt()
+		if state.get('shape_mod'):
+			state['shape_mod'].undoIt()
+		state['value_mod'].doIt()
+		return
+
+	# nodes, parenting and attributes
+	dag_mod = openMaya.MDagModifier()
+	dg_mod = openMaya.MDGModifier()
+	node_objects = {}
+	for node in nodes:
+		node_name = node['name']
+		if node.get('extend'):
+			node_obj = node_objects[node_name]
+			node_mod = dag_mod
+		elif node['type'] in DAG_NODE_TYPES:
+			parent_obj = openMaya.MObject.kNullObj
+			if node.get('parent'):
+				parent_obj = node_objects[node['parent']]
+			node_type = 'joint' if node['type'] == 'joint' else 'transform'
+			node_obj = dag_mod.createNode(node_type, parent_obj)
+			dag_mod.renameNode(node_obj, node_name)
+			if node['type'] == 'locator':
+				shape_obj = dag_mod.createNode('locator', node_obj)
+				dag_mod.renameNode(shape_obj, node_name + 'Shape')
+			node_mod = dag_mod
+		else:
+			node_obj = dg_mod.createNode(node['type'])
+			dg_mod.renameNode(node_obj, node_name)
+			node_mod = dg_mod
+		node_objects[node_name] = node_obj
+
+		for long_name, nice_name, attr_type, options in node.get('attributes', []):
+			node_mod.addAttribute(node_obj, create_spec_attribute(long_name, nice_name, attr_type, options))
+	state.update(dag_mod=dag_mod, dg_mod=dg_mod, node_objects=node_objects, shapes=[])
+	dag_mod.doIt()
+	dg_mod.doIt()
+
+	# control shapes and values, the curve shapes are created directly and tracked for undo
+	value_mod = openMaya.MDGModifier()
+	for node in nodes:
+		node_name = node['name']
+		if node.get('type') == 'curve':
+			if node.get('points'):
+				shape_obj = rh_maya_control_shapes.create_curve_shape(node['points'], node_objects[node_name])
+			else:
+				shape_obj = rh_maya_control_shapes.create_control_shape(node.get('shape') or 'sphere', node_objects[node_name],
+				                                                        size=node.get('size', 1.0), rotation=node.get('rotation'))
+			state['shapes'].append(shape_obj)
+			value_mod.renameNode(shape_obj, node_name + 'Shape')
+			if not node.get('color') is None:
+				shape_fn = openMaya.MFnDependencyNode(shape_obj)
+				value_mod.newPlugValueBool(shape_fn.findPlug('overrideEnabled'), True)
+				value_mod.newPlugValueInt(shape_fn.findPlug('overrideColor'), node['color'])
+
+		values = dict(node.get('values', {}))
+		if node.get('type') == 'joint':
+			values['segmentScaleCompensate'] = False
+		node_fn = openMaya.MFnDependencyNode(node_objects[node_name])
+		for attr, value in values.iteritems():
+			plug = node_fn.findPlug(attr)
+			if isinstance(value, bool):
+				value_mod.newPlugValueBool(plug, value)
+			elif isinstance(value, int):
+				value_mod.newPlugValueInt(plug, value)
+			elif isinstance(value, float):
+				value_mod.newPlugValueDouble(plug, value)
+			else:
+				value_mod.newPlugValueString(plug, value)
+	state['value_mod'] = value_mod
+	value_mod.doIt()
+
+
+def _remove_item_rig_nodes(state):
+	"""
+	Take back the modifiers of _build_item_rig_nodes, the control shapes are deleted with a modifier
+	that is undone on redo, so every node comes back as the same object
+
+	*Arguments:*
+		* ``state`` Dict the modifiers and node objects are kept in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	if state.get('value_mod'):
+		state['value_mod'].undoIt()
+	if state.get('shapes'):
+		if not state.get('shape_mod'):
+			shape_mod = openMaya.MDagModifier()
+			for shape_obj in state['shapes']:
+				shape_mod.deleteNode(shape_obj)
+			state['shape_mod'] = shape_mod
+		state['shape_mod'].doIt()
+	if state.get('dg_mod'):
+		state['dg_mod'].undoIt()
+	if state.get('dag_mod'):
+		state['dag_mod'].undoIt()
+
+
+def _connect_item_rig(connections, state):
+	"""
+	Connect the plugs of a rig spec program with one modifier, see compile_item_rig
+
+	*Arguments:*
+		* ``connections`` Program connections
+		* ``state``       Dict the modifier is kept in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	if not state.get('connect_mod'):
+		connect_mod = openMaya.MDGModifier()
+		for source, destination in connections:
+			connect_mod.connect(get_spec_plug(source), get_spec_plug(destination))
+		state['connect_mod'] = connect_mod
+	state['connect_mod'].doIt()
+
+
+def _disconnect_item_rig(state):
+	"""
+	Take back the connections of _connect_item_rig
+
+	*Arguments:*
+		* ``state`` Dict the modifier is kept in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	if state.get('connect_mod'):
+		state['connect_mod'].undoIt()
+
+
+def _lock_item_rig_channels(nodes, state):
+	"""
+	Apply the lock policy of a rig spec program, the locked plugs are kept in state
+
+	*Arguments:*
+		* ``nodes`` Program nodes
+		* ``state`` Dict the node objects are kept in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	locked_plugs = []
+	for node in nodes:
+		node_fn = openMaya.MFnDependencyNode(state['node_objects'][node['name']])
+		for attr in CHANNELS:
+			if node.get('lock_channels'):
+				locked_plugs.append(node_fn.findPlug(attr))
+			if node.get('hide_channels'):
+				node_fn.findPlug(attr).setKeyable(False)
+				node_fn.findPlug(attr).setChannelBox(False)
+		if node.get('hide_channels'):
+			node_fn.findPlug('v').setKeyable(False)
+		for attr in node.get('locked_channels', []):
+			plug = node_fn.findPlug(attr)
+			locked_plugs.append(plug)
+			plug.setKeyable(False)
+			plug.setChannelBox(True)
+		for attr in node.get('channel_box', []):
+			plug = node_fn.findPlug(attr)
+			plug.setKeyable(False)
+			plug.setChannelBox(True)
+		for long_name, nice_name, attr_type, options in node.get('attributes', []):
+			if options.get('locked'):
+				locked_plugs.append(node_fn.findPlug(long_name))
+
+	for plug in locked_plugs:
+		plug.setLocked(True)
+	state['locked_plugs'] = locked_plugs
+
+
+def _unlock_item_rig_channels(state):
+	"""
+	Unlock the plugs locked by _lock_item_rig_channels, so the connections and nodes can be taken back
+
+	*Arguments:*
+		* ``state`` Dict the locked plugs are kept in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	for plug in state.pop('locked_plugs', []):
+		plug.setLocked(False)
@@ -5,10 +5,39 @@ Author: Randall Hess randall.hess@gmail.com
 License: GNU General Public License v3.0
 """
 
+import os
+import re
+import math
+import time
+import subprocess
+
 import maya.mel as mel
 import maya.cmds as cmds
+import maya.OpenMaya as openMaya
 import pymel.core as pymel
 
+import rh_maya_general
+import rh_maya_skin
+import rh_maya_rig_spec
+import rh_maya_control_shapes
+
+try:
+	import numpy
+except:
+	numpy = None
+
+
+# bump when the item rig specs or the rig compiler change so cached rig templates are rebuilt
+RIG_TEMPLATE_VERSION = 5
+RIG_TEMPLATE_ITEM_NAME = 'RHTemplateItem'
+
+# name parts that say nothing about where a mesh belongs
+NAME_HINT_IGNORE = set(['mesh', 'geo', 'grp', 'group', 'shape', 'poly', 'weapon', 'vehicle', 'item', 'anim', 'bone', 'joint', 'jnt', 'lod', 'left', 'right'])
+
+# deformer history nodes renamed after the mesh they deform
+MESH_RENAME_HISTORY_TYPES = ['blendShape', 'groupParts', 'groupId', 'tweak', 'skinCluster']
+MESH_RENAME_IGNORE = set(['initialShadingGroup'])
+
 
 def get_obj_parent(obj, parent_before=None, parent_prefix=None):
 	"""
@@ -43,7 +72,7 @@ def get_obj_parent(obj, parent_before=None, parent_prefix=None):
 	return parent
 
 
-def skin_mesh(joints, mesh):
+def skin_mesh(joints, mesh, keep_weights=False):
 	"""
 	Given joints and a mesh Smooth Bind the mesh
 
@@ -51,7 +80,7 @@ def skin_mesh(joints, mesh):
 		* ``None`` 
 
 	*Keyword Arguments:*
-		* ``None`` 
+		* ``keep_weights`` Snapshot the current skin weights and restore them after the bind
 
 	*Returns:*
 		* ``None`` 
@@ -71,6 +100,13 @@ def skin_mesh(joints, mesh):
 	pymel.select(mesh)
 	pymel.lockNode(mesh, lock=False)
 
+	# the current weights, or the weights cached when the mesh was unassigned
+	snapshot = None
+	if keep_weights:
+		snapshot = rh_maya_skin.cache_skin_weights(mesh.longName())
+		if not snapshot:
+			snapshot = rh_maya_skin.get_cached_skin_weights(mesh.longName())
+
 	# Delete history on the skinned mesh
 	pymel.delete(mesh, constructionHistory=True)
 
@@ -93,6 +129,14 @@ def skin_mesh(joints, mesh):
 	cluster_name = mesh.nodeName() + "_skinCluster"	
 	new_skincluster = pymel.skinCluster(tsb=True, sm=0, bm=0, mi=4, name= cluster_name)
 
+	# only restore weights painted on the bones being bound, the mesh may have moved to another bone
+	if snapshot:
+		joint_names = set([str(joint).split('|')[-1] for joint in joints])
+		if joint_names.intersection([influence.split('|')[-1] for influence in snapshot['influences']]):
+			restored, message = rh_maya_skin.set_mesh_skin_weights(mesh.longName(), snapshot, skincluster=new_skincluster.name())
+			if not restored:
+				cmds.warning(message)
+
 	return True
 
 
@@ -120,70 +164,200 @@ def disable_segment_compensate_scale(joints=[]):
 		cmds.setAttr("{0}.segmentScaleCompensate".format(joint.longName()), 0)
 
 
-def create_cluster_bone():
+def get_component_points(nodes=None):
 	"""
-	Create a bone from either the object selection or the component selection
+	Get the world space positions of the vertices, (or cvs), in a selection.
+	Edges, faces and whole objects are converted to their vertices with a query,
+	the selection itself is never changed and no temp nodes are created.
 
 	*Arguments:*
 		* ``None`` 
 
+	*Keyword Arguments:*
+		* ``nodes`` Objects or components, uses the selection if not given
+
+	*Returns:*
+		* ``points`` Positions, (num points x 3), float64 array if numpy is available
+	"""
+
+	if nodes is None:
+		nodes = cmds.ls(sl=True) or []
+
+	# components on the same shape merge in the selection list, so shared vertices are read once
+	sel_list = openMaya.MSelectionList()
+	for node in nodes:
+		items = cmds.polyListComponentConversion(node, toVertex=True)
+		if not items:
+			if '.' in node:
+				items = [node]
+			else:
+				items = cmds.listRelatives(node, shapes=True, noIntermediate=True, fullPath=True) or []
+		for item in items:
+			try:
+				sel_list.add(item)
+			except:
+				continue
+
+	positions = []
+	points = openMaya.MPointArray()
+	sel_iter = openMaya.MItSelectionList(sel_list)
+	while not sel_iter.isDone():
+		dag_path = openMaya.MDagPath()
+		component = openMaya.MObject()
+		sel_iter.getDagPath(dag_path, component)
+		try:
+			if component.isNull():
+				geo_iter = openMaya.MItGeometry(dag_path)
+			else:
+				geo_iter = openMaya.MItGeometry(dag_path, component)
+			geo_iter.allPositions(points, openMaya.MSpace.kWorld)
+		except:
+			sel_iter.next()
+			continue
+		positions.extend([(points[index].x, points[index].y, points[index].z) for index in xrange(points.length())])
+		sel_iter.next()
+
+	if numpy:
+		return numpy.array(positions, dtype=numpy.float64).reshape(-1, 3)
+	return positions
+
+
+def get_points_frame(points):
+	"""
+	Get a frame from a set of points, positioned at their centroid and oriented to their principal axes.
+	X runs along the widest spread of the points and Z along the thinnest, (the normal of a flat selection).
+	Each axis is flipped to point down the world axis it is closest to, so the frame is stable.
+	Without numpy the frame is world aligned.
+
+	*Arguments:*
+		* ``points`` Positions, (num points x 3)
+
 	*Keyword Arguments:*
 		* ``None`` 
 
 	*Returns:*
+		* ``frame_matrix`` MMatrix world matrix of the frame
+	"""
+
+	axes = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]
+	if numpy:
+		positions = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+		centroid = positions.mean(axis=0)
+		offsets = positions - centroid
+		values, vectors = numpy.linalg.eigh(numpy.dot(offsets.T, offsets))
+		if values[-1] > 1.0e-10:
+			principal = vectors[:, ::-1].T.copy()
+			for axis in principal[:2]:
+				if axis[numpy.abs(axis).argmax()] < 0.0:
+					axis *= -1.0
+			principal[2] = numpy.cross(principal[0], principal[1])
+			axes = principal.tolist()
+		centroid = centroid.tolist()
+	else:
+		count = float(len(points))
+		centroid = [sum([point[index] for point in points]) / count for index in xrange(3)]
+
+	values = []
+	for axis in axes:
+		values.extend([axis[0], axis[1], axis[2], 0.0])
+	values.extend([centroid[0], centroid[1], centroid[2], 1.0])
+	frame_matrix = openMaya.MMatrix()
+	openMaya.MScriptUtil.createMatrixFromList(values, frame_matrix)
+	return frame_matrix
+
+
+def get_manip_pivot():
+	"""
+	Get the custom pivot position and orientation of the manipulator.
+	Values left at the origin or identity are returned as None.
+
+	*Arguments:*
 		* ``None`` 
 
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``position`` World position or None
+		* ``rotation`` World rotation in degrees or None
+	"""
+
+	position = tuple(cmds.manipPivot(q=True, p=True)[0])
+	rotation = tuple(cmds.manipPivot(q=True, o=True)[0])
+	if position == (0.0, 0.0, 0.0):
+		position = None
+	if rotation == (0.0, 0.0, 0.0):
+		rotation = None
+	return position, rotation
+
+
+def create_frame_joint(frame_matrix, position=None, rotation=None, radius=None):
+	"""
+	Create an unparented joint at a frame, with the frame rotation set as its joint orient
+
+	*Arguments:*
+		* ``frame_matrix`` MMatrix world matrix of the frame
+
+	*Keyword Arguments:*
+		* ``position`` World position that overrides the frame position
+		* ``rotation`` World rotation in degrees that overrides the frame rotation
+		* ``radius``   Joint radius
+
+	*Returns:*
+		* ``joint`` Joint name
+	"""
+
+	transform = openMaya.MTransformationMatrix(frame_matrix)
+	if position is None:
+		translation = transform.getTranslation(openMaya.MSpace.kWorld)
+		position = (translation.x, translation.y, translation.z)
+	if rotation is None:
+		euler = transform.eulerRotation()
+		rotation = (math.degrees(euler.x), math.degrees(euler.y), math.degrees(euler.z))
+
+	# nothing can be selected or the joint is parented to it
+	cmds.select(cl=True)
+	kwargs = {'position':position, 'orientation':rotation}
+	if radius:
+		kwargs['radius'] = radius
+	joint = cmds.joint(**kwargs)
+	cmds.select(joint, r=True)
+	return joint
+
+
+def create_cluster_bone():
+	"""
+	Create a bone from either the object selection or the component selection.
+	The bone sits at the centroid of the selected vertices, oriented to their principal axes,
+	a custom manipulator pivot orientation overrides that orientation.
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``joint`` Joint name or None
+
 	*Author:*
 	* randall.hess, randall.hess@gmail.com, 10/3/2014 5:20:22 PM
 	"""
 
-	obj = None
-	obj_mode = False
-	sel = pymel.ls(sl=True)
+	sel = cmds.ls(sl=True) or []
 	if not sel:
 		cmds.warning("You must select an object or component selection!")
-		return
-
-	component = cmds.selectMode(q=True,co=True)
-	c = mel.eval("selectMode -q -co")
-	print "Component Mode: {0}".format(component)
-	print "C: {0}".format(c)
-	cmds.refresh(f=True)
+		return None
 
-	mel.eval("PolySelectConvert 3")
-	try:
-		cluster = pymel.cluster(n="temp_cluster")[1]
-	except:
+	points = get_component_points(sel)
+	if not len(points):
 		cmds.warning("You must select a deformable object!")
-		return
+		return None
 
-	pymel.select(cl=True)
-	new_joint = pymel.joint()
-	cmds.refresh(f=True)
-	new_joint.setAttr("radius", 4)
-	constraint = pymel.parentConstraint(cluster, new_joint, mo = False)	
-	cmds.refresh(f=True)
-	pymel.delete(constraint)
-	pymel.delete(cluster)
-
-	pymel.select(sel)
-	cmds.refresh(f=True)
-
-	if component:
-		pymel.hilite(u=True)
-		sel = pymel.ls(sel)[0]
-		pymel.select(new_joint, add=True)
-		cmds.refresh(f=True)
-		const = mel.eval("orientConstraint -offset 0 0 0 -weight 1;")[0]
-		cmds.refresh(f=True)
-		pymel.delete(const)
-
-	cmds.refresh(f=True)
-
-	pymel.select(new_joint)
-	cmds.refresh(f=True)
-	mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1;")
-	pymel.selectMode(o=True)
+	rotation = get_manip_pivot()[1]
+	new_joint = create_frame_joint(get_points_frame(points), rotation=rotation, radius=4)
+	cmds.selectMode(object=True)
+	return new_joint
 
 
 def create_pivot_bone():
@@ -196,6 +370,9 @@ def create_pivot_bone():
 	  If you want to aim an axis click on the axis and ctrl+shift on another vert/edge/face to aim it
 	  When you have the pivot you want run this to create the joint with that pivot
 
+	Without a custom pivot the bone is placed like create_cluster_bone,
+	or at the pivot of a selected object.
+
 	*Arguments:*
 		* ``None`` 
 
@@ -203,137 +380,28 @@ def create_pivot_bone():
 		* ``None`` 
 
 	*Returns:*
-		* ``None`` 
+		* ``joint`` Joint name or None
 
 	*Author:*
 	* randall.hess, randall.hess@gmail.com, 10/3/2014 5:17:19 PM
 	"""
 
-	# get these values	
-	loc_xform = None
-	loc_rp    = None
-
-	# Get manipulator pos and orient	
-	manip_pin = cmds.manipPivot(pinPivot=True)
-	manip_pos = cmds.manipPivot(q=True, p=True)[0]
-	manip_rot = cmds.manipPivot(q=True, o=True)[0]
-
-	# delete existing temp objs
-	temp_joint = None
-	temp_loc   = None
-	temp_cluster= None
-	temp_joint_name = "temp_joint"
-	temp_loc_name = "temp_loc"
-	temp_cluster_name = "temp_cluster"
-	temp_objs = [temp_joint_name, temp_loc_name]
-
-	# get the selectMode
-	sel_mode_obj       = cmds.selectMode(q=True, o=True)
-	sel_mode_component = cmds.selectMode(q=True, co=True)		
-
-	# store and clear selection
-	selection = cmds.ls(sl=True)
-	py_selection = pymel.ls(sl=True)
-	if len(selection) == 0:
+	selection = cmds.ls(sl=True) or []
+	if not selection:
 		cmds.warning("You must have a selection!")
-		return	
-
-	if len(selection) > 0:
-
-		sel = selection[0]
-		py_sel = py_selection[0]
-
-		# create temp joint and set pos/rot
-		cmds.select(cl=True)
-		temp_joint= pymel.joint(n=temp_joint_name)
-		temp_loc = pymel.spaceLocator(n=temp_loc_name)
-
-		pivot_pos = mel.eval("manipPivot -q -p;")
-		pivot_orient = mel.eval("manipPivot -q -o;")			
-
-		if type(py_sel) == pymel.nodetypes.Transform:
-			# snap loc to position			
-			const = pymel.pointConstraint(sel, temp_loc, mo=False, w=1.0)
-			pymel.delete(const)
-			const = pymel.orientConstraint(sel, temp_loc, mo=False, w=1.0)
-			pymel.delete(const)
-		else:
-			# get transform from parent object
-			if type(py_sel.node()) == pymel.nodetypes.Mesh:
-				parent = py_sel.node().getParent()
-				if parent:
-					const = pymel.pointConstraint(parent, temp_loc, mo=False, w=1.0)
-					pymel.delete(const)
-					const = pymel.orientConstraint(parent, temp_loc, mo=False, w=1.0)
-					pymel.delete(const)
-
-					# get the transforms
-					loc_xform = pymel.xform(temp_loc, q=True, m=True, ws=True)
-					loc_rp = pymel.xform(temp_loc, q=True, ws=True, rp=True)					
-
-		# rotate the temp_loc if manip rot has been modified
-		if not manip_rot == (0.0,0.0,0.0):				
-			pymel.rotate(temp_loc, manip_rot)
-		else:
-			print "Rotation is Identity!"
-
-		# move position to the cluster position
-		if not manip_pos == (0.0,0.0,0.0):		
-			pymel.xform(temp_loc, ws=True, t=manip_pos)
-
-		# get the transforms
-		loc_xform = pymel.xform(temp_loc, q=True, m=True, ws=True)
-		loc_rp = pymel.xform(temp_loc, q=True, ws=True, rp=True)		
-
-		# get the position from the component selection			
-		if not type(py_sel) == pymel.nodetypes.Transform:
-			cmds.select(selection, r=True)
-			cmds.ConvertSelectionToVertices()
-			try:
-				cluster = cmds.cluster(n=temp_cluster_name)[1]
-			except:
-				cmds.warning("You must select a mesh object!")
-				pymel.delete(temp_joint)
-				pymel.delete(temp_loc)
-				return
-
-			# get the cluster position
-			cmds.select(cl=True)		
-			pos = cmds.xform(cluster, q=True, ws=True, rp=True)				
-
-			# snap to the cluster
-			const = pymel.pointConstraint(cluster, temp_loc, mo=False, w=1.0)
-			pymel.delete(const)
-
-			cmds.delete(cluster)
-
-			# rotate the temp_loc if manip rot has been modified
-			if not manip_rot == (0.0,0.0,0.0):				
-				pymel.rotate(temp_loc, manip_rot)
+		return None
 
-			# move position to the cluster position
-			if not manip_pos == (0.0,0.0,0.0):		
-				pymel.xform(temp_loc, ws=True, t=manip_pos)				
-
-			# get the transforms
-			loc_xform = pymel.xform(temp_loc, q=True, m=True, ws=True)
-			loc_rp = pymel.xform(temp_loc, q=True, ws=True, rp=True)	
-
-		# remove temp loc
-		pymel.delete(temp_loc)
-
-	# modify the joint and stu
-	if temp_joint:		
-		if loc_xform and loc_rp:
-			pymel.xform(temp_joint, m=loc_xform, ws=True)
-			pymel.xform(temp_joint, piv=loc_rp, ws=True)			
-
-		# freeze orient	
-		pymel.select(temp_joint)	
-		pymel.makeIdentity(apply=True, translate=True, rotate=True, scale=True, n=False)
+	if not '.' in selection[0] and cmds.objectType(selection[0], isAType='transform'):
+		frame_matrix = get_control_frame_matrices(selection[0])[1]
+	else:
+		points = get_component_points(selection)
+		if not len(points):
+			cmds.warning("You must select a mesh object!")
+			return None
+		frame_matrix = get_points_frame(points)
 
-	# unpin pivot
-	cmds.manipPivot(pinPivot=False)
+	position, rotation = get_manip_pivot()
+	return create_frame_joint(frame_matrix, position=position, rotation=rotation)
 
 
 def get_skincluster_influences(mesh):
@@ -355,19 +423,163 @@ def get_skincluster_influences(mesh):
 	all_influences = []
 
 	if mesh:	
-		pymel.select(mesh, replace = True)		
-		skincluster = mesh.listHistory(type="skinCluster")
-		if skincluster:				
-			# get the influence members
-			influences = pymel.skinCluster(skincluster, q = True, inf = True)
-			for infl in influences:
-				if pymel.nodeType(infl) == "joint":
-					if not infl in all_influences:
-						all_influences.append(infl)
+		for skin_info in get_skin_influence_map(meshes=[mesh]).values():
+			if skin_info:
+				all_influences = [pymel.PyNode(infl) for infl in skin_info['influences']]
 
 	return all_influences
 
 
+def get_skin_influence_map(root=None, meshes=None):
+	"""
+	Map meshes to their skinCluster and joint influences in one pass over the scene skinClusters.
+	Nothing is selected, meshes are found from the export root and/or the given meshes.
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``root``   Group to gather every mesh under, (MESH_ group)
+		* ``meshes`` Mesh transforms to gather
+
+	*Returns:*
+		* ``skin_map`` Dict of mesh transform long name to None for unskinned meshes or
+		  {'skincluster':name, 'influences':[joint long names], 'other_influences':[non joint long names]}
+	"""
+
+	shapes = []
+	if root:
+		shapes += cmds.ls(str(root), dag=True, shapes=True, noIntermediate=True, long=True) or []
+	if meshes:
+		shapes += cmds.listRelatives([str(mesh) for mesh in meshes], shapes=True, noIntermediate=True, fullPath=True) or []
+
+	# long shape name to its transform
+	shape_transforms = {}
+	skin_map = {}
+	for shape in shapes:
+		transform = shape.rsplit('|', 1)[0]
+		shape_transforms[shape] = transform
+		skin_map[transform] = None
+
+	if not shape_transforms:
+		return skin_map
+
+	for skincluster in cmds.ls(type='skinCluster') or []:
+		geometry = cmds.ls(cmds.skinCluster(skincluster, q=True, geometry=True) or [], long=True) or []
+		transforms = [shape_transforms[shape] for shape in geometry if shape in shape_transforms]
+		if not transforms:
+			continue
+
+		influences = cmds.ls(cmds.skinCluster(skincluster, q=True, influence=True) or [], long=True) or []
+		joints = set(cmds.ls(influences, type='joint', long=True) or [])
+		skin_info = {'skincluster':skincluster,
+		             'influences':[infl for infl in influences if infl in joints],
+		             'other_influences':[infl for infl in influences if not infl in joints]}
+		for transform in transforms:
+			# the first skinCluster found wins, like listHistory
+			if skin_map[transform] is None:
+				skin_map[transform] = skin_info
+
+	return skin_map
+
+
+def get_name_tokens(name):
+	"""
+	Split a node name into lower case words for name matching, "MagazineRelease_02_geo" > set(['magazine', 'release'])
+
+	*Arguments:*
+		* ``name`` Node name
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``tokens`` Set of words
+	"""
+
+	name = str(name).split('|')[-1].split(':')[-1]
+	name = re.sub(r'([a-z])([A-Z])', r'\1 \2', name)
+	words = re.split(r'[^A-Za-z]+', name)
+	return set([word.lower() for word in words if len(word) > 2 and not word.lower() in NAME_HINT_IGNORE])
+
+
+def get_world_bounds(nodes):
+	"""
+	Get the world bounding box of each node
+
+	*Arguments:*
+		* ``nodes`` Transform nodes
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``bounds`` Dict of node long name to (min point, max point, centroid)
+	"""
+
+	bounds = {}
+	for node in cmds.ls([str(node) for node in nodes], long=True) or []:
+		bbox = cmds.exactWorldBoundingBox(node)
+		bbox_min = tuple(bbox[:3])
+		bbox_max = tuple(bbox[3:])
+		bounds[node] = (bbox_min, bbox_max, tuple([(bbox_min[i] + bbox_max[i]) * 0.5 for i in xrange(3)]))
+	return bounds
+
+
+def get_nearest_bone_proposals(meshes, bones, bone_hints=None, count=4):
+	"""
+	Propose a bone for each mesh from its world bounding box.
+	Bones are indexed in a kd-tree, the nearest few to each mesh centroid are scored by their
+	distance to the mesh bounding box, (zero when the bone sits inside it), and name hints.
+
+	*Arguments:*
+		* ``meshes`` Mesh transforms to propose bones for
+		* ``bones``  Candidate bones
+
+	*Keyword Arguments:*
+		* ``bone_hints`` Dict of bone long name to extra names to match against, (meshes already skinned to it)
+		* ``count``      Number of nearest bones scored per mesh
+
+	*Returns:*
+		* ``proposals`` List of dicts in mesh order
+		  {'mesh':long name, 'bone':long name or None, 'distance':float, 'hint':matched words}
+	"""
+
+	bones = cmds.ls([str(bone) for bone in bones], long=True) or []
+	bone_positions = [tuple(cmds.xform(bone, q=True, ws=True, t=True)) for bone in bones]
+	bone_tokens = []
+	for bone in bones:
+		tokens = get_name_tokens(bone)
+		if bone_hints:
+			for name in bone_hints.get(bone, []):
+				tokens |= get_name_tokens(name)
+		bone_tokens.append(tokens)
+
+	tree = rh_maya_general.create_kd_tree(bone_positions)
+	bounds = get_world_bounds(meshes)
+
+	proposals = []
+	for mesh in cmds.ls([str(mesh) for mesh in meshes], long=True) or []:
+		bbox_min, bbox_max, centroid = bounds[mesh]
+		mesh_tokens = get_name_tokens(mesh)
+		proposal = {'mesh':mesh, 'bone':None, 'distance':0.0, 'hint':''}
+		best_score = None
+		for centroid_distance, index in rh_maya_general.get_kd_tree_nearest(tree, bone_positions, centroid, count=count):
+			position = bone_positions[index]
+			# distance from the bone to the bounding box, centroid distance breaks ties between bones inside it
+			box_distance = sum(max(bbox_min[i] - position[i], 0.0, position[i] - bbox_max[i]) ** 2 for i in xrange(3)) ** 0.5
+			matches = mesh_tokens & bone_tokens[index]
+			score = (box_distance + centroid_distance ** 0.5 * 0.01) / (1.0 + len(matches))
+			if best_score is None or score < best_score:
+				best_score = score
+				proposal['bone'] = bones[index]
+				proposal['distance'] = centroid_distance ** 0.5
+				proposal['hint'] = ', '.join(sorted(matches))
+		proposals.append(proposal)
+
+	return proposals
+
+
 def get_constraint_targets(constraint, ordered=False):
 	"""
 	Get the target nodes from a constraint
@@ -484,120 +696,284 @@ def transfer_pivot(source=None, target=None, freeze=True):
 
 	return True
 
-def rename_mesh_shapes(meshes=[], renamed_nodes=[]):
+def get_unique_name(name, taken):
 	"""
-	Rename the shape objects forthe mesh
+	Get a name that is not in a set of taken names, numbering it if needed
 
 	*Arguments:*
+		* ``name``  Wanted name
+		* ``taken`` Set of names already in use
+
+	*Keyword Arguments:*
 		* ``None``
 
+	*Returns:*
+		* ``name`` Free name
+	"""
+
+	if not name in taken:
+		return name
+	index = 1
+	while '{0}{1}'.format(name, index) in taken:
+		index += 1
+	return '{0}{1}'.format(name, index)
+
+
+def get_mesh_rename_plan(meshes, shapes=True, deformers=True, quiet=True):
+	"""
+	Plan the renames of the shapes and deformers of meshes.
+	Shapes are named after their mesh, (intermediate shapes get the Orig suffix),
+	deformer history nodes are named mesh_nodeType and numbered when the name is taken.
+	Each mesh history is swept once and names are checked against sets,
+	nodes that already carry their planned name, (or a numbered one), are left alone.
+
+	*Arguments:*
+		* ``meshes`` Mesh transforms
+
+	*Keyword Arguments:*
+		* ``shapes``    Plan the shape renames
+		* ``deformers`` Plan the deformer renames
+		* ``quiet``     Do not warn about nodes shared between meshes
+
+	*Returns:*
+		* ``plan`` List of (node, new name) tuples
+	"""
+
+	meshes = cmds.ls([str(mesh) for mesh in meshes], long=True, type='transform') or []
+	if not meshes:
+		return []
+
+	plan = []
+	planned = set()
+	taken = None
+	if deformers:
+		taken = set([node.split('|')[-1] for node in cmds.ls()])
+
+	for mesh in meshes:
+		mesh_name = mesh.split('|')[-1]
+
+		if shapes:
+			# shape names only have to be unique under their transform
+			mesh_shapes = cmds.listRelatives(mesh, shapes=True, fullPath=True) or []
+			shape_names = set([shape.split('|')[-1] for shape in mesh_shapes])
+			for shape in mesh_shapes:
+				new_name = mesh_name + 'Shape'
+				if cmds.getAttr(shape + '.intermediateObject'):
+					new_name += 'Orig'
+				name = shape.split('|')[-1]
+				if name == new_name or (name.startswith(new_name) and name[len(new_name):].isdigit()):
+					continue
+				new_name = get_unique_name(new_name, shape_names)
+				shape_names.add(new_name)
+				plan.append((shape, new_name))
+
+		if deformers:
+			history = cmds.listHistory(mesh, pruneDagObjects=True) or []
+			history = cmds.ls(history, type=MESH_RENAME_HISTORY_TYPES, showType=True) or []
+			for index in xrange(0, len(history), 2):
+				node, node_type = history[index], history[index + 1]
+				if node in MESH_RENAME_IGNORE:
+					continue
+				if node in planned:
+					if not quiet:
+						cmds.warning("This object is shared between meshes and has already been renamed!\n Object: {0}\n Mesh: {1}".format(node, mesh_name))
+					continue
+				planned.add(node)
+
+				new_name = '{0}_{1}'.format(mesh_name, node_type)
+				if node == new_name or (node.startswith(new_name) and node[len(new_name):].isdigit()):
+					continue
+				new_name = get_unique_name(new_name, taken)
+				taken.add(new_name)
+				plan.append((node, new_name))
+
+	# referenced and locked nodes cannot be renamed, shapes are full paths and deformers are dg nodes
+	nodes = [plan_node for plan_node, plan_name in plan]
+	if nodes:
+		skip = set(cmds.ls(nodes, readOnly=True, long=True) or [])
+		locked = cmds.lockNode(nodes, q=True, lock=True) or []
+		skip.update([locked_node for locked_node, is_locked in zip(nodes, locked) if is_locked])
+		if skip:
+			for skip_node in sorted(skip):
+				print "Cannot rename read-only node: {0}".format(skip_node)
+			plan = [(plan_node, plan_name) for plan_node, plan_name in plan if not plan_node in skip]
+
+	return plan
+
+
+def apply_rename_plan(plan):
+	"""
+	Apply a rename plan as one undo step
+
+	*Arguments:*
+		* ``plan`` List of (node, new name) tuples, from get_mesh_rename_plan
+
 	*Keyword Arguments:*
 		* ``None``
 
 	*Returns:*
+		* ``renamed_nodes`` List of new node names
+	"""
+
+	renamed_nodes = []
+	if not plan:
+		return renamed_nodes
+
+	# planned names are free in the scene, so the order of the renames does not matter
+	with pymel.UndoChunk():
+		for node, new_name in plan:
+			renamed_nodes.append(cmds.rename(node, new_name))
+	return renamed_nodes
+
+
+def rename_mesh_shapes(meshes=None, renamed_nodes=None):
+	"""
+	Rename the shape objects for the mesh
+
+	*Arguments:*
 		* ``None``
 
+	*Keyword Arguments:*
+		* ``meshes``        Mesh transforms, uses the selection if not given
+		* ``renamed_nodes`` List the new names are added to
+
+	*Returns:*
+		* ``renamed_nodes`` List of new node names
+
 	*Author:*
 	* randall.hess, randall.hess@gmail.com, 7/29/2016 1:35:18 PM
 	"""
 
+	if renamed_nodes is None:
+		renamed_nodes = []
 	if not meshes:
-		meshes = pymel.ls(sl = True, type = "transform")
+		meshes = cmds.ls(sl=True, type="transform") or []
 
-	invalid_renames = ["initialShadingGroup"]
+	plan = get_mesh_rename_plan(meshes, shapes=True, deformers=False)
+	renamed_nodes.extend(apply_rename_plan(plan))
+	return renamed_nodes
 
-	if meshes:
-		for mesh in meshes:
-			if pymel.objExists(mesh):
-
-				# get the shape relatives
-				mesh_shapes = pymel.listRelatives(mesh, s = True)
-				for shape in mesh_shapes:
-					mesh_name = mesh.nodeName()
-					new_obj_name = mesh.nodeName() + "Shape"
-					if "|" in mesh.longName():
-						new_name = mesh.longName().split("|")[-1] + "Shape"
-						if shape.isLocked():
-							continue
-						try:
-							shape.rename( new_name )
-							if not new_name in renamed_nodes:
-								renamed_nodes.append(new_name)
-						except:
-							print "Cannot rename read-only node: {0}".format(mesh.nodeName())
-
-					else:
-						new_name = rename_node(shape.nodeName(), new_obj_name)
-						if not new_name in renamed_nodes:
-							renamed_nodes.append(new_name)
-
-
-def rename_mesh_deformers(meshes=[], renamed_nodes=[], quiet=True):
-	"""
-	Rename the deformers on the mesh, blendshapes and skinclusters
+
+def rename_mesh_deformers(meshes=None, renamed_nodes=None, quiet=True):
+	"""
+	Rename the deformers on the mesh, blendshapes, skinclusters and their tweak and group nodes
 
 	*Arguments:*
 		* ``None``
 
 	*Keyword Arguments:*
-		* ``None``
+		* ``meshes``        Mesh transforms, uses the selection if not given
+		* ``renamed_nodes`` List the new names are added to
+		* ``quiet``         Do not warn about nodes shared between meshes
 
 	*Returns:*
-		* ``None``
+		* ``renamed_nodes`` List of new node names
 
 	*Author:*
 	* randall.hess, randall.hess@gmail.com, 7/29/2016 1:35:18 PM
 	"""
 
+	if renamed_nodes is None:
+		renamed_nodes = []
 	if not meshes:
-		meshes = pymel.ls( sl = True )
+		meshes = cmds.ls(sl=True, type="transform") or []
 
-	invalid_renames = ["initialShadingGroup"]
+	plan = get_mesh_rename_plan(meshes, shapes=False, deformers=True, quiet=quiet)
+	renamed_nodes.extend(apply_rename_plan(plan))
+	return renamed_nodes
 
-	if meshes:
-		for mesh in meshes:
-			if pymel.objExists(mesh):
-
-				# get the history
-				hist_objs = pymel.listHistory(mesh)
-				valid_hist_objs = ["blendShape","groupParts","groupId","tweak","skinCluster"]
-				for obj in hist_objs:
-
-					if str( obj.nodeType() ) in valid_hist_objs:
-						new_obj_name = mesh.nodeName() + "_" + obj.nodeType()
-						if new_obj_name in renamed_nodes:
-							if not quiet:
-								cmds.warning("This object has already been renamed!\n Old_Object: {0}\n New_Object: {1}".format( obj.nodeName(), new_obj_name))
-
-						if not obj.nodeName() in invalid_renames:
-							new_name = rename_node(obj.nodeName(), new_obj_name)
-							if not new_name in renamed_nodes:
-								renamed_nodes.append(new_name)
-
-				# get the shape relatives
-				mesh_shapes = pymel.listRelatives(mesh, s = True)
-				for shape in mesh_shapes:
-					conns = shape.listConnections()
-					if conns:
-						conns = list(set(conns))
-					for conn in conns:
-
-						# dont rename a shadingEngine
-						if isinstance(conn, pymel.nodetypes.ShadingEngine):
-							if conn.nodeName().endswith(str(conn.nodeType())):
-								continue
-
-						new_obj_name = mesh.nodeName() + "_" + conn.nodeType()
-						if new_obj_name in renamed_nodes:
-							if not quiet:
-								cmds.warning("This object has already been renamed!\n Old_Object: {0}\n New_Object: {1}".format( conn.nodeName(), new_obj_name ))
-
-						if not conn.nodeName() in invalid_renames:
-							new_name = rename_node(conn.nodeName(), new_obj_name)
-							if not new_name in renamed_nodes:
-								renamed_nodes.append(new_name)
 
-	return renamed_nodes
+def get_matrix_list(matrix):
+	"""
+	Get the 16 values of a matrix, as cmds.xform takes them
+
+	*Arguments:*
+		* ``matrix`` MMatrix
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``values`` List of floats
+	"""
+
+	return [matrix(row, column) for row in xrange(4) for column in xrange(4)]
+
+
+def get_control_frame_matrices(ctrl):
+	"""
+	Get the world matrix of a ctrl and the frame its groups are built in.
+	The frame has the ctrl orientation, no scale, and sits at the ctrl rotate pivot.
+
+	*Arguments:*
+		* ``ctrl`` Ctrl transform
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``ctrl_matrix``  MMatrix world matrix of the ctrl
+		* ``frame_matrix`` MMatrix world matrix of the frame
+	"""
+
+	ctrl_matrix = openMaya.MMatrix()
+	openMaya.MScriptUtil.createMatrixFromList(cmds.xform(str(ctrl), q=True, ws=True, m=True), ctrl_matrix)
+	pivot = cmds.xform(str(ctrl), q=True, ws=True, rp=True)
+
+	rotation = openMaya.MTransformationMatrix(ctrl_matrix).rotation()
+	frame = openMaya.MTransformationMatrix()
+	frame.setRotationQuaternion(rotation.x, rotation.y, rotation.z, rotation.w)
+	frame.setTranslation(openMaya.MVector(pivot[0], pivot[1], pivot[2]), openMaya.MSpace.kTransform)
+	return ctrl_matrix, frame.asMatrix()
+
+
+def bake_control_shapes(ctrl, matrix):
+	"""
+	Transform the curve shape points of a ctrl by a matrix, in object space.
+	The points are set with setAttr so the change is undoable,
+	construction history on the shapes is deleted first so it does not overwrite them.
+
+	*Arguments:*
+		* ``ctrl``   Ctrl transform
+		* ``matrix`` MMatrix to apply
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``None`` 
+	"""
+
+	if matrix.isEquivalent(openMaya.MMatrix()):
+		return
+
+	shapes = cmds.listRelatives(str(ctrl), shapes=True, type="nurbsCurve", fullPath=True) or []
+	if shapes and cmds.listHistory(shapes, pruneDagObjects=True):
+		cmds.delete(shapes, constructionHistory=True)
+
+	for shape in shapes:
+		points = cmds.getAttr(shape + ".controlPoints[*]") or []
+		for index, point in enumerate(points):
+			position = openMaya.MPoint(point[0], point[1], point[2]) * matrix
+			cmds.setAttr("{0}.controlPoints[{1}]".format(shape, index), position.x, position.y, position.z)
+
+
+def reset_transform(node):
+	"""
+	Reset the transform values and pivots of a node to the identity
+
+	*Arguments:*
+		* ``node`` Transform name
+
+	*Keyword Arguments:*
+		* ``None`` 
+
+	*Returns:*
+		* ``None`` 
+	"""
+
+	cmds.xform(node, os=True, piv=(0, 0, 0))
+	cmds.xform(node, os=True, t=(0, 0, 0), ro=(0, 0, 0), s=(1, 1, 1), sh=(0, 0, 0), ra=(0, 0, 0))
 
 
 def create_weapon_control(ctrl=None, bone=None, constraint_obj=None, create_space_grps=True, separate_xforms=False):
@@ -674,98 +1050,39 @@ def create_weapon_control(ctrl=None, bone=None, constraint_obj=None, create_spac
 		if pymel.objExists(ctrl_grp):	
 			pymel.delete(ctrl_grp)
 
-		# create top level parent grp
-		parent_grp = pymel.group(empty=True, name=(bone.nodeName() + "_grp"))
-		piv = cmds.xform(ctrl.nodeName(), q=True, rp=True, ws=True)
-		xform = cmds.xform(ctrl.nodeName(), q=True, m=True, ws=True)
-		cmds.xform(parent_grp.nodeName(), piv=piv, ws=True)
+		# the hierarchy sits at the ctrl pivot with the ctrl orientation
+		# groups are created with their final transforms and the ctrl shapes are baked into that frame
+		ctrl_matrix, frame_matrix = get_control_frame_matrices(ctrl)
+		ctrl_offset = ctrl_matrix * frame_matrix.inverse()
 
-		# parent the grp under the rig_grp
-		pymel.parent(parent_grp, "rig_grp")		
+		# create top level parent grp under the rig_grp
+		parent_grp = cmds.createNode("transform", name=ctrl_grp, parent="rig_grp", skipSelect=True)
+		cmds.xform(parent_grp, ws=True, m=get_matrix_list(frame_matrix))
+		parent_grp = pymel.PyNode(parent_grp)
+		ctrl_parent = parent_grp.longName()
 
-		# move the group
-		temp_p_constraint = pymel.parentConstraint(ctrl, parent_grp, mo=False, weight=1.0)
-		pymel.delete(temp_p_constraint)
+		# create hierarchy for space switching
+		if create_space_grps:
+			parent_handle = cmds.createNode("transform", name=parent_handle_name, parent=ctrl_parent, skipSelect=True)
+			snap_grp = cmds.createNode("transform", name=snap_grp_name, parent=parent_handle, skipSelect=True)
+			ctrl_parent = snap_grp
 
 		# create separate controls for separate transforms
 		translate_anim = None
-		translate_grp = None
-		rotate_grp = None
 		if separate_xforms:
 
-			# create offset ctrl
-			scale_val = 3.0
+			# create offset ctrl, shaped like it was placed with the ctrl matrix
 			translate_anim_name = bone.nodeName() + "_translate_anim"
-			mel.eval('curve -d 1 -p -{0} {0} {0} -p {0} {0} {0} -p {0} {0} -{0} -p -{0} {0} -{0} -p -{0} {0} {0} -p -{0} -{0} {0} -p -{0} -{0} -{0} -p {0} -{0} -{0} -p {0} -{0} {0} -p -{0} -{0} {0} -p {0} -{0} {0} -p {0} {0} {0} -p {0} {0} -{0} -p {0} -{0} -{0} -p -{0} -{0} -{0} -p -{0} {0} -{0} -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -n "{1}";'.format(scale_val, translate_anim_name))
-			translate_anim = pymel.general.PyNode(translate_anim_name)
-			translate_anim.getShape().overrideEnabled.set(True)
-			translate_anim.getShape().overrideColor.set(22)
-			cmds.xform(translate_anim.nodeName(), m=xform, ws=True)
-			cmds.xform(translate_anim.nodeName(), piv=piv, ws=True)
-			cmds.select(translate_anim_name)
-			cmds.select(cl = True)
-
-			# parent the anim ctrl under the translate ctrl
-			translate_grp = cmds.group(empty=True, name=(bone.nodeName() + "_translate_grp"))
-			cmds.xform(translate_grp, piv=piv, ws=True)
-			pymel.parent(translate_anim, translate_grp)
-			rotate_grp = cmds.group(empty=True, name=(bone.nodeName() + "_rotate_grp"))
-			cmds.xform(rotate_grp, piv=piv, ws=True)
-			pymel.parent(translate_grp, parent_grp)
-			cmds.select(translate_grp)
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")
-			pymel.parent(rotate_grp, translate_anim)
-			cmds.select(rotate_grp)
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")			
-			pymel.parent(ctrl, rotate_grp)	
-			cmds.select(ctrl.nodeName())
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")
-			cmds.select(cl= True)
+			translate_grp = cmds.createNode("transform", name=(bone.nodeName() + "_translate_grp"), parent=ctrl_parent, skipSelect=True)
+			translate_anim = rh_maya_control_shapes.create_control("cube", name=translate_anim_name, size=6.0, matrix=ctrl_offset, color=22)
+			translate_anim = pymel.general.PyNode(cmds.parent(translate_anim, translate_grp, relative=True)[0])
+			rotate_grp = cmds.createNode("transform", name=(bone.nodeName() + "_rotate_grp"), parent=translate_anim.longName(), skipSelect=True)
+			ctrl_parent = rotate_grp
 
-		# create hierarchy for space switching
-		if create_space_grps:			
-			snap_grp = pymel.group(empty=True, n=snap_grp_name)
-			pymel.xform(snap_grp, piv=piv, ws=True)
-
-			parent_handle = pymel.group(snap_grp, n=parent_handle_name)
-			pymel.xform(parent_handle, piv=piv, ws=True)
-			pymel.select(snap_grp)
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")			
-
-			# query attributes to lock
-			ts = set(["tx", "ty", "tz"])
-			rs = set(["rx", "ry", "rz"])
-
-			availAttrs = [] 
-			attrsToLock = (ts | rs)
-
-			# parent objects
-			pymel.parent(parent_handle, parent_grp)
-			pymel.select(parent_handle)
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")
-			pymel.parent(snap_grp, parent_handle)
-			pymel.select(snap_grp)
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")
-
-			if separate_xforms:				
-				pymel.parent(translate_grp, snap_grp)
-			else:
-				pymel.parent(ctrl, snap_grp)
-				pymel.select(ctrl)
-				try:
-					mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")
-				except:
-					pass
-
-		# parent the ctrl under the grp
-		if not separate_xforms and not create_space_grps:
-			pymel.parent(ctrl, parent_grp)
-
-		# freeze the ctrl
-		pymel.select(ctrl, r =True)
-		if not separate_xforms and not create_space_grps:
-			mel.eval("makeIdentity -apply true -t 1 -r 1 -s 1 -n 0 -pn 1")
-			cmds.xform(ctrl.nodeName(), piv=piv, ws=True)
+		# parent the ctrl and freeze it into the frame
+		bake_control_shapes(ctrl, ctrl_offset)
+		cmds.parent(ctrl.longName(), ctrl_parent, relative=True)
+		reset_transform(ctrl.longName())
 
 		# lock attributes after freezing transforms
 		if separate_xforms:
@@ -888,19 +1205,12 @@ def create_animatable_pivot( base_name = "weapon_root", parent_grp = "rig_grp",
 	pymel.addAttr( constrain_grp, ln= "rh_constraint_object", niceName = "Constraint Object", at = "double", defaultValue = 1.0, minValue = 1.0, maxValue = 1.0, keyable = True, h = False )
 
 	# create offset ctrl
-	scale_val = 5.0
-	mel.eval('curve -d 1 -p -{0} {0} {0} -p {0} {0} {0} -p {0} {0} -{0} -p -{0} {0} -{0} -p -{0} {0} {0} -p -{0} -{0} {0} -p -{0} -{0} -{0} -p {0} -{0} -{0} -p {0} -{0} {0} -p -{0} -{0} {0} -p {0} -{0} {0} -p {0} {0} {0} -p {0} {0} -{0} -p {0} -{0} -{0} -p -{0} -{0} -{0} -p -{0} {0} -{0} -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -n "{1}";'.format(scale_val, offset_anim_name))		
-	offset_anim = pymel.general.PyNode(offset_anim_name)
-	offset_anim.getShape( ).overrideEnabled.set( True )
-	offset_anim.getShape( ).overrideColor.set( 14 )	
+	offset_anim = rh_maya_control_shapes.create_control("cube", name=offset_anim_name, size=10.0, color=14)
+	offset_anim = pymel.general.PyNode(offset_anim)
 
 	# create anim ctrl
-	mel.eval('curve -d 1 -p 0 3 0 -p 0 2 -2 -p 0 0 -3 -p 0 -2 -2 -p 0 -3 0 -p 0 -2 2 -p 0 0 3 -p 0 2 2 -p 0 3 0 -p 2 2 0 -p 3 0 0 -p 2 -2 0 -p 0 -3 0 -p -2 -2 0 -p -3 0 0 -p -2 2 0 -p 0 3 0 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -k 16 -n "{0}";'.format(pivot_anim_name))				
-	mel.eval("select -r {0}.cv[0:16] ;".format(pivot_anim_name))
-	mel.eval("scale -r -ocp 2.0 2.0 2.0;")
-	pivot_anim = pymel.PyNode( pivot_anim_name )	
-	pivot_anim.getShape( ).overrideEnabled.set( True )
-	pivot_anim.getShape( ).overrideColor.set( 13 )		
+	pivot_anim = rh_maya_control_shapes.create_control("sphere", name=pivot_anim_name, size=2.0, color=13)
+	pivot_anim = pymel.PyNode(pivot_anim)
 
 	# create parent locator
 	parent_locator = pymel.general.spaceLocator( n = locator_name )
@@ -971,20 +1281,18 @@ def create_temp_curve(obj_name, square=False, cube=False, sphere=True):
 	
 	obj_ctrl = obj_name + '_curve'
 	if square == True:
-		mel.eval('curve -d 1 -p -1 0 1 -p 1 0 1 -p 1 0 -1 -p -1 0 -1 -p -1 0 1 -k 0 -k 1 -k 2 -k 3 -k 4 -n "{0}";'.format(obj_ctrl))
+		obj_ctrl = rh_maya_control_shapes.create_control('square', name=obj_ctrl)
 	elif cube == True:
-		scale_val = 6.0
-		mel.eval( 'curve -d 1 -p -{0} {0} {0} -p {0} {0} {0} -p {0} {0} -{0} -p -{0} {0} -{0} -p -{0} {0} {0} -p -{0} -{0} {0} -p -{0} -{0} -{0} -p {0} -{0} -{0} -p {0} -{0} {0} -p -{0} -{0} {0} -p {0} -{0} {0} -p {0} {0} {0} -p {0} {0} -{0} -p {0} -{0} -{0} -p -{0} -{0} -{0} -p -{0} {0} -{0} -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -n "{1}";'.format( scale_val, obj_ctrl ) )
+		obj_ctrl = rh_maya_control_shapes.create_control('cube', name=obj_ctrl, size=12.0)
 	elif sphere == True:
-		mel.eval( 'curve -d 1 -p 0 3 0 -p 0 2 -2 -p 0 0 -3 -p 0 -2 -2 -p 0 -3 0 -p 0 -2 2 -p 0 0 3 -p 0 2 2 -p 0 3 0 -p 2 2 0 -p 3 0 0 -p 2 -2 0 -p 0 -3 0 -p -2 -2 0 -p -3 0 0 -p -2 2 0 -p 0 3 0 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -k 16 -n "{0}";'.format( obj_ctrl ) )		
-		mel.eval( 'select -r {0}.cv[0:16] ;'.format(obj_ctrl) )
-		mel.eval( 'scale -r -ocp 2.25 2.25 2.25;' )		
+		obj_ctrl = rh_maya_control_shapes.create_control('sphere', name=obj_ctrl, size=2.25)
 	else:
-		mel.eval( 'curve -d 1 -p 0 3 0 -p 0 2 -2 -p 0 0 -3 -p 0 -2 -2 -p 0 -3 0 -p 0 -2 2 -p 0 0 3 -p 0 2 2 -p 0 3 0 -p 2 2 0 -p 3 0 0 -p 2 -2 0 -p 0 -3 0 -p -2 -2 0 -p -3 0 0 -p -2 2 0 -p 0 3 0 -k 0 -k 1 -k 2 -k 3 -k 4 -k 5 -k 6 -k 7 -k 8 -k 9 -k 10 -k 11 -k 12 -k 13 -k 14 -k 15 -k 16 -n "{0}";'.format( obj_ctrl ) )	
+		obj_ctrl = rh_maya_control_shapes.create_control('sphere', name=obj_ctrl)
 	return obj_ctrl
 
 
-def weapon_create_rig(weapon_name="WeaponName"):
+@rh_maya_general.undo_step("Create Weapon Rig")
+def weapon_create_rig(weapon_name="WeaponName", use_template=False):
 	"""
 	Create the base structure for a weapon rig
 
@@ -992,7 +1300,7 @@ def weapon_create_rig(weapon_name="WeaponName"):
 		* ``None`` 
 
 	*Keyword Arguments:*
-		* ``None`` 
+		* ``use_template`` Import the cached rig template instead of building the rig node by node
 
 	*Returns:*
 		* ``None`` 
@@ -1009,6 +1317,16 @@ def weapon_create_rig(weapon_name="WeaponName"):
 			cmds.warning("There is currently a Weapon node in the scene that cannot be delete!\n\nThis needs to be removed to continue")
 			return False
 
+	if use_template:
+		template_file = get_rig_template_file()
+		if not os.path.isfile(template_file):
+			created, message = create_rig_template(template_file)
+			print message
+		weapon_grp = create_rig_from_template(weapon_name, template_file)
+		if weapon_grp:
+			return weapon_grp
+		cmds.warning("The rig template could not be used, building the rig.")
+
 	# create Weapon	
 	weapon_grp = pymel.group(empty=True, name ="Weapon")
 	lock_channels(weapon_grp)
@@ -1020,8 +1338,8 @@ def weapon_create_rig(weapon_name="WeaponName"):
 	pymel.addAttr(weapon_grp, ln="rh_weapon", niceName="Weapon", at="bool", keyable=False, dv=1)
 	pymel.addAttr(weapon_grp, ln="rh_item_data_version", niceName = "ItemDataVersion", at = "double", defaultValue=1.0, minValue=1.0, maxValue = 100.0, keyable = False, h = False )
 	pymel.addAttr(weapon_grp, ln="rh_item_version", niceName = "ItemVersion", at = "double", defaultValue = 1.0, minValue = 1.0, maxValue = 100.0, keyable = False, h = False )
-	pymel.addAttr(weapon_grp, ln="rh_material_index", niceName = "MaterialIndex", at = "double", defaultValue = 0.0, minValue = 0.0, maxValue = 20.0, keyable = False, h = False )
-	pymel.addAttr(weapon_grp, ln="rh_bone_index", niceName = "BoneIndex", at = "double", defaultValue = 0.0, minValue = 0.0, maxValue = 60.0, keyable = False, h = False )	
+	pymel.addAttr(weapon_grp, ln="rh_material_index", niceName = "MaterialIndex", at = "double", defaultValue = 0.0, minValue = 0.0, keyable = False, h = False )
+	pymel.addAttr(weapon_grp, ln="rh_bone_index", niceName = "BoneIndex", at = "double", defaultValue = 0.0, minValue = 0.0, keyable = False, h = False )	
 	pymel.addAttr(weapon_grp, at="message", ln= "rh_mesh_base", niceName="BaseMesh")
 	pymel.addAttr(weapon_grp, at="message", ln= "rh_mesh_grp", niceName="MeshGrp")
 	pymel.addAttr(weapon_grp, at="message", ln= "rh_rig_grp", niceName="RigGrp")
@@ -1094,7 +1412,7 @@ def weapon_create_rig(weapon_name="WeaponName"):
 	mat_group.setAttr("v", keyable=False)
 
 	pymel.addAttr(mat_group, at="message", ln= "rh_material", multi=True, niceName="Material", keyable=False, h=False)		
-	pymel.addAttr( mat_group, ln= "rh_item_material_index", niceName = "Material Index", at = "double", defaultValue = 0.0, minValue = 0.0, maxValue = 20.0, keyable = False, h = False )	
+	pymel.addAttr( mat_group, ln= "rh_item_material_index", niceName = "Material Index", at = "double", defaultValue = 0.0, minValue = 0.0, keyable = False, h = False )	
 	mat_group.setAttr("rh_material", lock=True)
 	mat_group.setAttr("rh_item_material_index", lock=True)
 	pymel.parent(mat_group, mesh_grp)	
@@ -1134,7 +1452,6 @@ def weapon_create_rig(weapon_name="WeaponName"):
 	cmds.setAttr("weapon_root_animShape.controlPoints[4].zValue", -10)	
 
 	# Add Global Scale Attr
-	pymel.refresh()
 	pymel.select( root_ctrl, replace = True )	
 	pymel.addAttr( root_ctrl, ln= "global_scale", niceName = "Global Scale", at = "double", defaultValue = 1.0, minValue = 0.0, maxValue = 10.0, keyable = True, h = False )
 	pymel.setAttr( root_ctrl + ".global_scale", keyable = True, cb = True )
@@ -1234,4 +1551,245 @@ def weapon_create_rig(weapon_name="WeaponName"):
 	return weapon_grp
 
 
+@rh_maya_general.undo_step("Create Item Rig")
+def create_item_rig(item_name, item_type='Weapon', use_template=False):
+	"""
+	Create the base structure for an item rig from its rig spec
+
+	*Arguments:*
+		* ``item_name`` Name of the item
+
+	*Keyword Arguments:*
+		* ``item_type``    Weapon or Vehicle
+		* ``use_template`` Import the cached rig template instead of compiling the rig spec
+
+	*Returns:*
+		* ``item_node`` PyNode item node or None
+	"""
+
+	spec = rh_maya_rig_spec.get_item_rig_spec(item_type)
+	item_node_name = spec['item_node']
+	if cmds.objExists(item_node_name):
+		try:
+			cmds.lockNode(item_node_name, lock=False)
+			cmds.delete(item_node_name)
+		except:
+			cmds.warning("There is currently a {0} node in the scene that cannot be delete!\n\nThis needs to be removed to continue".format(item_node_name))
+			return None
+
+	if use_template:
+		template_file = get_rig_template_file(item_type)
+		if not os.path.isfile(template_file):
+			created, message = create_rig_template(template_file, item_type=item_type)
+			print message
+		item_node = create_rig_from_template(item_name, template_file, item_type=item_type)
+		if item_node:
+			return item_node
+		cmds.warning("The rig template could not be used, compiling the rig.")
+
+	return rh_maya_rig_spec.compile_item_rig(spec, item_name)
+
+
+def get_rig_template_file(item_type="Weapon", version=RIG_TEMPLATE_VERSION):
+	"""
+	Get the cached rig template file for an item type.
+	Templates live in RH_RIG_TEMPLATE_PATH, or the Maya user app dir.
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``item_type`` Item type of the rig
+		* ``version``   Template version
+
+	*Returns:*
+		* ``template_file`` Path to the .ma template
+	"""
+
+	template_dir = os.environ.get("RH_RIG_TEMPLATE_PATH")
+	if not template_dir:
+		template_dir = os.path.join(cmds.internalVar(userAppDir=True), "rh_item_rigger", "templates")
+	template_name = "{0}_rig_template_v{1}.ma".format(item_type.lower(), version)
+	return os.path.join(template_dir, template_name).replace("\\", "/")
+
+
+def save_rig_template(template_file, item_type="Weapon"):
+	"""
+	Compile the item rig in the current, empty, scene and export it as a rig template
+
+	*Arguments:*
+		* ``template_file`` .ma file to write
+
+	*Keyword Arguments:*
+		* ``item_type`` Item type of the rig
+
+	*Returns:*
+		* ``Bool`` If the template was written
+	"""
+
+	default_nodes = ["persp", "top", "front", "side"]
+	spec = rh_maya_rig_spec.get_item_rig_spec(item_type)
+	if not rh_maya_rig_spec.compile_item_rig(spec, RIG_TEMPLATE_ITEM_NAME):
+		return False
+
+	template_dir = os.path.dirname(template_file)
+	if not os.path.isdir(template_dir):
+		os.makedirs(template_dir)
+
+	# export the rig nodes only, so script nodes and scene settings are not imported with the template
+	nodes = [node for node in cmds.ls(assemblies=True) if not node in default_nodes]
+	cmds.select(nodes, r=True)
+	cmds.select([layer_name for layer_name, members in spec.get("layers", [])], add=True, noExpand=True)
+	cmds.file(template_file, exportSelected=True, type="mayaAscii", force=True, preserveReferences=False,
+	          constructionHistory=True, channels=True, constraints=True, expressions=True, shader=False)
+	cmds.select(cl=True)
+	return os.path.isfile(template_file)
+
+
+def create_rig_template(template_file=None, item_type="Weapon"):
+	"""
+	Write the rig template from a mayapy process, the open scene is not touched
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``template_file`` .ma file to write, the current version template if not given
+		* ``item_type``     Item type of the rig
+
+	*Returns:*
+		* ``Bool``    If the template was written
+		* ``message`` Template file or error message
+	"""
+
+	# imported here, the export module imports this one
+	import rh_maya_export
+
+	if not template_file:
+		template_file = get_rig_template_file(item_type)
+
+	mayapy = rh_maya_export.get_mayapy_path()
+	if not mayapy:
+		return False, "mayapy was not found, the rig template was not created: {0}".format(template_file)
+
+	module_path = os.path.dirname(os.path.abspath(__file__)).replace("\\", "/")
+	code = "import sys; sys.path.insert(0, {0!r}); import maya.standalone; maya.standalone.initialize(name='python'); " \
+	       "import rh_maya_rigging; rh_maya_rigging.save_rig_template({1!r}, {2!r})".format(module_path, template_file, item_type)
+	process = subprocess.Popen([mayapy, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+	output = process.communicate()[0]
+	if process.returncode or not os.path.isfile(template_file):
+		return False, "Failed to create the rig template: {0}\n{1}".format(template_file, output)
+
+	return True, "Created the rig template: {0}".format(template_file)
+
+
+@rh_maya_general.undo_step("Create Rig From Template")
+def create_rig_from_template(weapon_name, template_file, item_type="Weapon"):
+	"""
+	Create the item rig with a single import of the rig template and a rename of the mesh group
+
+	*Arguments:*
+		* ``weapon_name``   Name of the item
+		* ``template_file`` Rig template .ma file
+
+	*Keyword Arguments:*
+		* ``item_type`` Item type of the rig
+
+	*Returns:*
+		* ``weapon_grp`` PyNode item node or None if the template could not be used
+	"""
+
+	if not os.path.isfile(template_file):
+		return None
+
+	spec = rh_maya_rig_spec.get_item_rig_spec(item_type)
+	item_node_name = spec["item_node"]
+	program_nodes = rh_maya_rig_spec.get_rig_spec_program(spec, RIG_TEMPLATE_ITEM_NAME)[0]
+	template_nodes = [node["name"] for node in program_nodes if not node.get("extend")]
+
+	# imported nodes would be renamed on a clash and the rig is found by name
+	clashes = [node for node in template_nodes if cmds.objExists(node)]
+	if clashes:
+		cmds.warning("Nodes from the rig template already exist in the scene: {0}".format(", ".join(clashes)))
+		return None
+
+	for layer, members in spec.get("layers", []):
+		if cmds.objExists(layer):
+			cmds.lockNode(layer, lock=False)
+			cmds.delete(layer)
+
+	new_nodes = cmds.file(template_file, i=True, type="mayaAscii", ignoreVersion=True, defaultNamespace=True,
+	                      preserveReferences=True, returnNewNodes=True) or []
+
+	missing = [node for node in template_nodes if not cmds.objExists(node)]
+	if missing:
+		cmds.warning("The rig template is missing nodes: {0}".format(", ".join(missing)))
+		new_nodes = [node for node in new_nodes if cmds.objExists(node)]
+		if new_nodes:
+			cmds.lockNode(new_nodes, lock=False)
+			cmds.delete(new_nodes)
+		return None
+
+	template_mesh_grp = "MESH_" + RIG_TEMPLATE_ITEM_NAME
+	if cmds.objExists(template_mesh_grp):
+		cmds.lockNode(item_node_name, lock=False)
+		cmds.lockNode(template_mesh_grp, lock=False)
+		mesh_grp = cmds.rename(template_mesh_grp, "MESH_" + weapon_name)
+		cmds.lockNode(mesh_grp, lock=True)
+		cmds.lockNode(item_node_name, lock=True)
+
+	return pymel.PyNode(item_node_name)
+
+
+def benchmark_create_rig(iterations=3, template_file=None):
+	"""
+	Time building the weapon rig node by node against compiling the rig spec and importing the rig template,
+	along with the commands each path runs.
+	Each run starts from a new scene, so the current scene must be saved first.
+
+	*Arguments:*
+		* ``None`` 
+
+	*Keyword Arguments:*
+		* ``iterations``    Runs per path
+		* ``template_file`` Rig template, the current version template if not given
+
+	*Returns:*
+		* ``timings`` Dict of path name to list of seconds, or None if the benchmark could not run,
+		  the command counts are under "<path>_commands"
+	"""
+
+	if cmds.file(q=True, modified=True):
+		cmds.warning("Save or discard the scene changes before benchmarking, the scene is cleared between runs.")
+		return None
+
+	if not template_file:
+		template_file = get_rig_template_file()
+	if not os.path.isfile(template_file):
+		created, message = create_rig_template(template_file)
+		if not created:
+			cmds.warning(message)
+			return None
+
+	paths = ["build", "compile", "template"]
+	timings = dict([(path, []) for path in paths] + [(path + "_commands", []) for path in paths])
+	for index in xrange(iterations):
+		for path in paths:
+			cmds.file(new=True, force=True)
+			start_time = time.time()
+			if path == "template":
+				create_rig_from_template("BenchmarkItem", template_file)
+			elif path == "compile":
+				create_item_rig("BenchmarkItem")
+			else:
+				weapon_create_rig("BenchmarkItem")
+			timings[path].append(time.time() - start_time)
+			undo_stats = rh_maya_general.get_undo_chunk_stats()
+			timings[path + "_commands"].append(undo_stats[-1]["commands_run"] if undo_stats else 0)
+
+	cmds.file(new=True, force=True)
+	for path in paths:
+		values = timings[path]
+		print "Create Rig {0}: average {1:.3f}s, best {2:.3f}s, {4} commands over {3} runs".format(path, sum(values) / len(values), min(values), len(values), max(timings[path + "_commands"]))
 
+	return timings
@@ -0,0 +1,619 @@
+"""
+Skin Weight Methods for use in Maya
+
+Snapshots skin weights as influence names plus a dense float32 weight matrix,
+so meshes can be rebound or replaced without losing painted weights.
+Weights are read and written in bulk through MFnSkinCluster.
+
+License: GNU General Public License v3.0
+"""
+
+import os
+import tempfile
+from functools import partial
+
+import maya.cmds as cmds
+import maya.OpenMaya as openMaya
+import maya.OpenMayaAnim as openMayaAnim
+import pymel.core as pymel
+
+import rh_maya_general
+
+try:
+	import numpy
+except:
+	numpy = None
+
+
+SKIN_WEIGHTS_DIR = os.path.join(tempfile.gettempdir(), 'rh_skin_weights')
+SKIN_WEIGHTS_EXT = '.npz'
+SKIN_MAX_INFLUENCES = 4
+
+
+def _get_dag_path(node):
+	"""
+	Get the MDagPath for a node name
+
+	*Arguments:*
+		* ``node`` Node name
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``MDagPath`` Path to the node
+	"""
+
+	sel_list = openMaya.MSelectionList()
+	sel_list.add(str(node))
+	dag_path = openMaya.MDagPath()
+	sel_list.getDagPath(0, dag_path)
+	return dag_path
+
+
+def _get_mesh_shape(mesh):
+	"""
+	Get the deformed, (non intermediate), shape of a mesh transform
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``shape`` Long name of the shape or None
+	"""
+
+	shapes = cmds.listRelatives(str(mesh), shapes=True, noIntermediate=True, fullPath=True, type='mesh')
+	if shapes:
+		return shapes[0]
+	return None
+
+
+def _get_vertex_components(num_vertices):
+	"""
+	Create a complete vertex component for bulk weight queries
+
+	*Arguments:*
+		* ``num_vertices`` Number of vertices on the mesh
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``MObject`` Vertex component
+	"""
+
+	fn_component = openMaya.MFnSingleIndexedComponent()
+	components = fn_component.create(openMaya.MFn.kMeshVertComponent)
+	fn_component.setCompleteData(num_vertices)
+	return components
+
+
+def _get_world_positions(dag_path):
+	"""
+	Get the world space vertex positions of a mesh
+
+	*Arguments:*
+		* ``dag_path`` MDagPath of the mesh shape
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``positions`` Vertex positions, (num vertices x 3), float32 array if numpy is available
+	"""
+
+	points = openMaya.MPointArray()
+	openMaya.MFnMesh(dag_path).getPoints(points, openMaya.MSpace.kWorld)
+	positions = [(points[index].x, points[index].y, points[index].z) for index in xrange(points.length())]
+	if numpy:
+		return numpy.array(positions, dtype=numpy.float32).reshape(-1, 3)
+	return positions
+
+
+def get_mesh_skincluster(mesh):
+	"""
+	Get the skincluster deforming a mesh
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``skincluster`` Skincluster name or None
+	"""
+
+	history = cmds.listHistory(str(mesh), pruneDagObjects=True) or []
+	skinclusters = cmds.ls(history, type='skinCluster')
+	if skinclusters:
+		return skinclusters[0]
+	return None
+
+
+def get_mesh_skin_weights(mesh, skincluster=None):
+	"""
+	Snapshot the skin weights of a mesh in one bulk query
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``skincluster`` Skincluster on the mesh, found from the history if not given
+
+	*Returns:*
+		* ``snapshot`` Dictionary or None if the mesh is not skinned
+			* ``mesh``           Mesh name
+			* ``influences``     Influence names, one per weight column
+			* ``weights``        Weights, (num vertices x num influences), float32 array if numpy is available
+			* ``positions``      World space vertex positions, used to match vertices when topology changes
+			* ``max_influences`` Max influences setting of the skincluster
+	"""
+
+	if not skincluster:
+		skincluster = get_mesh_skincluster(mesh)
+	shape = _get_mesh_shape(mesh)
+	if not skincluster or not shape:
+		return None
+
+	sel_list = openMaya.MSelectionList()
+	sel_list.add(skincluster)
+	skin_obj = openMaya.MObject()
+	sel_list.getDependNode(0, skin_obj)
+	fn_skin = openMayaAnim.MFnSkinCluster(skin_obj)
+
+	influence_paths = openMaya.MDagPathArray()
+	fn_skin.influenceObjects(influence_paths)
+	influences = [influence_paths[index].partialPathName() for index in xrange(influence_paths.length())]
+
+	shape_path = _get_dag_path(shape)
+	num_vertices = openMaya.MFnMesh(shape_path).numVertices()
+	components = _get_vertex_components(num_vertices)
+
+	weights = openMaya.MDoubleArray()
+	util = openMaya.MScriptUtil()
+	util.createFromInt(0)
+	fn_skin.getWeights(shape_path, components, weights, util.asUintPtr())
+
+	num_influences = len(influences)
+	values = [weights[index] for index in xrange(weights.length())]
+	if numpy:
+		values = numpy.array(values, dtype=numpy.float32).reshape(num_vertices, num_influences)
+	else:
+		values = [values[index:index + num_influences] for index in xrange(0, len(values), num_influences)]
+
+	snapshot = {}
+	snapshot['mesh'] = str(mesh).split('|')[-1]
+	snapshot['influences'] = influences
+	snapshot['weights'] = values
+	snapshot['positions'] = _get_world_positions(shape_path)
+	snapshot['max_influences'] = cmds.getAttr(skincluster + '.maxInfluences')
+	return snapshot
+
+
+def save_skin_weights(snapshot, weight_file):
+	"""
+	Write a weight snapshot to a compressed numpy file
+
+	*Arguments:*
+		* ``snapshot``    Result of get_mesh_skin_weights
+		* ``weight_file`` .npz file to write
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``Bool``    If the file was written
+		* ``message`` Written file or error message
+	"""
+
+	if not numpy:
+		return False, 'Numpy is not available, skin weights can not be saved: {0}'.format(weight_file)
+
+	weight_dir = os.path.dirname(weight_file)
+	if weight_dir and not os.path.isdir(weight_dir):
+		os.makedirs(weight_dir)
+
+	try:
+		numpy.savez_compressed(weight_file,
+		                       mesh=numpy.array(snapshot['mesh']),
+		                       influences=numpy.array(snapshot['influences']),
+		                       weights=numpy.asarray(snapshot['weights'], dtype=numpy.float32),
+		                       positions=numpy.asarray(snapshot['positions'], dtype=numpy.float32),
+		                       max_influences=numpy.array(snapshot['max_influences']))
+	except Exception as e:
+		return False, 'Failed to write skin weights: {0}\n{1}'.format(weight_file, e)
+
+	return True, weight_file
+
+
+def load_skin_weights(weight_file):
+	"""
+	Read a weight snapshot written with save_skin_weights
+
+	*Arguments:*
+		* ``weight_file`` .npz file to read
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``snapshot`` Weight snapshot or None
+	"""
+
+	if not numpy or not os.path.isfile(weight_file):
+		return None
+
+	data = numpy.load(weight_file)
+	try:
+		snapshot = {}
+		snapshot['mesh'] = str(data['mesh'])
+		snapshot['influences'] = [str(name) for name in data['influences']]
+		snapshot['weights'] = data['weights']
+		snapshot['positions'] = data['positions']
+		snapshot['max_influences'] = int(data['max_influences'])
+	finally:
+		data.close()
+	return snapshot
+
+
+def get_skin_weights_file(mesh):
+	"""
+	Get the cache file for a mesh weight snapshot, keyed by the node uuid so renames are safe
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``weight_file`` .npz file path
+	"""
+
+	try:
+		key = cmds.ls(str(mesh), uuid=True)[0]
+	except:
+		key = str(mesh).split('|')[-1]
+	return os.path.join(SKIN_WEIGHTS_DIR, key.replace(':', '_') + SKIN_WEIGHTS_EXT)
+
+
+def cache_skin_weights(mesh):
+	"""
+	Snapshot the skin weights of a mesh and write them to the weight cache
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``snapshot`` Weight snapshot or None if the mesh is not skinned
+	"""
+
+	snapshot = get_mesh_skin_weights(mesh)
+	if snapshot:
+		saved, message = save_skin_weights(snapshot, get_skin_weights_file(mesh))
+		if not saved:
+			print message
+	return snapshot
+
+
+def get_cached_skin_weights(mesh):
+	"""
+	Load the cached weight snapshot of a mesh
+
+	*Arguments:*
+		* ``mesh`` Mesh transform
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``snapshot`` Weight snapshot or None
+	"""
+
+	return load_skin_weights(get_skin_weights_file(mesh))
+
+
+def get_vertex_map(source_positions, target_positions):
+	"""
+	Match every target vertex to the nearest source vertex with a kd-tree of the source vertices.
+	Targets outside the source bounds are clamped onto the bounds first,
+	so a far away vertex searches like a vertex on the surface instead of visiting the whole tree.
+
+	*Arguments:*
+		* ``source_positions`` Source vertex positions
+		* ``target_positions`` Target vertex positions
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``vertex_map`` Source vertex index for each target vertex
+	"""
+
+	source_positions = [tuple(float(value) for value in position) for position in source_positions]
+	target_positions = [tuple(float(value) for value in position) for position in target_positions]
+	if not source_positions:
+		return []
+
+	mins = [min(position[axis] for position in source_positions) for axis in xrange(3)]
+	maxs = [max(position[axis] for position in source_positions) for axis in xrange(3)]
+	tree = rh_maya_general.create_kd_tree(source_positions)
+
+	vertex_map = []
+	for position in target_positions:
+		position = tuple(min(max(position[axis], mins[axis]), maxs[axis]) for axis in xrange(3))
+		nearest = rh_maya_general.get_kd_tree_nearest(tree, source_positions, position)
+		vertex_map.append(nearest[0][1])
+
+	return vertex_map
+
+
+def _get_scene_influence(name):
+	"""
+	Find an influence from a snapshot in the scene, by its path then by its short name
+
+	*Arguments:*
+		* ``name`` Influence name from a snapshot
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``influence`` Long name of the influence or None
+	"""
+
+	found = cmds.ls(name, long=True)
+	if len(found) != 1:
+		found = cmds.ls(name.split('|')[-1], long=True, type='joint')
+	if len(found) == 1:
+		return found[0]
+	return None
+
+
+def _set_skin_cluster_weights(skincluster, shape, influence_indices, weights, previous):
+	"""
+	Set all the weights of a skincluster shape in bulk, the replaced weights are kept in previous
+
+	*Arguments:*
+		* ``skincluster``       Skincluster name
+		* ``shape``             Long name of the deformed shape
+		* ``influence_indices`` MIntArray of the influence indices in the weights
+		* ``weights``           MDoubleArray of the weights, vertex by vertex
+		* ``previous``          Dict the replaced weights are stored in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	sel_list = openMaya.MSelectionList()
+	sel_list.add(skincluster)
+	skin_obj = openMaya.MObject()
+	sel_list.getDependNode(0, skin_obj)
+	fn_skin = openMayaAnim.MFnSkinCluster(skin_obj)
+
+	shape_path = _get_dag_path(shape)
+	components = _get_vertex_components(openMaya.MFnMesh(shape_path).numVertices())
+	old_weights = openMaya.MDoubleArray()
+	fn_skin.setWeights(shape_path, components, influence_indices, weights, False, old_weights)
+	previous['weights'] = old_weights
+
+
+def _restore_skin_cluster_weights(skincluster, shape, influence_indices, previous):
+	"""
+	Put back the weights replaced by _set_skin_cluster_weights
+
+	*Arguments:*
+		* ``skincluster``       Skincluster name
+		* ``shape``             Long name of the deformed shape
+		* ``influence_indices`` MIntArray of the influence indices in the weights
+		* ``previous``          Dict the replaced weights were stored in
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``None``
+	"""
+
+	if 'weights' in previous:
+		_set_skin_cluster_weights(skincluster, shape, influence_indices, previous.pop('weights'), {})
+
+
+def set_mesh_skin_weights(mesh, snapshot, skincluster=None):
+	"""
+	Restore a weight snapshot onto a mesh with one bulk MFnSkinCluster.setWeights call.
+	The mesh is bound to the snapshot influences if it is not skinned, missing influences are added.
+	When the vertex count differs from the snapshot, vertices are matched by world position.
+
+	The bulk write runs as one undoable command, undo puts the previous weights back.
+
+	*Arguments:*
+		* ``mesh``     Mesh transform
+		* ``snapshot`` Weight snapshot from get_mesh_skin_weights or load_skin_weights
+
+	*Keyword Arguments:*
+		* ``skincluster`` Skincluster on the mesh, found from the history if not given
+
+	*Returns:*
+		* ``Bool``    If the weights were restored
+		* ``message`` Status or error message
+	"""
+
+	mesh = str(mesh)
+	shape = _get_mesh_shape(mesh)
+	if not shape:
+		return False, 'Could not find a mesh shape to restore skin weights on: {0}'.format(mesh)
+
+	# influences from the snapshot that still exist
+	columns = []
+	scene_influences = []
+	for column, name in enumerate(snapshot['influences']):
+		influence = _get_scene_influence(name)
+		if influence and not influence in scene_influences:
+			columns.append(column)
+			scene_influences.append(influence)
+	if not scene_influences:
+		return False, 'None of the skin influences exist in the scene: {0}'.format(mesh)
+
+	if not skincluster:
+		skincluster = get_mesh_skincluster(mesh)
+	if not skincluster:
+		cluster_name = mesh.split('|')[-1] + '_skinCluster'
+		max_influences = snapshot.get('max_influences') or SKIN_MAX_INFLUENCES
+		skincluster = cmds.skinCluster(scene_influences, mesh, toSelectedBones=True, skinMethod=0, bindMethod=0,
+		                               maximumInfluences=max_influences, name=cluster_name)[0]
+	else:
+		current = cmds.ls(cmds.skinCluster(skincluster, q=True, influence=True) or [], long=True)
+		for influence in scene_influences:
+			if not influence in current:
+				cmds.skinCluster(skincluster, e=True, addInfluence=influence, weight=0.0)
+
+	sel_list = openMaya.MSelectionList()
+	sel_list.add(skincluster)
+	skin_obj = openMaya.MObject()
+	sel_list.getDependNode(0, skin_obj)
+	fn_skin = openMayaAnim.MFnSkinCluster(skin_obj)
+
+	influence_paths = openMaya.MDagPathArray()
+	fn_skin.influenceObjects(influence_paths)
+	cluster_influences = [influence_paths[index].fullPathName() for index in xrange(influence_paths.length())]
+	cluster_columns = [cluster_influences.index(influence) for influence in scene_influences]
+	num_influences = len(cluster_influences)
+
+	shape_path = _get_dag_path(shape)
+	num_vertices = openMaya.MFnMesh(shape_path).numVertices()
+	weights = snapshot['weights']
+
+	if num_vertices == len(weights):
+		vertex_map = range(num_vertices)
+		matched = 'by index'
+	else:
+		vertex_map = get_vertex_map(snapshot['positions'], _get_world_positions(shape_path))
+		matched = 'by position'
+
+	# reorder the snapshot columns to the skincluster influence order and renormalize dropped weights
+	if numpy:
+		source = numpy.asarray(weights, dtype=numpy.float32)[numpy.array(vertex_map, dtype=numpy.int64)][:, columns]
+		values = numpy.zeros((num_vertices, num_influences), dtype=numpy.float64)
+		values[:, cluster_columns] = source
+		totals = values.sum(axis=1)
+		totals[totals == 0.0] = 1.0
+		values /= totals[:, None]
+		values = values.ravel().tolist()
+	else:
+		values = []
+		for source_index in vertex_map:
+			row = [0.0] * num_influences
+			source_row = weights[source_index]
+			for column, cluster_column in zip(columns, cluster_columns):
+				row[cluster_column] = float(source_row[column])
+			total = sum(row) or 1.0
+			values.extend([value / total for value in row])
+
+	util = openMaya.MScriptUtil()
+	util.createFromList(values, len(values))
+	weight_array = openMaya.MDoubleArray(util.asDoublePtr(), len(values))
+	influence_indices = openMaya.MIntArray()
+	for index in xrange(num_influences):
+		influence_indices.append(index)
+
+	# setWeights is not on the undo queue by itself, nodes keep their names over undo and redo
+	previous = {}
+	rh_maya_general.do_undoable([(partial(_set_skin_cluster_weights, skincluster, shape, influence_indices, weight_array, previous),
+	                              partial(_restore_skin_cluster_weights, skincluster, shape, influence_indices, previous))])
+
+	return True, 'Restored skin weights {0} on: {1}'.format(matched, mesh)
+
+
+def replace_mesh(mesh, new_mesh):
+	"""
+	Replace the geometry of a mesh with a new mesh, keeping the original transform,
+	its attributes and connections, and restoring the skin weights onto the new geometry.
+	The new mesh transform is deleted. Every edit is on the undo queue, so an undo chunk reverts the whole replace.
+
+	*Arguments:*
+		* ``mesh``     Original mesh transform
+		* ``new_mesh`` Mesh transform with the new geometry
+
+	*Keyword Arguments:*
+		* ``None``
+
+	*Returns:*
+		* ``Bool``    If the mesh was replaced
+		* ``message`` Status or error message
+	"""
+
+	mesh = pymel.PyNode(mesh)
+	new_mesh = pymel.PyNode(new_mesh)
+	old_shapes = cmds.listRelatives(mesh.longName(), shapes=True, fullPath=True) or []
+	old_shape = _get_mesh_shape(mesh.longName())
+	new_shape = _get_mesh_shape(new_mesh.longName())
+	if not old_shape or not new_shape:
+		return False, 'Select the original mesh then the new mesh to replace it with.'
+
+	shape_name = old_shape.split('|')[-1]
+	snapshot = get_mesh_skin_weights(mesh.longName())
+
+	# the old shapes are replaced, restore the lock state of the transform when done
+	mesh_locked = cmds.lockNode(mesh.longName(), q=True, lock=True)[0]
+	for node in [mesh.longName()] + old_shapes:
+		cmds.lockNode(node, lock=False)
+
+	try:
+		# remove the skincluster, the original transform stays in place
+		cmds.delete(mesh.longName(), constructionHistory=True)
+
+		# duplicate the new geometry under the original transform and freeze it into its space,
+		# then move the shape over, the commands keep the whole replace on the undo queue
+		duplicate = pymel.duplicate(new_mesh, returnRootsOnly=True)[0]
+		duplicate_shape = pymel.PyNode(_get_mesh_shape(duplicate.longName()))
+		pymel.lockNode([duplicate] + duplicate.getChildren(), lock=False)
+		pymel.delete(duplicate, constructionHistory=True)
+		pymel.delete([child for child in duplicate.getChildren() if not child == duplicate_shape])
+		for attr in ['tx', 'ty', 'tz', 'rx', 'ry', 'rz', 'sx', 'sy', 'sz']:
+			duplicate.setAttr(attr, lock=False)
+		pymel.parent(duplicate, mesh)
+		pymel.makeIdentity(duplicate, apply=True, translate=True, rotate=True, scale=True, normal=0)
+		pymel.parent(duplicate_shape, mesh, shape=True, relative=True)
+		pymel.delete(duplicate)
+		replaced_shape = duplicate_shape.longName()
+		cmds.delete(replaced_shape, constructionHistory=True)
+
+		# shading from the new mesh, face indices match the copied geometry
+		shading_groups = list(set(cmds.listConnections(new_shape, type='shadingEngine') or []))
+		new_names = [new_shape, new_mesh.longName()]
+		for shading_group in shading_groups:
+			for member in cmds.sets(shading_group, q=True) or []:
+				member_obj = cmds.ls(member, objectsOnly=True, long=True)
+				if not member_obj or not member_obj[0] in new_names:
+					continue
+				if '.' in member:
+					cmds.sets(replaced_shape + '.' + member.split('.', 1)[-1], e=True, forceElement=shading_group)
+				else:
+					cmds.sets(replaced_shape, e=True, forceElement=shading_group)
+
+		old_shapes = [shape for shape in old_shapes if cmds.objExists(shape)]
+		if old_shapes:
+			cmds.delete(old_shapes)
+		cmds.delete(new_mesh.longName())
+		cmds.rename(replaced_shape, shape_name)
+
+		if not snapshot:
+			return True, 'Replaced the mesh, it was not skinned: {0}'.format(mesh.nodeName())
+
+		restored, message = set_mesh_skin_weights(mesh.longName(), snapshot)
+		if not restored:
+			return False, message
+		return True, 'Replaced the mesh: {0}\n{1}'.format(mesh.nodeName(), message)
+	finally:
+		cmds.lockNode(mesh.longName(), lock=mesh_locked)
@@ -0,0 +1,66 @@
+"""
+Undoable Command Plugin for use in Maya
+
+API modifiers, plug locks and API created shapes are not on the undo queue.
+The rhUndoable command runs queued (do, undo) operations and keeps them,
+so one undo entry reverses all of them and redo runs them again.
+Run operations through rh_maya_general.do_undoable, it loads this plugin.
+
+License: GNU General Public License v3.0
+"""
+
+import maya.OpenMayaMPx as openMayaMPx
+
+
+UNDO_COMMAND_NAME = 'rhUndoable'
+
+# operations for the next commands, each entry is a list of (do, undo) callables
+UNDO_OPERATIONS = []
+
+
+class UndoableCommand(openMayaMPx.MPxCommand):
+	"""
+	Run the next queued operations, undo runs their undo callables in reverse
+	"""
+
+	def __init__(self):
+		openMayaMPx.MPxCommand.__init__(self)
+		self.operations = []
+
+	def isUndoable(self):
+		return bool(self.operations)
+
+	def doIt(self, args):
+		if UNDO_OPERATIONS:
+			self.operations = UNDO_OPERATIONS.pop(0)
+		self.redoIt()
+
+	def redoIt(self):
+		# a failed operation is taken back with the ones before it, nothing is left half done,
+		# so undo callables have to handle a partly done operation
+		done = []
+		try:
+			for do, undo in self.operations:
+				done.append(undo)
+				do()
+		except:
+			for undo in reversed(done):
+				undo()
+			self.operations = []
+			raise
+
+	def undoIt(self):
+		for do, undo in reversed(self.operations):
+			undo()
+
+
+def create_undoable_command():
+	return openMayaMPx.asMPxPtr(UndoableCommand())
+
+
+def initializePlugin(plugin):
+	openMayaMPx.MFnPlugin(plugin, 'RH_ItemRigger', '1.0').registerCommand(UNDO_COMMAND_NAME, create_undoable_command)
+
+
+def uninitializePlugin(plugin):
+	openMayaMPx.MFnPlugin(plugin).deregisterCommand(UNDO_COMMAND_NAME)